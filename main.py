@@ -12,7 +12,7 @@ from pathlib import Path
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, BinaryIO, Union, IO, Iterable
 import hashlib
 import secrets
 import uuid
@@ -22,6 +22,25 @@ import time
 import threading
 import pickle
 import hashlib
+import sqlite3
+import shutil
+import mmap
+import urllib.parse
+import csv
+import gzip
+import atexit
+import contextlib
+import bisect
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, Counter
+from collections.abc import MutableMapping
+
+try:
+    import fcntl
+except ImportError:  # Windows: sessions in one process still lock each other
+    fcntl = None
 
 # Configure page
 st.set_page_config(
@@ -330,6 +349,1997 @@ REPORTS_FILE = Path("reports.json")
 WORKFLOWS_FILE = Path("workflows.json")
 KNOWLEDGE_BASE_FILE = Path("knowledge_base.json")
 INTEGRATIONS_FILE = Path("integrations.json")
+TEAM_STATS_FILE = Path("team_stats.json")
+TEAM_ACTIVITY_FILE = Path("team_activity.json")
+ASSIGNER_INDEX_FILE = Path("assigner_index.json")
+SEARCH_INDEX_FILE = Path("search_index.json")
+USER_INDEX_FILE = Path("user_index.json")
+TASK_ARCHIVE_DUE_FILE = Path("task_archive_due.json")
+
+# Storage backend: "json" keeps one JSON file per store, "sqlite" keeps every
+# store in a single WAL-mode database with one row per record
+STORAGE_BACKEND = os.environ.get("NAFUP_STORAGE_BACKEND", "json").strip().lower()
+SQLITE_DB_FILE = Path(os.environ.get("NAFUP_SQLITE_DB", "nafup.db"))
+
+if STORAGE_BACKEND not in ("json", "sqlite"):
+    raise ValueError(f"Unknown storage backend '{STORAGE_BACKEND}' (expected 'json' or 'sqlite')")
+
+# Content-addressed blob storage for uploaded file payloads
+BLOB_DIR = Path(os.environ.get("NAFUP_BLOB_DIR", "blobs"))
+BLOB_CHUNK_SIZE = 1024 * 1024
+PRIVATE_FILES_DIR = Path(os.environ.get("NAFUP_PRIVATE_FILES_DIR", "private_file_blobs"))
+
+# Log-structured stores are compacted once a partition has at least this many
+# events and more than this share of them are superseded edits or deletes
+LOG_COMPACT_MIN_EVENTS = int(os.environ.get("NAFUP_LOG_COMPACT_MIN_EVENTS", "500"))
+LOG_COMPACT_GARBAGE_RATIO = 0.5
+LOG_TAIL_BLOCK_SIZE = 64 * 1024
+
+# Counter logs are folded into their snapshot once they reach this many lines
+COUNTER_FOLD_EVENTS = int(os.environ.get("NAFUP_COUNTER_FOLD_EVENTS", "1000"))
+
+# Background job queue (notification fan-out and other deferred work)
+JOB_QUEUE_DB_FILE = Path(os.environ.get("NAFUP_JOB_QUEUE_DB", "jobs.db"))
+JOB_LEASE_SECONDS = 60
+JOB_MAX_ATTEMPTS = 8
+JOB_POLL_INTERVAL = 1.0
+
+# Stored unread-notification counters are recounted this often (seconds)
+NOTIFICATION_RECONCILE_SECONDS = int(os.environ.get("NAFUP_NOTIFICATION_RECONCILE_SECONDS", "3600"))
+
+# Notification retention, enforced by a periodic compaction job, and the
+# window in which same-type notifications from one source become a digest
+NOTIFICATION_MAX_AGE_DAYS = int(os.environ.get("NAFUP_NOTIFICATION_MAX_AGE_DAYS", "90"))
+NOTIFICATION_MAX_PER_USER = int(os.environ.get("NAFUP_NOTIFICATION_MAX_PER_USER", "500"))
+NOTIFICATION_COMPACT_SECONDS = int(os.environ.get("NAFUP_NOTIFICATION_COMPACT_SECONDS", "3600"))
+NOTIFICATION_DIGEST_WINDOW_SECONDS = int(os.environ.get("NAFUP_NOTIFICATION_DIGEST_WINDOW_SECONDS", "600"))
+
+# A digest lists the titles of this many of the notifications it folds in
+# (the newest ones)
+NOTIFICATION_DIGEST_ITEMS_KEPT = 10
+
+# Per-company team statistics are rebuilt from the employee files this often
+TEAM_STATS_RECONCILE_SECONDS = int(os.environ.get("NAFUP_TEAM_STATS_RECONCILE_SECONDS", "86400"))
+
+# Threads used to read many user_<name>.json files at once (company-wide scans)
+USER_FILE_LOAD_WORKERS = int(os.environ.get("NAFUP_USER_FILE_LOAD_WORKERS", "16"))
+
+# Loaded versions of a session's own user file kept to merge its saves against
+USER_DATA_BASES_KEPT = 4
+
+# Field-level edits of a user's data are appended to user_<name>.log.jsonl and
+# folded into user_<name>.json once this many have piled up; the folded data
+# of this many users is kept in memory to apply edits to
+USER_LOG_COMPACT_EVENTS = int(os.environ.get("NAFUP_USER_LOG_COMPACT_EVENTS", "200"))
+USER_DATA_STATE_CACHE_SIZE = 256
+
+# Tasks completed this many days ago move to compressed per-user archive
+# segments, checked by a periodic job this often (seconds); the archive is
+# paged into this many tasks at a time and this many decompressed segments
+# are cached
+TASK_ARCHIVE_AGE_DAYS = int(os.environ.get("NAFUP_TASK_ARCHIVE_AGE_DAYS", "30"))
+TASK_ARCHIVE_SECONDS = int(os.environ.get("NAFUP_TASK_ARCHIVE_SECONDS", "3600"))
+TASK_ARCHIVE_SEGMENT_SIZE = 500
+TASK_ARCHIVE_PAGE_SIZE = 50
+TASK_ARCHIVE_SEGMENT_CACHE_SIZE = 64
+
+# Full-text search ranking (BM25) and how many vocabulary terms a query term
+# may expand to as a prefix ("deplo" -> "deploy", "deployment", ...)
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
+SEARCH_PREFIX_EXPANSIONS = 50
+SEARCH_PAGE_SIZE = 20
+
+# Minimum trigram similarity (0-1) for a typo-tolerant name match
+SEARCH_FUZZY_THRESHOLD = float(os.environ.get("NAFUP_SEARCH_FUZZY_THRESHOLD", "0.3"))
+
+# Blocked words for content moderation unless a company sets its own list
+# ("word*" also blocks longer words starting with "word")
+DEFAULT_MODERATION_WORDS = [
+    "fuck*", "shit*", "bitch*", "ass", "dick", "pussy", "cock", "cunt*", "whore*", "slut*",
+    "nigger*", "faggot*", "retard", "retarded", "idiot*", "stupid", "dumb", "moron*"
+]
+MODERATION_AUTOMATON_CACHE_SIZE = 256
+
+# Upper bound for the in-memory JSON store read cache
+STORE_CACHE_MAX_BYTES = int(os.environ.get("NAFUP_STORE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Write durability: "always" fsyncs every write before it returns, "batched"
+# fsyncs each write batch without making callers wait, "never" leaves it to
+# the OS. Saves to the same whole-file JSON store within this many
+# milliseconds are written once (0 writes every save immediately).
+STORE_FSYNC = os.environ.get("NAFUP_STORE_FSYNC", "batched").strip().lower()
+STORE_GROUP_COMMIT_MS = int(os.environ.get("NAFUP_STORE_GROUP_COMMIT_MS", "5"))
+
+if STORE_FSYNC not in ("always", "batched", "never"):
+    raise ValueError(f"Unknown fsync policy '{STORE_FSYNC}' (expected 'always', 'batched' or 'never')")
+
+# -------------------------------------------------------------
+# Storage Layer
+# -------------------------------------------------------------
+# Every store (auth.json, chat_messages.json, polls.json, ...) is a mapping of
+# partition key (username, company code, task id, chat pair key) to either a
+# list of records with an "id" or a single dict. The store_* functions below
+# are the only way the rest of the app touches that data; they dispatch to the
+# selected backend so callers only read and write the partition or record
+# they actually need.
+
+def _use_sqlite() -> bool:
+    """Check whether the SQLite backend is selected."""
+    return STORAGE_BACKEND == "sqlite"
+
+# Files are never rewritten in place: _atomic_write_text writes a temp file
+# next to the target and os.replace()s it over the target, so a crash or a
+# concurrent reader sees either the old or the new contents, never a
+# truncated file. Unless STORE_FSYNC is "never" the temp file is fsynced
+# before the rename; under "always" the directory is fsynced after it too, so
+# the rename itself survives a power loss.
+
+def _sync_file(f: IO):
+    """Flush a file being written to disk according to STORE_FSYNC."""
+    f.flush()
+    if STORE_FSYNC != "never":
+        os.fsync(f.fileno())
+
+def _sync_dir(directory: Path):
+    """Make renames in a directory durable under STORE_FSYNC=always."""
+    if STORE_FSYNC != "always" or os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_temp_file(target: Path, text: str) -> Path:
+    """Write text to a new temp file next to target and sync it."""
+    tmp_file = target.with_name(f"{target.name}.{uuid.uuid4().hex}.tmp")
+    with tmp_file.open("w", encoding="utf-8") as f:
+        f.write(text)
+        _sync_file(f)
+    return tmp_file
+
+def _replace_file(tmp_file: Path, target: Path):
+    """Move a synced temp file over its target."""
+    os.replace(tmp_file, target)
+    _sync_dir(target.parent)
+
+def _atomic_write_text(target: Path, text: str):
+    """Replace a file's contents atomically."""
+    _replace_file(_write_temp_file(target, text), target)
+
+def write_json_file(path: Path, data: Any):
+    """Replace a JSON file (user data, sessions, ...) atomically."""
+    _atomic_write_text(path, json.dumps(data, indent=2, ensure_ascii=False))
+
+# Read-modify-write cycles on a store run under _store_lock(path): a
+# re-entrant per-path lock for the sessions (threads) of this process plus an
+# exclusive fcntl.flock on "<file>.lock" for other worker processes serving
+# the same directory. The flock is taken by the outermost holder only and is
+# advisory, so it orders writers that go through this module and nothing else.
+#
+# Under the JSON backend it covers every write path: whole-file and
+# partitioned stores (locked per file), log-structured stores and counter
+# logs (appends, record updates and deletes, compaction and folds, locked
+# per partition log), user data parts, team statistics recounts and
+# registration (the user index's lock). Under SQLite the store_* writes rely
+# on SQLite's own transactions and conditional statements instead, while user
+# data files, team statistics recounts and registration still take the lock.
+# What it doesn't cover: group-committed saves are merged per partition
+# across processes (see below), and migrations of a legacy JSON file into
+# log or partition directories rely on an atomic rename instead.
+
+@st.cache_resource
+def _get_store_locks() -> Dict[str, Any]:
+    """Get the process-wide per-path store locks."""
+    return {"locks": {}, "lock": threading.Lock()}
+
+@contextlib.contextmanager
+def _store_lock(path: Path):
+    """Hold a store's lock across sessions and processes."""
+    locks = _get_store_locks()
+    with locks["lock"]:
+        entry = locks["locks"].setdefault(str(path), {"rlock": threading.RLock(), "depth": 0, "file": None})
+    
+    with entry["rlock"]:
+        if entry["depth"] == 0 and fcntl is not None:
+            lock_file = path.with_name(f"{path.name}.lock").open("a")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            except OSError:
+                lock_file.close()
+                raise
+            entry["file"] = lock_file
+        entry["depth"] += 1
+        try:
+            yield
+        finally:
+            entry["depth"] -= 1
+            if entry["depth"] == 0 and entry["file"] is not None:
+                entry["file"].close()  # Closing the file releases the flock
+                entry["file"] = None
+
+# The JSON backend keeps a process-wide read cache so that hot lookups
+# (get_user_info, company info, name lookups while rendering lists) don't
+# re-parse auth.json and friends on every rerun. Streamlit re-executes this
+# module on each rerun, so the cache has to live in st.cache_resource.
+#
+# Entries are keyed by (file path, partition key), with None standing for the
+# whole file, and hold pickled values so every caller gets its own copy to
+# mutate. An entry is valid while the file's (inode, mtime, size, version)
+# stamp is unchanged; writes made through this module bump the version and
+# update the partitions they touched in place. Cold partitions are evicted
+# LRU-first once the cache grows past STORE_CACHE_MAX_BYTES.
+
+_WHOLE_STORE = None
+
+@st.cache_resource
+def _get_store_cache() -> Dict[str, Any]:
+    """Get the process-wide JSON store read cache."""
+    return {
+        "entries": OrderedDict(),  # (path, key) -> [stamp, pickled value]
+        "paths": {},               # path -> set of cached keys
+        "versions": {},            # path -> write counter
+        "disk_stamps": {},         # path -> disk stamp last read or written here
+        "merges": {},              # path -> writes merged with another process's
+        "bytes": 0,
+        "lock": threading.RLock()
+    }
+
+def _json_store_disk_stamp(path: Path) -> Optional[Tuple[int, int, int]]:
+    """Get the (inode, mtime, size) of a store file as it is on disk."""
+    try:
+        stat_result = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+def _json_store_stamp(path: Path) -> Optional[Tuple[int, int, int, int]]:
+    """Get the (inode, mtime, size, version) stamp of a store file."""
+    disk_stamp = _json_store_disk_stamp(path)
+    if disk_stamp is None:
+        return None
+    return disk_stamp + (_get_store_cache()["versions"].get(str(path), 0),)
+
+def _store_cache_drop(cache: Dict[str, Any], cache_key: Tuple[str, Any]):
+    """Remove one entry from the read cache."""
+    entry = cache["entries"].pop(cache_key, None)
+    if entry is not None:
+        cache["bytes"] -= len(entry[1])
+        cache["paths"][cache_key[0]].discard(cache_key[1])
+
+def _store_cache_set(cache: Dict[str, Any], path: Path, key: Any, stamp: Tuple[int, int, int, int], value: Any):
+    """Add or replace one entry in the read cache, evicting cold entries."""
+    cache_key = (str(path), key)
+    blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    _store_cache_drop(cache, cache_key)
+    if len(blob) > STORE_CACHE_MAX_BYTES:
+        return
+    
+    cache["entries"][cache_key] = [stamp, blob]
+    cache["paths"].setdefault(str(path), set()).add(key)
+    cache["bytes"] += len(blob)
+    while cache["bytes"] > STORE_CACHE_MAX_BYTES:
+        _store_cache_drop(cache, next(iter(cache["entries"])))
+
+def _store_cache_get(path: Path, key: Any) -> Tuple[bool, Any, Optional[Tuple[int, int, int, int]]]:
+    """Look up a cached value; returns (hit, value, current stamp)."""
+    cache = _get_store_cache()
+    stamp = _json_store_stamp(path)
+    cache_key = (str(path), key)
+    with cache["lock"]:
+        entry = cache["entries"].get(cache_key)
+        if entry is None or stamp is None or entry[0] != stamp:
+            return False, None, stamp
+        cache["entries"].move_to_end(cache_key)
+        blob = entry[1]
+    return True, pickle.loads(blob), stamp
+
+def _json_store_parse(path: Path) -> dict:
+    """Parse a whole JSON store file from disk, creating it if missing."""
+    if not path.exists():
+        with _store_lock(path):
+            if not path.exists():
+                _atomic_write_text(path, "{}")
+    
+    disk_stamp = _json_store_disk_stamp(path)
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    _get_store_cache()["disk_stamps"][str(path)] = disk_stamp
+    return data
+
+def _json_store_read(path: Path) -> dict:
+    """Read a whole JSON store file through the read cache."""
+    pending = _json_store_pending(path)
+    if pending is not None:
+        return pending
+    
+    hit, data, stamp = _store_cache_get(path, _WHOLE_STORE)
+    if hit:
+        return data
+    
+    data = _json_store_parse(path)
+    cache = _get_store_cache()
+    with cache["lock"]:
+        _store_cache_set(cache, path, _WHOLE_STORE, stamp or _json_store_stamp(path), data)
+    return data
+
+def _json_store_read_partition(path: Path, key: str) -> Any:
+    """Read one partition of a JSON store through the read cache (None if missing)."""
+    pending = _json_store_pending(path)
+    if pending is not None:
+        return pending.get(key)
+    
+    hit, value, stamp = _store_cache_get(path, key)
+    if hit:
+        return value
+    
+    # Only the requested partition is kept so cold companies don't pin memory
+    value = _json_store_parse(path).get(key)
+    cache = _get_store_cache()
+    with cache["lock"]:
+        _store_cache_set(cache, path, key, stamp or _json_store_stamp(path), value)
+    return value
+
+def _json_store_write_file(path: Path, data: dict, changed_keys: Optional[Iterable[str]] = None,
+                           base_merges: Optional[int] = None):
+    """Write a whole JSON store file and bring the read cache up to date.
+    
+    When changed_keys is given, cached partitions outside it are known to be
+    unchanged and stay valid; otherwise every cached partition is dropped.
+    If another process saved the file since this one last read or wrote it,
+    only the changed partitions are laid over its version instead of
+    overwriting it. The same goes for data built before such a merge, which
+    the group commit queue tells apart by the merge count it was based on.
+    """
+    path_key = str(path)
+    cache = _get_store_cache()
+    with _store_lock(path):
+        disk_stamp = _json_store_disk_stamp(path)
+        merge_count = cache["merges"].get(path_key, 0)
+        if changed_keys is not None and disk_stamp is not None and (
+                disk_stamp != cache["disk_stamps"].get(path_key)
+                or (base_merges is not None and base_merges != merge_count)):
+            merged = _json_store_parse(path)
+            for key in changed_keys:
+                if key in data:
+                    merged[key] = data[key]
+                else:
+                    merged.pop(key, None)
+            data, changed_keys = merged, None
+            cache["merges"][path_key] = merge_count + 1
+        
+        _atomic_write_text(path, json.dumps(data, indent=2, ensure_ascii=False))
+        cache["disk_stamps"][path_key] = _json_store_disk_stamp(path)
+        
+        with cache["lock"]:
+            cache["versions"][path_key] = cache["versions"].get(path_key, 0) + 1
+            stamp = _json_store_stamp(path)
+            for key in list(cache["paths"].get(path_key, ())):
+                if key is _WHOLE_STORE or (changed_keys is not None and key in changed_keys):
+                    _store_cache_set(cache, path, key, stamp, data if key is _WHOLE_STORE else data.get(key))
+                elif changed_keys is None:
+                    _store_cache_drop(cache, (path_key, key))
+                else:
+                    cache["entries"][(path_key, key)][0] = stamp
+
+# With group commit on, _json_store_write only queues the store's new
+# contents (pickled, so later changes by the caller don't leak in) and a
+# background flusher writes each queued store once STORE_GROUP_COMMIT_MS has
+# passed, so a burst of saves to auth.json or companies.json becomes a single
+# write. Reads in this process see queued contents before they reach disk;
+# other processes see them once flushed, when they are merged partition by
+# partition into whatever those processes saved meanwhile. Under
+# STORE_FSYNC=always saves are written before they return. Queued saves are
+# flushed at exit. Stores in WRITE_THROUGH_STORES are never queued: other
+# processes check them under the store lock, so a save must be on disk
+# before the lock is released.
+
+WRITE_THROUGH_STORES = {USER_INDEX_FILE}
+
+def _json_store_write(path: Path, data: dict, changed_keys: Optional[List[str]] = None):
+    """Save a whole JSON store file, through the group commit queue when enabled."""
+    if STORE_GROUP_COMMIT_MS <= 0 or STORE_FSYNC == "always" or path in WRITE_THROUGH_STORES:
+        _json_store_write_file(path, data, changed_keys)
+        return
+    
+    flusher = _get_store_flusher()
+    blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    path_key = str(path)
+    with flusher["cond"]:
+        queued = flusher["pending"].get(path_key)
+        if changed_keys is None or (queued is not None and queued["changed_keys"] is None):
+            merged_keys = None
+        else:
+            merged_keys = set(changed_keys) | (queued["changed_keys"] if queued is not None else set())
+        # Data read from a queued save is only as fresh as that save
+        base_merges = queued["base_merges"] if queued is not None else _get_store_cache()["merges"].get(path_key, 0)
+        flusher["pending"][path_key] = {"path": path, "blob": blob, "changed_keys": merged_keys,
+                                        "base_merges": base_merges}
+        flusher["cond"].notify_all()
+
+def _json_store_pending(path: Path) -> Optional[dict]:
+    """Get a copy of a store's queued contents (None if nothing is queued)."""
+    if STORE_GROUP_COMMIT_MS <= 0:
+        return None
+    
+    flusher = _get_store_flusher()
+    with flusher["cond"]:
+        queued = flusher["pending"].get(str(path))
+    return pickle.loads(queued["blob"]) if queued is not None else None
+
+def flush_store_writes():
+    """Write every queued store save now."""
+    flusher = _get_store_flusher()
+    with flusher["flush_lock"]:
+        with flusher["cond"]:
+            batch = list(flusher["pending"].values())
+        for queued in batch:
+            path_key = str(queued["path"])
+            # Holding the store lock, no session reads the queued save between
+            # it being written and it leaving the queue
+            with _store_lock(queued["path"]):
+                _json_store_write_file(queued["path"], pickle.loads(queued["blob"]), queued["changed_keys"],
+                                       queued["base_merges"])
+                with flusher["cond"]:
+                    # A newer save queued meanwhile stays for the next batch
+                    if flusher["pending"].get(path_key) is queued:
+                        del flusher["pending"][path_key]
+
+def _store_flusher_loop(flusher: Dict[str, Any]):
+    """Flush queued store saves in batches (runs in a daemon thread)."""
+    while True:
+        with flusher["cond"]:
+            while not flusher["pending"]:
+                flusher["cond"].wait()
+        # Let the saves that follow within the window join this batch
+        time.sleep(STORE_GROUP_COMMIT_MS / 1000)
+        try:
+            flush_store_writes()
+        except OSError:
+            time.sleep(JOB_POLL_INTERVAL)  # Disk trouble; keep the saves queued and retry
+
+@st.cache_resource
+def _get_store_flusher() -> Dict[str, Any]:
+    """Start the process-wide group commit flusher."""
+    flusher = {
+        "pending": {},   # path -> {"path", "blob", "changed_keys", "base_merges"}
+        "cond": threading.Condition(),
+        "flush_lock": threading.Lock()
+    }
+    thread = threading.Thread(target=_store_flusher_loop, args=(flusher,), daemon=True, name="nafup-store-flusher")
+    thread.start()
+    atexit.register(flush_store_writes)
+    return flusher
+
+# Under the JSON backend the stores listed in LOG_STRUCTURED_STORES are kept
+# as append-only logs instead of a single JSON document: one JSONL file per
+# partition under "<store>_log/", with one event per line -
+#   {"op": "put", "record": {...}}                 new record
+#   {"op": "update", "id": ..., "fields": {...}}   edit or soft delete
+#   {"op": "delete", "id": ...}                    removal (tombstone)
+# so sending a message is one small append. Reads replay the partition, and a
+# partition whose log is mostly superseded events is compacted back to one
+# "put" per live record by a background job. Appends and rewrites of a
+# partition hold its _store_lock, so compaction never replaces a log that a
+# writer is appending to.
+
+LOG_STRUCTURED_STORES = {CHAT_FILE, PRIVATE_CHAT_FILE, TEAM_ACTIVITY_FILE, SEARCH_INDEX_FILE}
+
+def _log_store_dir(path: Path) -> Path:
+    """Get the log directory of a log-structured store."""
+    return path.parent / f"{path.stem}_log"
+
+def _log_partition_file(path: Path, key: str) -> Path:
+    """Get the log file of one partition."""
+    return _log_store_dir(path) / f"{urllib.parse.quote(key, safe='')}.jsonl"
+
+def _log_encode(event: dict) -> str:
+    """Encode one log event as a JSON line."""
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+def _log_write_partition(log_file: Path, records: List[dict]):
+    """Rewrite a partition log with one put event per record."""
+    _atomic_write_text(log_file, "".join(_log_encode({"op": "put", "record": record}) for record in records))
+
+def _log_append(log_file: Path, events: List[dict]):
+    """Append events to a partition log with a single write."""
+    with _store_lock(log_file), log_file.open("a", encoding="utf-8") as f:
+        f.write("".join(_log_encode(event) for event in events))
+        if STORE_FSYNC == "always":
+            _sync_file(f)
+
+def _log_store_ready(path: Path) -> Path:
+    """Get the log directory of a store, seeding it from the legacy JSON file once."""
+    log_dir = _log_store_dir(path)
+    if log_dir.is_dir():
+        return log_dir
+    
+    # Build the logs in a staging directory and rename it into place so a
+    # half-finished migration is never picked up
+    staging_dir = path.parent / f"{log_dir.name}.{uuid.uuid4().hex}.tmp"
+    staging_dir.mkdir()
+    if path.exists():
+        for key, records in _json_store_parse(path).items():
+            _log_write_partition(staging_dir / _log_partition_file(path, key).name, records)
+    try:
+        staging_dir.rename(log_dir)
+    except OSError:
+        # Another session finished the migration first
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return log_dir
+
+def _log_apply(records: "OrderedDict[str, dict]", event: dict):
+    """Apply one log event to the replayed records."""
+    op = event.get("op")
+    if op == "put":
+        record = event.get("record", {})
+        records[str(record.get("id") or uuid.uuid4().hex)] = record
+    elif op == "update":
+        record = records.get(event.get("id"))
+        if record is not None:
+            record.update(event.get("fields", {}))
+    elif op == "delete":
+        records.pop(event.get("id"), None)
+
+def _log_fold(log_file: Path) -> Tuple[List[dict], int]:
+    """Replay a partition log; returns (live records, number of events)."""
+    records = OrderedDict()
+    events = 0
+    with log_file.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Torn write from a crash mid-append
+            _log_apply(records, event)
+            events += 1
+    return list(records.values()), events
+
+def _log_needs_compaction(records: List[dict], events: int) -> bool:
+    """Check whether a partition log is mostly superseded events."""
+    return events >= LOG_COMPACT_MIN_EVENTS and events - len(records) > events * LOG_COMPACT_GARBAGE_RATIO
+
+def _log_compact(log_file: Path):
+    """Rewrite a partition log as one put per live record, if it still needs it."""
+    with _store_lock(log_file):
+        try:
+            records, events = _log_fold(log_file)
+        except FileNotFoundError:
+            return  # Deleted since the compaction was queued
+        if _log_needs_compaction(records, events):
+            _log_write_partition(log_file, records)
+
+def _run_compact_log_job(job_id: str, payload: Dict[str, Any]):
+    """Background job: compact one partition log."""
+    _log_compact(Path(payload["log_file"]))
+
+def _log_read_partition(path: Path, key: str) -> Optional[List[dict]]:
+    """Read one partition of a log-structured store (None if missing)."""
+    log_file = _log_partition_file(path, key)
+    hit, records, stamp = _store_cache_get(log_file, _WHOLE_STORE)
+    if hit:
+        return records
+    if stamp is None:
+        return None
+    
+    records, events = _log_fold(log_file)
+    if _log_needs_compaction(records, events):
+        # One queued compaction per partition at a time
+        enqueue_job("compact_log", {"log_file": str(log_file)}, f"compact_log:{log_file}")
+    
+    cache = _get_store_cache()
+    with cache["lock"]:
+        _store_cache_set(cache, log_file, _WHOLE_STORE, stamp, records)
+    return records
+
+def _log_store_keys(path: Path) -> List[str]:
+    """List the partition keys of a log-structured store."""
+    log_dir = _log_store_ready(path)
+    return sorted(urllib.parse.unquote(log_file.name[:-len(".jsonl")])
+                  for log_file in log_dir.glob("*.jsonl"))
+
+def _log_store_load_all(path: Path) -> dict:
+    """Load a whole log-structured store."""
+    return {key: _log_read_partition(path, key) or [] for key in _log_store_keys(path)}
+
+def _log_store_save_all(path: Path, data: dict):
+    """Save a whole log-structured store, compacting every partition."""
+    for key in set(_log_store_keys(path)) - set(data):
+        _log_store_delete(path, key)
+    for key, records in data.items():
+        _log_store_put(path, key, records)
+
+def _log_store_get(path: Path, key: str) -> Optional[List[dict]]:
+    """Get one partition of a log-structured store."""
+    _log_store_ready(path)
+    return _log_read_partition(path, key)
+
+def _log_store_put(path: Path, key: str, records: List[dict]):
+    """Replace one partition of a log-structured store."""
+    _log_store_ready(path)
+    log_file = _log_partition_file(path, key)
+    with _store_lock(log_file):
+        _log_write_partition(log_file, records)
+
+def _log_store_delete(path: Path, key: str):
+    """Delete one partition of a log-structured store."""
+    _log_store_ready(path)
+    log_file = _log_partition_file(path, key)
+    with _store_lock(log_file):
+        log_file.unlink(missing_ok=True)
+
+def _log_store_append(path: Path, key: str, record: dict):
+    """Append one record to a log-structured store."""
+    _log_store_ready(path)
+    _log_append(_log_partition_file(path, key), [{"op": "put", "record": record}])
+
+def _log_store_append_many(path: Path, items: List[Tuple[str, dict]]):
+    """Append records to a log-structured store, one write per partition."""
+    _log_store_ready(path)
+    by_key = OrderedDict()
+    for key, record in items:
+        by_key.setdefault(key, []).append({"op": "put", "record": record})
+    for key, events in by_key.items():
+        _log_append(_log_partition_file(path, key), events)
+
+def _log_store_get_record(path: Path, key: str, record_id: str) -> Optional[dict]:
+    """Get one record of a log-structured store by id."""
+    for record in _log_store_get(path, key) or []:
+        if record.get("id") == record_id:
+            return record
+    return None
+
+def _log_store_update_record(path: Path, key: str, record_id: str, fields: dict,
+                             only_if: Optional[Any] = None) -> bool:
+    """Log an update to one record of a log-structured store."""
+    log_file = _log_partition_file(path, key)
+    with _store_lock(log_file):
+        record = _log_store_get_record(path, key, record_id)
+        if record is None or (only_if is not None and not only_if(record)):
+            return False
+        _log_append(log_file, [{"op": "update", "id": record_id, "fields": fields}])
+    return True
+
+def _log_store_delete_record(path: Path, key: str, record_id: str) -> bool:
+    """Log a tombstone for one record of a log-structured store."""
+    log_file = _log_partition_file(path, key)
+    with _store_lock(log_file):
+        if _log_store_get_record(path, key, record_id) is None:
+            return False
+        _log_append(log_file, [{"op": "delete", "id": record_id}])
+    return True
+
+def _log_reverse_lines(log_file: Path, end: int):
+    """Yield (offset, line) pairs of a log file from `end` backwards."""
+    with log_file.open("rb") as f:
+        position = end
+        partial = b""
+        while position > 0:
+            read_size = min(LOG_TAIL_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + partial).split(b"\n")
+            # The first piece may continue in the previous block
+            partial = lines.pop(0)
+            offset = position + len(partial) + 1
+            offsets = []
+            for line in lines:
+                offsets.append(offset)
+                offset += len(line) + 1
+            for line_offset, line in zip(reversed(offsets), reversed(lines)):
+                yield line_offset, line
+        if partial:
+            yield 0, partial
+
+def _log_store_tail(path: Path, key: str, limit: int, cursor: Optional[Dict[str, Any]],
+                    include: Optional[Any]) -> Tuple[List[dict], Optional[Dict[str, Any]]]:
+    """Read the newest records of a log-structured partition without replaying it.
+    
+    Edits and tombstones are met before the record they apply to, so they are
+    held in `pending` until the record's put event is reached; the cursor
+    carries them along with the byte offset to continue from.
+    """
+    _log_store_ready(path)
+    log_file = _log_partition_file(path, key)
+    try:
+        stat_result = log_file.stat()
+    except FileNotFoundError:
+        return [], None
+    
+    if cursor and cursor.get("inode") != stat_result.st_ino:
+        # The log was compacted or rewritten since the cursor was issued
+        return _tail_records(_log_store_get(path, key) or [], limit, cursor, include)
+    
+    end = cursor["offset"] if cursor else stat_result.st_size
+    pending = {record_id: {"fields": list(override["fields"]), "deleted": override["deleted"]}
+               for record_id, override in (cursor or {}).get("pending", {}).items()}
+    records = []
+    next_cursor = None
+    for offset, line in _log_reverse_lines(log_file, end):
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            continue  # Torn write from a crash mid-append
+        
+        op = event.get("op")
+        if op == "update":
+            override = pending.setdefault(event.get("id"), {"fields": [], "deleted": False})
+            override["fields"].insert(0, event.get("fields", {}))
+        elif op == "delete":
+            pending.setdefault(event.get("id"), {"fields": [], "deleted": False})["deleted"] = True
+        elif op == "put":
+            record = event.get("record", {})
+            override = pending.pop(record.get("id"), None)
+            if override is not None:
+                if override["deleted"]:
+                    continue
+                for fields in override["fields"]:
+                    record.update(fields)
+            if include is not None and not include(record):
+                continue
+            records.append(record)
+            if len(records) >= limit:
+                if offset > 0:
+                    next_cursor = {"offset": offset, "inode": stat_result.st_ino,
+                                   "pending": pending, "before_id": record.get("id")}
+                break
+    
+    records.reverse()
+    return records, next_cursor
+
+# Stores listed in PARTITIONED_STORES keep one JSON file per partition under
+# "<store>_parts/" so that reading or writing one user's inbox never touches
+# anyone else's. STORE_INDEXES names the fields a store can be queried by;
+# store_query/store_count serve those queries newest-first by (created_at, id)
+# from a per-partition index (JSON, cached next to the partition) or from an
+# expression index (SQLite).
+
+PARTITIONED_STORES = {NOTIFICATIONS_FILE, ASSIGNER_INDEX_FILE}
+STORE_INDEXES = {NOTIFICATIONS_FILE: ("read", "type")}
+
+# Stands for "any value" in a partition index bucket. JSON values never
+# parse to a tuple, so it can't collide with a stored value (None included),
+# and it compares equal after the index is pickled into the read cache.
+_INDEX_ANY = ("*",)
+
+def _part_store_dir(path: Path) -> Path:
+    """Get the partition directory of a partitioned store."""
+    return path.parent / f"{path.stem}_parts"
+
+def _part_file(path: Path, key: str) -> Path:
+    """Get the file of one partition."""
+    return _part_store_dir(path) / f"{urllib.parse.quote(key, safe='')}.json"
+
+def _part_write_file(part_file: Path, value: Any):
+    """Write one partition file atomically."""
+    _atomic_write_text(part_file, json.dumps(value, indent=2, ensure_ascii=False))
+
+def _part_store_ready(path: Path) -> Path:
+    """Get the partition directory of a store, splitting the legacy JSON file once."""
+    part_dir = _part_store_dir(path)
+    if part_dir.is_dir():
+        return part_dir
+    
+    # Same staging-and-rename dance as the log stores
+    staging_dir = path.parent / f"{part_dir.name}.{uuid.uuid4().hex}.tmp"
+    staging_dir.mkdir()
+    if path.exists():
+        for key, value in _json_store_parse(path).items():
+            _part_write_file(staging_dir / _part_file(path, key).name, value)
+    try:
+        staging_dir.rename(part_dir)
+    except OSError:
+        # Another session finished the migration first
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return part_dir
+
+def _part_store_keys(path: Path) -> List[str]:
+    """List the partition keys of a partitioned store."""
+    part_dir = _part_store_ready(path)
+    return sorted(urllib.parse.unquote(part_file.name[:-len(".json")])
+                  for part_file in part_dir.glob("*.json"))
+
+def _part_store_get(path: Path, key: str) -> Any:
+    """Get one partition of a partitioned store (None if missing)."""
+    _part_store_ready(path)
+    part_file = _part_file(path, key)
+    hit, value, stamp = _store_cache_get(part_file, _WHOLE_STORE)
+    if hit:
+        return value
+    if stamp is None:
+        return None
+    
+    with part_file.open("r", encoding="utf-8") as f:
+        value = json.load(f)
+    cache = _get_store_cache()
+    with cache["lock"]:
+        _store_cache_set(cache, part_file, _WHOLE_STORE, stamp, value)
+    return value
+
+def _part_store_put(path: Path, key: str, value: Any):
+    """Replace one partition of a partitioned store."""
+    _part_store_ready(path)
+    part_file = _part_file(path, key)
+    with _store_lock(path):
+        _part_write_file(part_file, value)
+        
+        # Any cached copy or index of the old file is stale now
+        cache = _get_store_cache()
+        with cache["lock"]:
+            path_key = str(part_file)
+            cache["versions"][path_key] = cache["versions"].get(path_key, 0) + 1
+            for cached_key in list(cache["paths"].get(path_key, ())):
+                _store_cache_drop(cache, (path_key, cached_key))
+            _store_cache_set(cache, part_file, _WHOLE_STORE, _json_store_stamp(part_file), value)
+
+def _part_store_delete(path: Path, key: str):
+    """Delete one partition of a partitioned store."""
+    _part_store_ready(path)
+    with _store_lock(path):
+        _part_file(path, key).unlink(missing_ok=True)
+
+def _part_store_load_all(path: Path) -> dict:
+    """Load a whole partitioned store."""
+    return {key: _part_store_get(path, key) for key in _part_store_keys(path)}
+
+def _part_store_save_all(path: Path, data: dict):
+    """Save a whole partitioned store."""
+    for key in set(_part_store_keys(path)) - set(data):
+        _part_store_delete(path, key)
+    for key, value in data.items():
+        _part_store_put(path, key, value)
+
+def _part_store_append_many(path: Path, items: List[Tuple[str, dict]], skip_existing: bool) -> List[Tuple[str, dict]]:
+    """Append records to a partitioned store, one write per partition."""
+    with _store_lock(path):
+        by_key = OrderedDict()
+        for key, record in items:
+            by_key.setdefault(key, []).append(record)
+        appended = []
+        for key, new_records in by_key.items():
+            records = _part_store_get(path, key) or []
+            if skip_existing:
+                existing_ids = {record.get("id") for record in records}
+                new_records = [record for record in new_records if record.get("id") not in existing_ids]
+                if not new_records:
+                    continue
+            _part_store_put(path, key, records + new_records)
+            appended.extend((key, record) for record in new_records)
+    return appended
+
+def _part_store_update_record(path: Path, key: str, record_id: str, fields: dict,
+                              only_if: Optional[Any] = None) -> bool:
+    """Update fields of one record of a partitioned store."""
+    with _store_lock(path):
+        records = _part_store_get(path, key) or []
+        for record in records:
+            if record.get("id") == record_id:
+                if only_if is not None and not only_if(record):
+                    return False
+                record.update(fields)
+                _part_store_put(path, key, records)
+                return True
+    return False
+
+def _part_store_delete_record(path: Path, key: str, record_id: str) -> bool:
+    """Delete one record of a partitioned store."""
+    with _store_lock(path):
+        records = _part_store_get(path, key) or []
+        remaining = [record for record in records if record.get("id") != record_id]
+        if len(remaining) == len(records):
+            return False
+        _part_store_put(path, key, remaining)
+    return True
+
+def _part_store_index(path: Path, key: str) -> Dict[Tuple[Any, ...], List[Tuple[str, str, int]]]:
+    """Get the query index of one partition.
+    
+    Maps every combination of indexed field values (_INDEX_ANY meaning "any")
+    to the partition's matching (created_at, id, position) entries, oldest first.
+    """
+    part_file = _part_file(path, key)
+    hit, index, stamp = _store_cache_get(part_file, "index")
+    if hit:
+        return index
+    
+    fields = STORE_INDEXES.get(path, ())
+    index = {}
+    for position, record in enumerate(_part_store_get(path, key) or []):
+        entry = (str(record.get("created_at", "")), str(record.get("id", "")), position)
+        values = [record.get(field) for field in fields]
+        for mask in range(1 << len(fields)):
+            bucket = tuple(_INDEX_ANY if mask & (1 << i) else value for i, value in enumerate(values))
+            index.setdefault(bucket, []).append(entry)
+    for entries in index.values():
+        entries.sort()
+    
+    if stamp is not None:
+        cache = _get_store_cache()
+        with cache["lock"]:
+            _store_cache_set(cache, part_file, "index", stamp, index)
+    return index
+
+def _part_store_query(path: Path, key: str, where: Dict[str, Any], limit: int,
+                      cursor: Optional[Dict[str, Any]]) -> Tuple[List[dict], Optional[Dict[str, Any]]]:
+    """Page through one partition newest-first using its index."""
+    bucket = tuple(where.get(field, _INDEX_ANY) for field in STORE_INDEXES.get(path, ()))
+    # The index holds positions into the records, so both have to come from
+    # the same version of the file; retry if it was replaced in between
+    part_file = _part_file(path, key)
+    while True:
+        stamp = _json_store_stamp(part_file)
+        entries = _part_store_index(path, key).get(bucket, [])
+        records = _part_store_get(path, key) or []
+        if _json_store_stamp(part_file) == stamp:
+            break
+    end = len(entries)
+    if cursor:
+        end = bisect.bisect_left(entries, (cursor["created_at"], cursor["id"]))
+    
+    page_entries = entries[max(0, end - limit):end][::-1]
+    page = [records[position] for _, _, position in page_entries]
+    next_cursor = None
+    if page_entries and end - limit > 0:
+        created_at, record_id, _ = page_entries[-1]
+        next_cursor = {"created_at": created_at, "id": record_id}
+    return page, next_cursor
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    store TEXT NOT NULL,
+    pkey TEXT NOT NULL,
+    rid TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (store, pkey, rid)
+);
+CREATE INDEX IF NOT EXISTS idx_records_partition ON records (store, pkey, seq);
+CREATE INDEX IF NOT EXISTS idx_records_query ON records (
+    store, pkey, json_extract(body, '$.read'), json_extract(body, '$.type'), json_extract(body, '$.created_at'), rid
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    store TEXT PRIMARY KEY,
+    imported_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    store TEXT NOT NULL,
+    pkey TEXT NOT NULL,
+    cid TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (store, pkey, cid)
+);
+"""
+
+_sqlite_local = threading.local()
+_sqlite_imported_stores = set()
+_sqlite_import_lock = threading.Lock()
+
+def _sqlite_conn() -> sqlite3.Connection:
+    """Get this thread's SQLite connection, opening it on first use."""
+    conn = getattr(_sqlite_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(str(SQLITE_DB_FILE), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SQLITE_SCHEMA)
+        _sqlite_local.conn = conn
+    return conn
+
+def _sqlite_record_id(record: Any) -> str:
+    """Get the row id used for a list record."""
+    if isinstance(record, dict) and record.get("id"):
+        return str(record["id"])
+    return uuid.uuid4().hex
+
+def _sqlite_rows_for(key: str, value: Any) -> List[Tuple[str, int, str]]:
+    """Turn a partition value into (rid, seq, body) rows."""
+    if isinstance(value, list):
+        return [(_sqlite_record_id(record), seq, json.dumps(record, ensure_ascii=False))
+                for seq, record in enumerate(value, start=1)]
+    # Dict partitions are stored as a single row with an empty record id
+    return [("", 0, json.dumps(value, ensure_ascii=False))]
+
+def _sqlite_ready(path: Path) -> sqlite3.Connection:
+    """Get a connection, importing the legacy JSON file for a store once."""
+    conn = _sqlite_conn()
+    store = path.stem
+    if store in _sqlite_imported_stores:
+        return conn
+    
+    with _sqlite_import_lock:
+        row = conn.execute("SELECT 1 FROM store_meta WHERE store = ?", (store,)).fetchone()
+        if row is None:
+            with conn:
+                if path.exists():
+                    with path.open("r", encoding="utf-8") as f:
+                        legacy_data = json.load(f)
+                    for key, value in legacy_data.items():
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO records (store, pkey, rid, seq, body) VALUES (?, ?, ?, ?, ?)",
+                            [(store, key, rid, seq, body) for rid, seq, body in _sqlite_rows_for(key, value)]
+                        )
+                conn.execute("INSERT OR REPLACE INTO store_meta (store, imported_at) VALUES (?, ?)",
+                             (store, get_current_timestamp()))
+        _sqlite_imported_stores.add(store)
+    return conn
+
+def _sqlite_partition(conn: sqlite3.Connection, store: str, key: str) -> Any:
+    """Decode one partition, or None if it has no rows."""
+    rows = conn.execute(
+        "SELECT rid, body FROM records WHERE store = ? AND pkey = ? ORDER BY seq",
+        (store, key)
+    ).fetchall()
+    if not rows:
+        return None
+    if len(rows) == 1 and rows[0][0] == "":
+        return json.loads(rows[0][1])
+    return [json.loads(body) for _, body in rows]
+
+def _sqlite_next_seq(conn: sqlite3.Connection, store: str, key: str) -> int:
+    """Get the next sequence number for a list partition."""
+    row = conn.execute(
+        "SELECT COALESCE(MAX(seq), 0) + 1 FROM records WHERE store = ? AND pkey = ?",
+        (store, key)
+    ).fetchone()
+    return row[0]
+
+def store_load_all(path: Path) -> dict:
+    """Load a whole store as a dict of partitions."""
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            return _log_store_load_all(path)
+        if path in PARTITIONED_STORES:
+            return _part_store_load_all(path)
+        return _json_store_read(path)
+    
+    conn = _sqlite_ready(path)
+    data = {}
+    for key, rid, body in conn.execute(
+        "SELECT pkey, rid, body FROM records WHERE store = ? ORDER BY pkey, seq", (path.stem,)
+    ):
+        if rid == "":
+            data[key] = json.loads(body)
+        else:
+            data.setdefault(key, []).append(json.loads(body))
+    return data
+
+def store_save_all(path: Path, data: dict):
+    """Save a whole store, writing only the rows that changed."""
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            _log_store_save_all(path, data)
+            return
+        if path in PARTITIONED_STORES:
+            _part_store_save_all(path, data)
+            return
+        _json_store_write(path, data)
+        return
+    
+    conn = _sqlite_ready(path)
+    store = path.stem
+    with conn:
+        existing = {
+            (key, rid): (seq, body)
+            for key, rid, seq, body in conn.execute(
+                "SELECT pkey, rid, seq, body FROM records WHERE store = ?", (store,)
+            )
+        }
+        wanted = {}
+        for key, value in data.items():
+            for rid, seq, body in _sqlite_rows_for(key, value):
+                wanted[(key, rid)] = (seq, body)
+        
+        stale = [(store, key, rid) for (key, rid) in existing if (key, rid) not in wanted]
+        changed = [(store, key, rid, seq, body) for (key, rid), (seq, body) in wanted.items()
+                   if existing.get((key, rid)) != (seq, body)]
+        conn.executemany("DELETE FROM records WHERE store = ? AND pkey = ? AND rid = ?", stale)
+        conn.executemany(
+            "INSERT OR REPLACE INTO records (store, pkey, rid, seq, body) VALUES (?, ?, ?, ?, ?)", changed
+        )
+
+def store_keys(path: Path) -> List[str]:
+    """List the partition keys of a store."""
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            return _log_store_keys(path)
+        if path in PARTITIONED_STORES:
+            return _part_store_keys(path)
+        return list(_json_store_read(path).keys())
+    
+    conn = _sqlite_ready(path)
+    return [row[0] for row in conn.execute(
+        "SELECT DISTINCT pkey FROM records WHERE store = ? ORDER BY pkey", (path.stem,)
+    )]
+
+def store_get(path: Path, key: str, default: Any = None) -> Any:
+    """Get one partition of a store."""
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            value = _log_store_get(path, key)
+        elif path in PARTITIONED_STORES:
+            value = _part_store_get(path, key)
+        else:
+            value = _json_store_read_partition(path, key)
+        return default if value is None else value
+    
+    value = _sqlite_partition(_sqlite_ready(path), path.stem, key)
+    return default if value is None else value
+
+def store_put(path: Path, key: str, value: Any):
+    """Replace one partition of a store."""
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            _log_store_put(path, key, value)
+            return
+        if path in PARTITIONED_STORES:
+            _part_store_put(path, key, value)
+            return
+        with _store_lock(path):
+            data = _json_store_read(path)
+            data[key] = value
+            _json_store_write(path, data, [key])
+        return
+    
+    conn = _sqlite_ready(path)
+    store = path.stem
+    with conn:
+        conn.execute("DELETE FROM records WHERE store = ? AND pkey = ?", (store, key))
+        conn.executemany(
+            "INSERT OR REPLACE INTO records (store, pkey, rid, seq, body) VALUES (?, ?, ?, ?, ?)",
+            [(store, key, rid, seq, body) for rid, seq, body in _sqlite_rows_for(key, value)]
+        )
+
+def store_put_many(path: Path, values: Dict[str, Any]):
+    """Replace several partitions of a store in a single write."""
+    if not values:
+        return
+    
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            for key, value in values.items():
+                _log_store_put(path, key, value)
+            return
+        if path in PARTITIONED_STORES:
+            for key, value in values.items():
+                _part_store_put(path, key, value)
+            return
+        with _store_lock(path):
+            data = _json_store_read(path)
+            data.update(values)
+            _json_store_write(path, data, list(values))
+        return
+    
+    conn = _sqlite_ready(path)
+    store = path.stem
+    with conn:
+        conn.executemany("DELETE FROM records WHERE store = ? AND pkey = ?", [(store, key) for key in values])
+        conn.executemany(
+            "INSERT OR REPLACE INTO records (store, pkey, rid, seq, body) VALUES (?, ?, ?, ?, ?)",
+            [(store, key, rid, seq, body) for key, value in values.items() for rid, seq, body in _sqlite_rows_for(key, value)]
+        )
+
+def store_put_new(path: Path, values: Dict[str, Any]) -> bool:
+    """Add several partitions of a store only if none of them exist yet, all or nothing."""
+    if not _use_sqlite():
+        with _store_lock(path):
+            if any(store_get(path, key) is not None for key in values):
+                return False
+            store_put_many(path, values)
+        return True
+    
+    # A plain INSERT fails on the primary key if another process got there first
+    conn = _sqlite_ready(path)
+    store = path.stem
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO records (store, pkey, rid, seq, body) VALUES (?, ?, ?, ?, ?)",
+                [(store, key, rid, seq, body) for key, value in values.items() for rid, seq, body in _sqlite_rows_for(key, value)]
+            )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+def store_delete(path: Path, key: str):
+    """Delete one partition of a store."""
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            _log_store_delete(path, key)
+            return
+        if path in PARTITIONED_STORES:
+            _part_store_delete(path, key)
+            return
+        with _store_lock(path):
+            data = _json_store_read(path)
+            if key in data:
+                del data[key]
+                _json_store_write(path, data, [key])
+        return
+    
+    conn = _sqlite_ready(path)
+    with conn:
+        conn.execute("DELETE FROM records WHERE store = ? AND pkey = ?", (path.stem, key))
+
+def store_append(path: Path, key: str, record: dict):
+    """Append one record to a list partition."""
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            _log_store_append(path, key, record)
+            return
+        if path in PARTITIONED_STORES:
+            _part_store_append_many(path, [(key, record)], skip_existing=False)
+            return
+        with _store_lock(path):
+            data = _json_store_read(path)
+            data.setdefault(key, []).append(record)
+            _json_store_write(path, data, [key])
+        return
+    
+    conn = _sqlite_ready(path)
+    store = path.stem
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO records (store, pkey, rid, seq, body) VALUES (?, ?, ?, ?, ?)",
+            (store, key, _sqlite_record_id(record), _sqlite_next_seq(conn, store, key),
+             json.dumps(record, ensure_ascii=False))
+        )
+
+def store_append_many(path: Path, items: List[Tuple[str, dict]], skip_existing: bool = False) -> List[Tuple[str, dict]]:
+    """Append many (partition key, record) pairs in a single write.
+    
+    With skip_existing, records whose id is already in their partition are
+    left alone, which makes retried deliveries idempotent. Returns the pairs
+    that were actually appended.
+    """
+    if not items:
+        return []
+    
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            if skip_existing:
+                items = [(key, record) for key, record in items
+                         if _log_store_get_record(path, key, record.get("id")) is None]
+            _log_store_append_many(path, items)
+            return items
+        if path in PARTITIONED_STORES:
+            return _part_store_append_many(path, items, skip_existing)
+        with _store_lock(path):
+            data = _json_store_read(path)
+            appended = []
+            for key, record in items:
+                partition = data.setdefault(key, [])
+                if skip_existing and any(existing.get("id") == record.get("id") for existing in partition):
+                    continue
+                partition.append(record)
+                appended.append((key, record))
+            _json_store_write(path, data, list({key for key, _ in items}))
+        return appended
+    
+    conn = _sqlite_ready(path)
+    store = path.stem
+    with conn:
+        if skip_existing:
+            items = [(key, record) for key, record in items if conn.execute(
+                "SELECT 1 FROM records WHERE store = ? AND pkey = ? AND rid = ?",
+                (store, key, _sqlite_record_id(record))
+            ).fetchone() is None]
+        next_seqs = {}
+        rows = []
+        for key, record in items:
+            if key not in next_seqs:
+                next_seqs[key] = _sqlite_next_seq(conn, store, key)
+            rows.append((store, key, _sqlite_record_id(record), next_seqs[key], json.dumps(record, ensure_ascii=False)))
+            next_seqs[key] += 1
+        conn.executemany(
+            "INSERT OR REPLACE INTO records (store, pkey, rid, seq, body) VALUES (?, ?, ?, ?, ?)", rows
+        )
+    return items
+
+def store_get_record(path: Path, key: str, record_id: str) -> Optional[dict]:
+    """Get one record of a list partition by id."""
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            return _log_store_get_record(path, key, record_id)
+        records = _part_store_get(path, key) if path in PARTITIONED_STORES else _json_store_read_partition(path, key)
+        for record in records or []:
+            if record.get("id") == record_id:
+                return record
+        return None
+    
+    row = _sqlite_ready(path).execute(
+        "SELECT body FROM records WHERE store = ? AND pkey = ? AND rid = ?",
+        (path.stem, key, record_id)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+def store_update_record(path: Path, key: str, record_id: str, fields: dict,
+                        only_if: Optional[Any] = None) -> bool:
+    """Update fields of one record of a list partition.
+    
+    `only_if` optionally makes the update conditional on the record's
+    current contents, checked atomically with the write. Returns whether the
+    record was updated.
+    """
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            return _log_store_update_record(path, key, record_id, fields, only_if)
+        if path in PARTITIONED_STORES:
+            return _part_store_update_record(path, key, record_id, fields, only_if)
+        with _store_lock(path):
+            data = _json_store_read(path)
+            for record in data.get(key, []):
+                if record.get("id") == record_id:
+                    if only_if is not None and not only_if(record):
+                        return False
+                    record.update(fields)
+                    _json_store_write(path, data, [key])
+                    return True
+        return False
+    
+    conn = _sqlite_ready(path)
+    store = path.stem
+    while True:
+        row = conn.execute(
+            "SELECT body FROM records WHERE store = ? AND pkey = ? AND rid = ?", (store, key, record_id)
+        ).fetchone()
+        if row is None:
+            return False
+        record = json.loads(row[0])
+        if only_if is not None and not only_if(record):
+            return False
+        record.update(fields)
+        with conn:
+            # Only if nobody changed the record since it was read
+            cursor = conn.execute(
+                "UPDATE records SET body = ? WHERE store = ? AND pkey = ? AND rid = ? AND body = ?",
+                (json.dumps(record, ensure_ascii=False), store, key, record_id, row[0])
+            )
+        if cursor.rowcount > 0:
+            return True
+
+def store_delete_record(path: Path, key: str, record_id: str) -> bool:
+    """Delete one record of a list partition."""
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            return _log_store_delete_record(path, key, record_id)
+        if path in PARTITIONED_STORES:
+            return _part_store_delete_record(path, key, record_id)
+        with _store_lock(path):
+            data = _json_store_read(path)
+            records = data.get(key, [])
+            remaining = [record for record in records if record.get("id") != record_id]
+            if len(remaining) == len(records):
+                return False
+            data[key] = remaining
+            _json_store_write(path, data, [key])
+        return True
+    
+    conn = _sqlite_ready(path)
+    with conn:
+        cursor = conn.execute(
+            "DELETE FROM records WHERE store = ? AND pkey = ? AND rid = ?", (path.stem, key, record_id)
+        )
+    return cursor.rowcount > 0
+
+def _tail_records(records: List[dict], limit: int, cursor: Optional[Dict[str, Any]],
+                  include: Optional[Any]) -> Tuple[List[dict], Optional[Dict[str, Any]]]:
+    """Page backwards through an in-memory partition."""
+    end = len(records)
+    if cursor:
+        ids = [record.get("id") for record in records]
+        end = ids.index(cursor["before_id"]) if cursor.get("before_id") in ids else 0
+    
+    page = []
+    index = end
+    while index > 0 and len(page) < limit:
+        index -= 1
+        if include is None or include(records[index]):
+            page.append(records[index])
+    
+    page.reverse()
+    next_cursor = {"before_id": page[0].get("id")} if page and index > 0 else None
+    return page, next_cursor
+
+def store_tail(path: Path, key: str, limit: int, cursor: Optional[Dict[str, Any]] = None,
+               include: Optional[Any] = None) -> Tuple[List[dict], Optional[Dict[str, Any]]]:
+    """Get the newest `limit` records of a list partition, oldest first.
+    
+    `include` optionally filters records (e.g. skip deleted messages). Returns
+    the page and a cursor for the next older page, or None at the start.
+    """
+    if not _use_sqlite():
+        if path in LOG_STRUCTURED_STORES:
+            return _log_store_tail(path, key, limit, cursor, include)
+        return _tail_records(store_get(path, key, []), limit, cursor, include)
+    
+    conn = _sqlite_ready(path)
+    before_seq = cursor["seq"] if cursor and "seq" in cursor else None
+    rows = conn.execute(
+        "SELECT seq, body FROM records WHERE store = ? AND pkey = ? AND seq < COALESCE(?, seq + 1) "
+        "ORDER BY seq DESC",
+        (path.stem, key, before_seq)
+    )
+    records = []
+    next_cursor = None
+    oldest_seq = None
+    for seq, body in rows:
+        record = json.loads(body)
+        if include is not None and not include(record):
+            continue
+        if len(records) >= limit:
+            # Only hand out a cursor when an older matching record exists
+            next_cursor = {"seq": oldest_seq}
+            break
+        records.append(record)
+        oldest_seq = seq
+    rows.close()
+    
+    records.reverse()
+    return records, next_cursor
+
+def store_read_since(path: Path, key: str, cursor: Optional[Dict[str, Any]] = None
+                     ) -> Tuple[Optional[List[dict]], Optional[Dict[str, Any]]]:
+    """Get the records written to a list partition after `cursor`, in write order.
+    
+    Meant for append-only partitions (a record appended again with the same
+    id counts as a new write). With no cursor every write is returned. Returns
+    (records, cursor to continue from), or (None, None) if the partition was
+    rewritten since the cursor was issued and has to be read from the start.
+    """
+    if not _use_sqlite():
+        if path not in LOG_STRUCTURED_STORES:
+            records = store_get(path, key, [])
+            start = cursor["count"] if cursor else 0
+            if start > len(records):
+                return None, None
+            return records[start:], {"count": len(records)}
+        
+        _log_store_ready(path)
+        log_file = _log_partition_file(path, key)
+        try:
+            stat_result = log_file.stat()
+        except FileNotFoundError:
+            return ([], None) if not cursor else (None, None)
+        if cursor and (cursor.get("inode") != stat_result.st_ino or cursor["offset"] > stat_result.st_size):
+            return None, None
+        
+        offset = cursor["offset"] if cursor else 0
+        with log_file.open("rb") as f:
+            f.seek(offset)
+            data = f.read(stat_result.st_size - offset)
+        # A line still being appended is left for the next read
+        complete = data[:data.rfind(b"\n") + 1]
+        records = []
+        for line in complete.split(b"\n"):
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Torn write from a crash mid-append
+            if event.get("op") == "put":
+                records.append(event.get("record", {}))
+        return records, {"offset": offset + len(complete), "inode": stat_result.st_ino}
+    
+    conn = _sqlite_ready(path)
+    after_seq = cursor["seq"] if cursor else 0
+    max_seq = _sqlite_next_seq(conn, path.stem, key) - 1
+    if after_seq > max_seq:
+        return None, None
+    rows = conn.execute(
+        "SELECT seq, body FROM records WHERE store = ? AND pkey = ? AND seq > ? ORDER BY seq",
+        (path.stem, key, after_seq)
+    ).fetchall()
+    return [json.loads(body) for _, body in rows], {"seq": rows[-1][0] if rows else after_seq}
+
+def _query_where(path: Path, where: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Drop unset filters and check that the rest are indexed fields."""
+    where = {field: value for field, value in (where or {}).items() if value is not None}
+    unknown = set(where) - set(STORE_INDEXES.get(path, ()))
+    if unknown:
+        raise ValueError(f"{path.stem} has no index on {', '.join(sorted(unknown))}")
+    return where
+
+def _sqlite_query_filter(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Build the SQL conditions for the indexed fields of a query."""
+    clauses = []
+    params = []
+    for field, value in where.items():
+        clauses.append(f"json_extract(body, '$.{field}') = ?")
+        params.append(value)
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+def store_query(path: Path, key: str, where: Optional[Dict[str, Any]] = None, limit: int = 20,
+                cursor: Optional[Dict[str, Any]] = None) -> Tuple[List[dict], Optional[Dict[str, Any]]]:
+    """Get one page of a partition's records matching `where`, newest first.
+    
+    Only the fields in STORE_INDEXES for the store can be filtered on. Returns
+    the page and a cursor for the next (older) page, or None at the end.
+    """
+    where = _query_where(path, where)
+    if not _use_sqlite():
+        if path in PARTITIONED_STORES:
+            return _part_store_query(path, key, where, limit, cursor)
+        # Unindexed stores fall back to sorting the partition in memory
+        records = [record for record in store_get(path, key, [])
+                   if all(record.get(field) == value for field, value in where.items())]
+        records.sort(key=lambda record: (str(record.get("created_at", "")), str(record.get("id", ""))))
+        if cursor:
+            records = [record for record in records
+                       if (str(record.get("created_at", "")), str(record.get("id", ""))) < (cursor["created_at"], cursor["id"])]
+        page = records[-limit:][::-1] if limit > 0 else []
+        next_cursor = None
+        if page and len(records) > limit:
+            next_cursor = {"created_at": str(page[-1].get("created_at", "")), "id": str(page[-1].get("id", ""))}
+        return page, next_cursor
+    
+    conn = _sqlite_ready(path)
+    conditions, params = _sqlite_query_filter(where)
+    if cursor:
+        conditions += (" AND (json_extract(body, '$.created_at') < ? OR "
+                       "(json_extract(body, '$.created_at') = ? AND rid < ?))")
+        params += [cursor["created_at"], cursor["created_at"], cursor["id"]]
+    rows = conn.execute(
+        f"SELECT rid, body FROM records WHERE store = ? AND pkey = ?{conditions} "
+        "ORDER BY json_extract(body, '$.created_at') DESC, rid DESC LIMIT ?",
+        [path.stem, key] + params + [limit + 1]
+    ).fetchall()
+    
+    page = [json.loads(body) for _, body in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit and page:
+        next_cursor = {"created_at": str(page[-1].get("created_at", "")), "id": rows[limit - 1][0]}
+    return page, next_cursor
+
+def store_count(path: Path, key: str, where: Optional[Dict[str, Any]] = None) -> int:
+    """Count a partition's records matching `where`."""
+    where = _query_where(path, where)
+    if not _use_sqlite():
+        if path in PARTITIONED_STORES:
+            bucket = tuple(where.get(field, _INDEX_ANY) for field in STORE_INDEXES.get(path, ()))
+            return len(_part_store_index(path, key).get(bucket, []))
+        return sum(1 for record in store_get(path, key, [])
+                   if all(record.get(field) == value for field, value in where.items()))
+    
+    conditions, params = _sqlite_query_filter(where)
+    row = _sqlite_ready(path).execute(
+        f"SELECT COUNT(*) FROM records WHERE store = ? AND pkey = ?{conditions}",
+        [path.stem, key] + params
+    ).fetchone()
+    return row[0]
+
+# Counters (such as download counts) are kept apart from the records they
+# count, so bumping one never rewrites the record's store. Under the JSON
+# backend each partition has an append-only "<store>_counters/<key>.jsonl"
+# of increments that is folded into "<key>.json" once it grows past
+# COUNTER_FOLD_EVENTS lines; SQLite upserts into the counters table. A fold
+# moves the log aside to "<key>.jsonl.fold<n>" until the snapshot including
+# it is written, and readers count that file as well in the meantime.
+
+def _counter_files(path: Path, key: str) -> Tuple[Path, Path]:
+    """Get the (increment log, snapshot) files of a partition's counters."""
+    counter_dir = path.parent / f"{path.stem}_counters"
+    name = urllib.parse.quote(key, safe="")
+    return counter_dir / f"{name}.jsonl", counter_dir / f"{name}.json"
+
+def _counter_fold_file(log_file: Path, fold: int) -> Path:
+    """Get the file a counter log is moved to while it is folded."""
+    return log_file.with_name(f"{log_file.name}.fold{fold}")
+
+def _read_counter_snapshot(snapshot_file: Path) -> Tuple[Dict[str, int], int]:
+    """Read a counter snapshot; returns (counts, folds it includes)."""
+    try:
+        with snapshot_file.open("r", encoding="utf-8") as f:
+            counts = json.load(f)
+    except FileNotFoundError:
+        return {}, 0
+    return counts, counts.pop("_folds", 0)
+
+def _add_counter_log(counts: Dict[str, int], log_file: Path) -> int:
+    """Add the increments of a counter log to counts; returns how many there were."""
+    events = 0
+    try:
+        with log_file.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn write from a crash mid-append
+                counts[event["id"]] = counts.get(event["id"], 0) + event.get("n", 1)
+                events += 1
+    except FileNotFoundError:
+        pass
+    return events
+
+def _read_counters(log_file: Path, snapshot_file: Path) -> Tuple[Dict[str, int], int]:
+    """Replay a counter log over its snapshot; returns (counts, logged increments)."""
+    while True:
+        stamps = (_json_store_disk_stamp(snapshot_file), _json_store_disk_stamp(log_file))
+        counts, folds = _read_counter_snapshot(snapshot_file)
+        # A fold in progress has moved the log aside but not written the snapshot yet
+        _add_counter_log(counts, _counter_fold_file(log_file, folds + 1))
+        events = _add_counter_log(counts, log_file)
+        
+        # A fold (or append) in between may have moved increments between the files read
+        if (_json_store_disk_stamp(snapshot_file), _json_store_disk_stamp(log_file)) == stamps:
+            return counts, events
+
+def _fold_counters(log_file: Path, snapshot_file: Path, values: Optional[Dict[str, int]] = None):
+    """Fold a counter log into its snapshot and start a fresh log.
+    
+    With `values`, the snapshot is replaced by them instead and the logged
+    increments are dropped. Runs under the log's _store_lock, which appends
+    hold too. The snapshot counts its folds, so a crash at any point neither
+    loses nor repeats the increments of the log being folded.
+    """
+    with _store_lock(log_file):
+        counts, folds = _read_counter_snapshot(snapshot_file)
+        # Left over from a fold that crashed after writing the snapshot
+        _counter_fold_file(log_file, folds).unlink(missing_ok=True)
+        
+        fold_file = _counter_fold_file(log_file, folds + 1)
+        if not fold_file.exists():  # Otherwise a fold crashed before writing the snapshot
+            try:
+                os.replace(log_file, fold_file)
+            except FileNotFoundError:
+                if values is None:
+                    return  # Folded by another session meanwhile
+        
+        if values is None:
+            _add_counter_log(counts, fold_file)
+        else:
+            counts = dict(values)
+        counts["_folds"] = folds + 1
+        _atomic_write_text(snapshot_file, json.dumps(counts))
+        fold_file.unlink(missing_ok=True)
+
+def store_incr_counter(path: Path, key: str, counter_id: str, amount: int = 1):
+    """Add to one counter of a partition."""
+    store_incr_counters(path, key, {counter_id: amount})
+
+def store_incr_counters(path: Path, key: str, amounts: Dict[str, int]):
+    """Add to several counters of a partition in a single write."""
+    if not amounts:
+        return
+    
+    if not _use_sqlite():
+        log_file, _ = _counter_files(path, key)
+        log_file.parent.mkdir(exist_ok=True)
+        _log_append(log_file, [{"id": counter_id, "n": amount} for counter_id, amount in amounts.items()])
+        return
+    
+    conn = _sqlite_conn()
+    with conn:
+        conn.executemany(
+            "INSERT INTO counters (store, pkey, cid, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (store, pkey, cid) DO UPDATE SET value = value + excluded.value",
+            [(path.stem, key, counter_id, amount) for counter_id, amount in amounts.items()]
+        )
+
+def store_set_counters(path: Path, key: str, values: Dict[str, int]):
+    """Replace all counters of a partition with absolute values."""
+    if not _use_sqlite():
+        log_file, snapshot_file = _counter_files(path, key)
+        log_file.parent.mkdir(exist_ok=True)
+        _fold_counters(log_file, snapshot_file, values)
+        return
+    
+    conn = _sqlite_conn()
+    with conn:
+        conn.execute("DELETE FROM counters WHERE store = ? AND pkey = ?", (path.stem, key))
+        conn.executemany(
+            "INSERT INTO counters (store, pkey, cid, value) VALUES (?, ?, ?, ?)",
+            [(path.stem, key, counter_id, value) for counter_id, value in values.items()]
+        )
+
+def store_get_counters(path: Path, key: str) -> Dict[str, int]:
+    """Get all counters of a partition by counter id."""
+    if not _use_sqlite():
+        log_file, snapshot_file = _counter_files(path, key)
+        counts, events = _read_counters(log_file, snapshot_file)
+        if events >= COUNTER_FOLD_EVENTS:
+            _fold_counters(log_file, snapshot_file)
+        return counts
+    
+    return dict(_sqlite_conn().execute(
+        "SELECT cid, value FROM counters WHERE store = ? AND pkey = ?", (path.stem, key)
+    ).fetchall())
+
+def _merge_download_counts(path: Path, key: str, files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Add the counted downloads to file records (on top of any legacy count)."""
+    counts = store_get_counters(path, key)
+    for file_info in files:
+        file_info["downloads"] = file_info.get("downloads", 0) + counts.get(file_info.get("id"), 0)
+    return files
+
+# -------------------------------------------------------------
+# Blob Storage
+# -------------------------------------------------------------
+# File payloads (shared files, task attachments) live on disk under BLOB_DIR,
+# named by the SHA-256 of their content, so identical uploads are stored once
+# and records only carry metadata plus a "blob_key". Older records that still
+# hold a hex "content" field are moved into the blob store the first time
+# their partition is listed.
+
+def blob_path(blob_key: str) -> Path:
+    """Get the on-disk path of a blob."""
+    return BLOB_DIR / blob_key[:2] / blob_key[2:4] / blob_key
+
+def blob_put_stream(stream: BinaryIO) -> Tuple[str, int]:
+    """Store the contents of a binary stream as a blob; returns (blob key, size)."""
+    BLOB_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_file = BLOB_DIR / f"upload-{uuid.uuid4().hex}.tmp"
+    digest = hashlib.sha256()
+    size = 0
+    with tmp_file.open("wb") as f:
+        for chunk in iter(lambda: stream.read(BLOB_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+        _sync_file(f)
+    
+    blob_key = digest.hexdigest()
+    target = blob_path(blob_key)
+    if target.exists():
+        # Same content was uploaded before
+        tmp_file.unlink()
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _replace_file(tmp_file, target)
+    return blob_key, size
+
+def blob_put(content: bytes) -> str:
+    """Store bytes as a blob and return its key."""
+    blob_key, _ = blob_put_stream(io.BytesIO(content))
+    return blob_key
+
+def blob_open(blob_key: str) -> Optional[BinaryIO]:
+    """Open a blob for streaming reads, or None if it is missing."""
+    try:
+        return blob_path(blob_key).open("rb")
+    except FileNotFoundError:
+        return None
+
+def _open_record_payload(record: Dict[str, Any]) -> Optional[BinaryIO]:
+    """Open the payload of a file record, whether blob-backed or legacy hex."""
+    if record.get("blob_key"):
+        return blob_open(record["blob_key"])
+    if "content" in record:
+        return io.BytesIO(bytes.fromhex(record.get("content", "")))
+    return None
+
+class _MappedFile(io.RawIOBase):
+    """Read-only file object over a memory-mapped blob."""
+    
+    def __init__(self, mapped: mmap.mmap):
+        super().__init__()
+        self._mapped = mapped
+        self._position = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._mapped)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+    
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._mapped) if size is None or size < 0 else min(len(self._mapped), self._position + size)
+        data = self._mapped[self._position:end]
+        self._position = max(self._position, end)
+        return data
+    
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+    
+    def close(self):
+        if not self.closed:
+            self._mapped.close()
+        super().close()
+
+def private_blob_path(pair_key: str, file_id: str) -> Path:
+    """Get the on-disk path of a privately shared file."""
+    return PRIVATE_FILES_DIR / urllib.parse.quote(pair_key, safe="") / file_id
+
+def private_blob_write(pair_key: str, file_id: str, stream: BinaryIO) -> int:
+    """Copy a binary stream into the private file store in chunks; returns its size."""
+    target = private_blob_path(pair_key, file_id)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = target.with_name(f"{target.name}.{uuid.uuid4().hex}.tmp")
+    with tmp_file.open("wb") as f:
+        shutil.copyfileobj(stream, f, BLOB_CHUNK_SIZE)
+        size = f.tell()
+        _sync_file(f)
+    _replace_file(tmp_file, target)
+    return size
+
+def private_blob_open(pair_key: str, file_id: str) -> Optional[BinaryIO]:
+    """Open a privately shared file as a memory-mapped stream, or None if missing."""
+    try:
+        with private_blob_path(pair_key, file_id).open("rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO(b"")  # Empty files can't be mapped
+            return _MappedFile(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except FileNotFoundError:
+        return None
+
+def _migrate_inline_payloads(path: Path, key: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Move legacy hex payloads of a partition into the blob store."""
+    if not any("content" in record for record in records):
+        return records
+    
+    for record in records:
+        if "content" in record:
+            record["blob_key"] = blob_put(bytes.fromhex(record.pop("content") or ""))
+    store_put(path, key, records)
+    return records
+
+# -------------------------------------------------------------
+# Background Jobs
+# -------------------------------------------------------------
+# Work that the user shouldn't wait on (notification fan-out) is written to a
+# durable SQLite queue and picked up by a background worker thread, started
+# once per process through st.cache_resource. A worker leases a job before
+# running it; if the process dies mid-job the lease expires and the job runs
+# again, so delivery is at-least-once and handlers must be idempotent.
+# A job that fails JOB_MAX_ATTEMPTS times stays in the queue as 'failed' for
+# inspection until a job with the same id is enqueued again, which revives it.
+
+_JOB_QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    leased_until REAL,
+    created_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (state, available_at);
+"""
+
+# Job kind -> handler(job_id, payload); handlers register themselves below
+# their definitions
+JOB_HANDLERS = {}
+
+# Job kind -> interval in seconds for jobs that run on a schedule; the next
+# run is queued whenever one finishes and when the worker starts
+PERIODIC_JOBS = {}
+
+JOB_HANDLERS["compact_log"] = _run_compact_log_job
+
+_job_queue_local = threading.local()
+
+def _job_queue_conn() -> sqlite3.Connection:
+    """Get this thread's job queue connection, opening it on first use."""
+    conn = getattr(_job_queue_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(str(JOB_QUEUE_DB_FILE), timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.executescript(_JOB_QUEUE_SCHEMA)
+        _job_queue_local.conn = conn
+    return conn
+
+def _insert_job(kind: str, payload: Dict[str, Any], job_id: str, available_at: float):
+    """Insert a job row unless one with the same id is already pending; a failed one is reset instead."""
+    _job_queue_conn().execute(
+        "INSERT INTO jobs (id, kind, payload, available_at, created_at) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (id) DO UPDATE SET kind = excluded.kind, payload = excluded.payload, state = 'pending', "
+        "attempts = 0, available_at = excluded.available_at, leased_until = NULL, last_error = NULL "
+        "WHERE jobs.state = 'failed'",
+        (job_id, kind, json.dumps(payload, ensure_ascii=False), available_at, time.time())
+    )
+
+def enqueue_job(kind: str, payload: Dict[str, Any], job_id: Optional[str] = None) -> str:
+    """Add a job to the queue; enqueueing a job id that is already pending is a no-op."""
+    job_id = job_id or str(uuid.uuid4())
+    _insert_job(kind, payload, job_id, time.time())
+    get_job_worker()["wakeup"].set()
+    return job_id
+
+def _schedule_periodic_job(kind: str):
+    """Queue the next run of a periodic job, at most one per interval."""
+    interval = PERIODIC_JOBS[kind]
+    slot = int(time.time() // interval) + 1
+    _insert_job(kind, {}, f"{kind}:{slot}", slot * interval)
+
+def _claim_job() -> Optional[Tuple[str, str, Dict[str, Any], int]]:
+    """Lease the oldest runnable job; returns (id, kind, payload, attempts)."""
+    conn = _job_queue_conn()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, kind, payload, attempts FROM jobs "
+            "WHERE state = 'pending' AND available_at <= ? AND (leased_until IS NULL OR leased_until < ?) "
+            "ORDER BY available_at LIMIT 1",
+            (now, now)
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE jobs SET leased_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (now + JOB_LEASE_SECONDS, row[0])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    
+    if row is None:
+        return None
+    return row[0], row[1], json.loads(row[2]), row[3] + 1
+
+def _finish_job(job_id: str, error: Optional[str] = None, attempts: int = 0):
+    """Remove a finished job, or schedule a retry with backoff after a failure."""
+    conn = _job_queue_conn()
+    if error is None:
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+    elif attempts >= JOB_MAX_ATTEMPTS:
+        conn.execute("UPDATE jobs SET state = 'failed', leased_until = NULL, last_error = ? WHERE id = ?",
+                     (error, job_id))
+    else:
+        conn.execute(
+            "UPDATE jobs SET leased_until = NULL, available_at = ?, last_error = ? WHERE id = ?",
+            (time.time() + min(60, 2 ** attempts), error, job_id)
+        )
+
+def run_pending_jobs(max_jobs: Optional[int] = None) -> int:
+    """Run runnable jobs in this thread until the queue is empty; returns how many ran."""
+    handled = 0
+    while max_jobs is None or handled < max_jobs:
+        job = _claim_job()
+        if job is None:
+            break
+        job_id, kind, payload, attempts = job
+        try:
+            JOB_HANDLERS[kind](job_id, payload)
+        except Exception as e:
+            print(f"Error in job {kind} {job_id}: {e}")
+            _finish_job(job_id, str(e), attempts)
+        else:
+            _finish_job(job_id)
+        if kind in PERIODIC_JOBS:
+            _schedule_periodic_job(kind)
+        handled += 1
+    return handled
+
+def _job_worker_loop(wakeup: threading.Event):
+    """Background worker: run queued jobs, sleeping until woken or polled."""
+    while True:
+        try:
+            run_pending_jobs()
+        except Exception as e:
+            print(f"Error in job worker: {e}")
+        wakeup.wait(JOB_POLL_INTERVAL)
+        wakeup.clear()
+
+@st.cache_resource
+def get_job_worker() -> Dict[str, Any]:
+    """Start the process-wide background job worker (once per process)."""
+    for kind in PERIODIC_JOBS:
+        _schedule_periodic_job(kind)
+    wakeup = threading.Event()
+    thread = threading.Thread(target=_job_worker_loop, args=(wakeup,), name="nafup-job-worker", daemon=True)
+    thread.start()
+    return {"thread": thread, "wakeup": wakeup}
 
 # -------------------------------------------------------------
 # Enhanced Authentication Functions
@@ -344,333 +2354,232 @@ def generate_company_code():
 
 def load_auth_data():
     """Load authentication data."""
-    if not AUTH_FILE.exists():
-        AUTH_FILE.write_text("{}", encoding="utf-8")
-    
-    with AUTH_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(AUTH_FILE)
 
 def save_auth_data(auth_data: dict):
     """Save authentication data."""
-    with AUTH_FILE.open("w", encoding="utf-8") as f:
-        json.dump(auth_data, f, indent=2, ensure_ascii=False)
+    store_save_all(AUTH_FILE, auth_data)
 
 def load_companies_data():
     """Load companies data."""
-    if not COMPANIES_FILE.exists():
-        COMPANIES_FILE.write_text("{}", encoding="utf-8")
-    
-    with COMPANIES_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(COMPANIES_FILE)
 
 def save_companies_data(companies_data: dict):
     """Save companies data."""
-    with COMPANIES_FILE.open("w", encoding="utf-8") as f:
-        json.dump(companies_data, f, indent=2, ensure_ascii=False)
+    store_save_all(COMPANIES_FILE, companies_data)
 
 def load_notifications_data():
     """Load notifications data."""
-    if not NOTIFICATIONS_FILE.exists():
-        NOTIFICATIONS_FILE.write_text("{}", encoding="utf-8")
-    
-    with NOTIFICATIONS_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(NOTIFICATIONS_FILE)
 
 def save_notifications_data(notifications_data: dict):
     """Save notifications data."""
-    with NOTIFICATIONS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(notifications_data, f, indent=2, ensure_ascii=False)
+    store_save_all(NOTIFICATIONS_FILE, notifications_data)
 
 def load_chat_data():
     """Load chat messages data."""
-    if not CHAT_FILE.exists():
-        CHAT_FILE.write_text("{}", encoding="utf-8")
-    
-    with CHAT_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(CHAT_FILE)
 
 def save_chat_data(chat_data: dict):
     """Save chat messages data."""
-    with CHAT_FILE.open("w", encoding="utf-8") as f:
-        json.dump(chat_data, f, indent=2, ensure_ascii=False)
+    store_save_all(CHAT_FILE, chat_data)
 
 def load_private_chat_data():
     """Load private chat messages data."""
-    if not PRIVATE_CHAT_FILE.exists():
-        PRIVATE_CHAT_FILE.write_text("{}", encoding="utf-8")
-    
-    with PRIVATE_CHAT_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(PRIVATE_CHAT_FILE)
 
 def save_private_chat_data(private_chat_data: dict):
     """Save private chat messages data."""
-    with PRIVATE_CHAT_FILE.open("w", encoding="utf-8") as f:
-        json.dump(private_chat_data, f, indent=2, ensure_ascii=False)
+    store_save_all(PRIVATE_CHAT_FILE, private_chat_data)
 
 def load_files_data():
     """Load shared files data."""
-    if not FILES_FILE.exists():
-        FILES_FILE.write_text("{}", encoding="utf-8")
-    
-    with FILES_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(FILES_FILE)
 
 def save_files_data(files_data: dict):
     """Save shared files data."""
-    with FILES_FILE.open("w", encoding="utf-8") as f:
-        json.dump(files_data, f, indent=2, ensure_ascii=False)
+    store_save_all(FILES_FILE, files_data)
 
 def load_private_files_data():
     """Load private files data."""
-    if not PRIVATE_FILES_FILE.exists():
-        PRIVATE_FILES_FILE.write_text("{}", encoding="utf-8")
-    
-    with PRIVATE_FILES_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(PRIVATE_FILES_FILE)
 
 def save_private_files_data(private_files_data: dict):
     """Save private files data."""
-    with PRIVATE_FILES_FILE.open("w", encoding="utf-8") as f:
-        json.dump(private_files_data, f, indent=2, ensure_ascii=False)
+    store_save_all(PRIVATE_FILES_FILE, private_files_data)
 
 def load_calendar_data():
     """Load calendar events data."""
-    if not CALENDAR_FILE.exists():
-        CALENDAR_FILE.write_text("{}", encoding="utf-8")
-    
-    with CALENDAR_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(CALENDAR_FILE)
 
 def save_calendar_data(calendar_data: dict):
     """Save calendar events data."""
-    with CALENDAR_FILE.open("w", encoding="utf-8") as f:
-        json.dump(calendar_data, f, indent=2, ensure_ascii=False)
+    store_save_all(CALENDAR_FILE, calendar_data)
 
 def load_polls_data():
     """Load polls data."""
-    if not POLLS_FILE.exists():
-        POLLS_FILE.write_text("{}", encoding="utf-8")
-    
-    with POLLS_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(POLLS_FILE)
 
 def save_polls_data(polls_data: dict):
     """Save polls data."""
-    with POLLS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(polls_data, f, indent=2, ensure_ascii=False)
+    store_save_all(POLLS_FILE, polls_data)
 
 def load_user_status_data():
     """Load user status data."""
-    if not USER_STATUS_FILE.exists():
-        USER_STATUS_FILE.write_text("{}", encoding="utf-8")
-    
-    with USER_STATUS_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(USER_STATUS_FILE)
 
 def save_user_status_data(user_status_data: dict):
     """Save user status data."""
-    with USER_STATUS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(user_status_data, f, indent=2, ensure_ascii=False)
+    store_save_all(USER_STATUS_FILE, user_status_data)
 
 def load_task_comments_data():
     """Load task comments data."""
-    if not TASK_COMMENTS_FILE.exists():
-        TASK_COMMENTS_FILE.write_text("{}", encoding="utf-8")
-    
-    with TASK_COMMENTS_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(TASK_COMMENTS_FILE)
 
 def save_task_comments_data(task_comments_data: dict):
     """Save task comments data."""
-    with TASK_COMMENTS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(task_comments_data, f, indent=2, ensure_ascii=False)
+    store_save_all(TASK_COMMENTS_FILE, task_comments_data)
 
 def load_pinned_messages_data():
     """Load pinned messages data."""
-    if not PINNED_MESSAGES_FILE.exists():
-        PINNED_MESSAGES_FILE.write_text("{}", encoding="utf-8")
-    
-    with PINNED_MESSAGES_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(PINNED_MESSAGES_FILE)
 
 def save_pinned_messages_data(pinned_messages_data: dict):
     """Save pinned messages data."""
-    with PINNED_MESSAGES_FILE.open("w", encoding="utf-8") as f:
-        json.dump(pinned_messages_data, f, indent=2, ensure_ascii=False)
+    store_save_all(PINNED_MESSAGES_FILE, pinned_messages_data)
 
 def load_task_attachments_data():
     """Load task attachments data."""
-    if not TASK_ATTACHMENTS_FILE.exists():
-        TASK_ATTACHMENTS_FILE.write_text("{}", encoding="utf-8")
-    
-    with TASK_ATTACHMENTS_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(TASK_ATTACHMENTS_FILE)
 
 def save_task_attachments_data(task_attachments_data: dict):
     """Save task attachments data."""
-    with TASK_ATTACHMENTS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(task_attachments_data, f, indent=2, ensure_ascii=False)
+    store_save_all(TASK_ATTACHMENTS_FILE, task_attachments_data)
 
 # -------------------------------------------------------------
 # Advanced Management Functions
 # -------------------------------------------------------------
 def load_projects_data():
     """Load projects data."""
-    if not PROJECTS_FILE.exists():
-        PROJECTS_FILE.write_text("{}", encoding="utf-8")
-    
-    with PROJECTS_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(PROJECTS_FILE)
 
 def save_projects_data(projects_data: dict):
     """Save projects data."""
-    with PROJECTS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(projects_data, f, indent=2, ensure_ascii=False)
+    store_save_all(PROJECTS_FILE, projects_data)
 
 def load_departments_data():
     """Load departments data."""
-    if not DEPARTMENTS_FILE.exists():
-        DEPARTMENTS_FILE.write_text("{}", encoding="utf-8")
-    
-    with DEPARTMENTS_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(DEPARTMENTS_FILE)
 
 def save_departments_data(departments_data: dict):
     """Save departments data."""
-    with DEPARTMENTS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(departments_data, f, indent=2, ensure_ascii=False)
+    store_save_all(DEPARTMENTS_FILE, departments_data)
 
 def load_performance_data():
     """Load performance reviews data."""
-    if not PERFORMANCE_FILE.exists():
-        PERFORMANCE_FILE.write_text("{}", encoding="utf-8")
-    
-    with PERFORMANCE_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(PERFORMANCE_FILE)
 
 def save_performance_data(performance_data: dict):
     """Save performance reviews data."""
-    with PERFORMANCE_FILE.open("w", encoding="utf-8") as f:
-        json.dump(performance_data, f, indent=2, ensure_ascii=False)
+    store_save_all(PERFORMANCE_FILE, performance_data)
 
 def load_budget_data():
     """Load budget tracking data."""
-    if not BUDGET_FILE.exists():
-        BUDGET_FILE.write_text("{}", encoding="utf-8")
-    
-    with BUDGET_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(BUDGET_FILE)
 
 def save_budget_data(budget_data: dict):
     """Save budget tracking data."""
-    with BUDGET_FILE.open("w", encoding="utf-8") as f:
-        json.dump(budget_data, f, indent=2, ensure_ascii=False)
+    store_save_all(BUDGET_FILE, budget_data)
 
 def load_reports_data():
     """Load reports data."""
-    if not REPORTS_FILE.exists():
-        REPORTS_FILE.write_text("{}", encoding="utf-8")
-    
-    with REPORTS_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(REPORTS_FILE)
 
 def save_reports_data(reports_data: dict):
     """Save reports data."""
-    with REPORTS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(reports_data, f, indent=2, ensure_ascii=False)
+    store_save_all(REPORTS_FILE, reports_data)
 
 def load_workflows_data():
     """Load workflows data."""
-    if not WORKFLOWS_FILE.exists():
-        WORKFLOWS_FILE.write_text("{}", encoding="utf-8")
-    
-    with WORKFLOWS_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(WORKFLOWS_FILE)
 
 def save_workflows_data(workflows_data: dict):
     """Save workflows data."""
-    with WORKFLOWS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(workflows_data, f, indent=2, ensure_ascii=False)
+    store_save_all(WORKFLOWS_FILE, workflows_data)
 
 def load_knowledge_base_data():
     """Load knowledge base data."""
-    if not KNOWLEDGE_BASE_FILE.exists():
-        KNOWLEDGE_BASE_FILE.write_text("{}", encoding="utf-8")
-    
-    with KNOWLEDGE_BASE_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(KNOWLEDGE_BASE_FILE)
 
 def save_knowledge_base_data(knowledge_base_data: dict):
     """Save knowledge base data."""
-    with KNOWLEDGE_BASE_FILE.open("w", encoding="utf-8") as f:
-        json.dump(knowledge_base_data, f, indent=2, ensure_ascii=False)
+    store_save_all(KNOWLEDGE_BASE_FILE, knowledge_base_data)
 
 def load_integrations_data():
     """Load integrations data."""
-    if not INTEGRATIONS_FILE.exists():
-        INTEGRATIONS_FILE.write_text("{}", encoding="utf-8")
-    
-    with INTEGRATIONS_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return store_load_all(INTEGRATIONS_FILE)
 
 def save_integrations_data(integrations_data: dict):
     """Save integrations data."""
-    with INTEGRATIONS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(integrations_data, f, indent=2, ensure_ascii=False)
-
-def register_user(username: str, password: str, email: str, full_name: str, role: str = "personal", company_code: Optional[str] = None) -> Tuple[bool, str]:
-    """Register a new user with enhanced role support."""
-    auth_data = load_auth_data()
-    
-    # Check if username already exists
-    if username in auth_data:
-        return False, "Username already exists!"
-    
-    # Check if email already exists
-    for user_data in auth_data.values():
-        if user_data.get("email") == email:
-            return False, "Email already registered!"
-    
-    # Validate company code if provided
-    if company_code:
-        companies_data = load_companies_data()
-        if company_code not in companies_data:
-            return False, "Invalid company code!"
-    
-    # Create new user
-    user_id = str(uuid.uuid4())
-    auth_data[username] = {
-        "user_id": user_id,
-        "password_hash": hash_password(password),
-        "email": email,
-        "full_name": full_name,
-        "role": role,
-        "company_code": company_code,
-        "created_at": get_current_timestamp(),
-        "last_login": None,
-        "active": True
-    }
-    
-    save_auth_data(auth_data)
-    
-    # Add user to company if company code provided
-    if company_code:
-        companies_data = load_companies_data()
-        if "employees" not in companies_data[company_code]:
-            companies_data[company_code]["employees"] = []
-        companies_data[company_code]["employees"].append({
-            "username": username,
-            "user_id": user_id,
-            "full_name": full_name,
-            "email": email,
-            "role": role,
-            "joined_at": get_current_timestamp(),
-            "active": True
-        })
-        save_companies_data(companies_data)
-    
-    # Create user data file
-    user_data = {
+    store_save_all(INTEGRATIONS_FILE, integrations_data)
+
+# USER_INDEX_FILE maps "username:<lower-cased username>" and "email:<lower-cased
+# email>" to {"username": ...}, so registration checks uniqueness and login
+# resolves a username or email with one lookup instead of scanning auth.json.
+# It is a single JSON snapshot (not partitioned: it is one small entry per
+# key, so a file per key would cost far more than it saves), built from
+# auth.json the first time it is needed. Registrations hold its _store_lock
+# across the uniqueness checks and claim their entries with store_put_new,
+# so two sessions or processes can't claim the same name; under SQLite the
+# claim is a plain INSERT that the primary key rejects if it lost the race.
+
+BULK_REGISTRATION_FIELDS = ["username", "email", "full_name", "password", "role"]
+
+def _user_index_entries(username: str, email: str) -> Dict[str, Dict[str, str]]:
+    """Get the user index entries of one account."""
+    entries = {f"username:{username.strip().lower()}": {"username": username}}
+    if email and email.strip():
+        entries[f"email:{email.strip().lower()}"] = {"username": username}
+    return entries
+
+def rebuild_user_index():
+    """Build the username and email index from auth.json."""
+    with _store_lock(USER_INDEX_FILE):
+        entries = {}
+        for username, user_data in load_auth_data().items():
+            for index_key, entry in _user_index_entries(username, user_data.get("email", "")).items():
+                entries.setdefault(index_key, entry)  # Keep the first of any legacy duplicates
+        store_put_many(USER_INDEX_FILE, entries)
+        if "built" not in store_get_counters(USER_INDEX_FILE, "meta"):
+            store_incr_counter(USER_INDEX_FILE, "meta", "built")
+
+def _user_index_get(index_key: str) -> Optional[str]:
+    """Look up one user index entry."""
+    if "built" not in store_get_counters(USER_INDEX_FILE, "meta"):
+        with _store_lock(USER_INDEX_FILE):
+            if "built" not in store_get_counters(USER_INDEX_FILE, "meta"):
+                rebuild_user_index()
+    entry = store_get(USER_INDEX_FILE, index_key)
+    return entry.get("username") if entry else None
+
+def is_username_taken(username: str) -> bool:
+    """Check whether a username is registered, ignoring case."""
+    return _user_index_get(f"username:{username.strip().lower()}") is not None
+
+def is_email_registered(email: str) -> bool:
+    """Check whether an email is registered, ignoring case."""
+    return _user_index_get(f"email:{email.strip().lower()}") is not None
+
+def lookup_username(login: str) -> Optional[str]:
+    """Resolve a login name (username in any case, or email) to the account's username."""
+    login = login.strip()
+    if store_get(AUTH_FILE, login) is not None:
+        return login
+    return _user_index_get(f"{'email' if '@' in login else 'username'}:{login.lower()}")
+
+def _new_user_data() -> dict:
+    """Get the contents of a new user's data file."""
+    return {
         "tasks": [],
         "notes": [],
         "contacts": [],
@@ -687,23 +2596,156 @@ def register_user(username: str, password: str, email: str, full_name: str, role
             "show_team_tasks": True
         }
     }
+
+def _new_account(username: str, password: str, email: str, full_name: str, role: str,
+                 company_code: Optional[str]) -> Tuple[dict, dict]:
+    """Build the auth record and company employee entry of a new account."""
+    user_id = str(uuid.uuid4())
+    auth_record = {
+        "user_id": user_id,
+        "password_hash": hash_password(password),
+        "email": email,
+        "full_name": full_name,
+        "role": role,
+        "company_code": company_code,
+        "created_at": get_current_timestamp(),
+        "last_login": None,
+        "active": True
+    }
+    employee = {
+        "username": username,
+        "user_id": user_id,
+        "full_name": full_name,
+        "email": email,
+        "role": role,
+        "joined_at": get_current_timestamp(),
+        "active": True
+    }
+    return auth_record, employee
+
+def _write_new_user_file(username: str):
+    """Create a new user's data file."""
+    _write_new_user_data(username, _new_user_data())
+
+def register_user(username: str, password: str, email: str, full_name: str, role: str = "personal", company_code: Optional[str] = None) -> Tuple[bool, str]:
+    """Register a new user with enhanced role support."""
+    with _store_lock(USER_INDEX_FILE):
+        # Check if username already exists
+        if store_get(AUTH_FILE, username) is not None or is_username_taken(username):
+            return False, "Username already exists!"
+        
+        # Check if email already exists
+        if is_email_registered(email):
+            return False, "Email already registered!"
+        
+        # Validate company code if provided
+        if company_code:
+            if store_get(COMPANIES_FILE, company_code) is None:
+                return False, "Invalid company code!"
+        
+        # Create new user, claiming the name and email first
+        if not store_put_new(USER_INDEX_FILE, _user_index_entries(username, email)):
+            return False, "Username or email already registered!"
+        auth_record, employee = _new_account(username, password, email, full_name, role, company_code)
+        store_put(AUTH_FILE, username, auth_record)
+        
+        # Add user to company if company code provided
+        if company_code:
+            company_data = store_get(COMPANIES_FILE, company_code)
+            if "employees" not in company_data:
+                company_data["employees"] = []
+            company_data["employees"].append(employee)
+            store_put(COMPANIES_FILE, company_code, company_data)
+    
+    if company_code:
+        reindex_company_member(company_code, username)
     
-    user_file = Path(f"user_{username}.json")
-    with user_file.open("w", encoding="utf-8") as f:
-        json.dump(user_data, f, indent=2, ensure_ascii=False)
+    # Create user data file
+    _write_new_user_file(username)
     
     return True, "Registration successful!"
 
+def bulk_register_users(csv_text: str, company_code: str, added_by: str,
+                        default_role: str = "employee") -> Tuple[List[str], List[str]]:
+    """Register a CSV of employees into a company, all or nothing.
+    
+    The CSV needs a header row with username, email, full_name and password
+    columns, plus an optional role column (default_role when blank). Every
+    row is checked first, against the existing accounts and against the
+    other rows, and its role against ROLE_HIERARCHY and what added_by may
+    assign (can_manage_role); if any fails nothing is written. Otherwise auth.json, the
+    user index and the company's employee list are each written once.
+    Returns (registered usernames, errors).
+    """
+    reader = csv.DictReader(io.StringIO(csv_text.lstrip("\ufeff")))
+    missing = [field for field in BULK_REGISTRATION_FIELDS[:4] if field not in (reader.fieldnames or [])]
+    if missing:
+        return [], [f"Missing column(s): {', '.join(missing)}"]
+    rows = [{field: (row.get(field) or "").strip() for field in BULK_REGISTRATION_FIELDS} for row in reader]
+    for row in rows:
+        row["role"] = (row["role"] or default_role).lower()
+    added_by_role = get_user_info(added_by).get("role", "employee")
+    
+    with _store_lock(USER_INDEX_FILE):
+        company_data = store_get(COMPANIES_FILE, company_code)
+        if company_data is None:
+            return [], ["Invalid company code!"]
+        
+        errors = []
+        seen = set()
+        for line, row in enumerate(rows, start=2):
+            username, email = row["username"], row["email"]
+            if not all([username, email, row["full_name"], row["password"]]):
+                errors.append(f"Row {line}: username, email, full_name and password are required")
+                continue
+            if len(row["password"]) < 6:
+                errors.append(f"Row {line}: password must be at least 6 characters long")
+            if row["role"] not in ROLE_HIERARCHY:
+                errors.append(f"Row {line}: unknown role '{row['role']}'")
+            elif not can_manage_role(added_by_role, row["role"]):
+                errors.append(f"Row {line}: you can't add employees with role '{row['role']}'")
+            if store_get(AUTH_FILE, username) is not None or is_username_taken(username):
+                errors.append(f"Row {line}: username '{username}' already exists")
+            if is_email_registered(email):
+                errors.append(f"Row {line}: email '{email}' already registered")
+            for index_key in _user_index_entries(username, email):
+                if index_key in seen:
+                    errors.append(f"Row {line}: {index_key.split(':', 1)[0]} '{index_key.split(':', 1)[1]}' appears more than once")
+                seen.add(index_key)
+        if errors:
+            return [], errors
+        
+        auth_records = {}
+        index_entries = {}
+        employees = []
+        for row in rows:
+            auth_record, employee = _new_account(row["username"], row["password"], row["email"], row["full_name"],
+                                                 row["role"], company_code)
+            auth_records[row["username"]] = auth_record
+            index_entries.update(_user_index_entries(row["username"], row["email"]))
+            employees.append(employee)
+        
+        if not store_put_new(USER_INDEX_FILE, index_entries):
+            return [], ["A username or email was registered by someone else meanwhile; please retry"]
+        store_put_many(AUTH_FILE, auth_records)
+        company_data.setdefault("employees", []).extend(employees)
+        store_put(COMPANIES_FILE, company_code, company_data)
+    
+    index_search_documents(company_code, [_member_search_doc(employee) for employee in employees])
+    for username in auth_records:
+        _write_new_user_file(username)
+    
+    return list(auth_records), []
+
 def create_company(company_name: str, description: str, admin_username: str) -> tuple[bool, str]:
     """Create a new company."""
-    companies_data = load_companies_data()
     company_code = generate_company_code()
     
     # Ensure unique company code
-    while company_code in companies_data:
+    while store_get(COMPANIES_FILE, company_code) is not None:
         company_code = generate_company_code()
     
-    companies_data[company_code] = {
+    store_put(COMPANIES_FILE, company_code, {
         "name": company_name,
         "description": description,
         "admin_username": admin_username,
@@ -715,19 +2757,17 @@ def create_company(company_name: str, description: str, admin_username: str) ->
             "require_approval": False,
             "default_employee_role": "employee"
         }
-    }
+    })
     
-    save_companies_data(companies_data)
     return True, company_code
 
 def authenticate_user(username: str, password: str) -> tuple[bool, str]:
     """Authenticate a user."""
-    auth_data = load_auth_data()
+    user_data = store_get(AUTH_FILE, username)
     
-    if username not in auth_data:
+    if user_data is None:
         return False, "Username not found!"
     
-    user_data = auth_data[username]
     if not user_data.get("active", True):
         return False, "Account is deactivated!"
     
@@ -735,15 +2775,14 @@ def authenticate_user(username: str, password: str) -> tuple[bool, str]:
         return False, "Invalid password!"
     
     # Update last login
-    auth_data[username]["last_login"] = get_current_timestamp()
-    save_auth_data(auth_data)
+    user_data["last_login"] = get_current_timestamp()
+    store_put(AUTH_FILE, username, user_data)
     
     return True, "Login successful!"
 
 def get_user_info(username: str) -> dict:
     """Get user information."""
-    auth_data = load_auth_data()
-    return auth_data.get(username, {})
+    return store_get(AUTH_FILE, username, {})
 
 def get_user_company_info(username: str) -> dict:
     """Get user's company information."""
@@ -753,8 +2792,7 @@ def get_user_company_info(username: str) -> dict:
     if not company_code:
         return {}
     
-    companies_data = load_companies_data()
-    company_data = companies_data.get(company_code, {})
+    company_data = store_get(COMPANIES_FILE, company_code, {})
     
     # Add the company code to the returned data
     if company_data:
@@ -764,8 +2802,7 @@ def get_user_company_info(username: str) -> dict:
 
 def get_company_employees(company_code: str) -> list:
     """Get all employees of a company."""
-    companies_data = load_companies_data()
-    company_data = companies_data.get(company_code, {})
+    company_data = store_get(COMPANIES_FILE, company_code, {})
     return company_data.get("employees", [])
 
 def is_admin_or_manager(username: str) -> bool:
@@ -885,6 +2922,17 @@ def get_notification_color(notification_type: str) -> str:
     }
     return colors.get(notification_type, "#2196F3")
 
+def _digest_items_html(notification: dict) -> str:
+    """Render the notifications folded into a digest (empty for a plain notification)."""
+    items = notification.get("digest_items")
+    if not items:
+        return ""
+    
+    shown = "".join(f"<li><strong>{item.get('title', '')}</strong>: {item.get('message', '')}</li>" for item in reversed(items))
+    older = notification.get("digest_count", len(items)) - len(items)
+    more = f"<li>... and {older} earlier</li>" if older > 0 else ""
+    return f"<ul>{shown}{more}</ul>"
+
 def show_notification_popup(notification: dict):
     """Show a notification popup with sound."""
     notification_type = notification.get("type", "info")
@@ -1016,8 +3064,9 @@ def check_and_show_new_notifications(username: str):
     if "shown_notifications" not in st.session_state:
         st.session_state["shown_notifications"] = set()
     
-    notifications = get_user_notifications(username)
-    unread_notifications = [n for n in notifications if not n.get("read", False)]
+    if get_unread_notification_count(username) == 0:
+        return
+    unread_notifications, _ = query_notifications(username, page_size=20, read=False)
     
     # Get user settings
     user_data = load_data()
@@ -1029,8 +3078,8 @@ def check_and_show_new_notifications(username: str):
     if not notifications_enabled:
         return
     
-    # Show popups for new unread notifications
-    for notification in unread_notifications:
+    # Show popups for new unread notifications, oldest first
+    for notification in reversed(unread_notifications):
         notification_id = notification.get("id")
         if notification_id not in st.session_state["shown_notifications"]:
             if popup_enabled:
@@ -1042,94 +3091,234 @@ def check_and_show_new_notifications(username: str):
                 show_notification_popup(notification_with_sound)
             st.session_state["shown_notifications"].add(notification_id)
 
-def enhanced_send_notification(to_username: str, title: str, message: str, notification_type: str = "info", from_username: Optional[str] = None, priority: str = "normal"):
+def enhanced_send_notification(to_username: str, title: str, message: str, notification_type: str = "info", from_username: Optional[str] = None, priority: str = "normal",
+                               source: Optional[str] = None, source_name: Optional[str] = None):
     """Enhanced notification function with priority and better categorization."""
-    notifications_data = load_notifications_data()
+    send_bulk_notification([to_username], title, message, notification_type, from_username, priority,
+                           source=source, source_name=source_name)
+
+# What a digest of each notification type is called ("12 new messages from X")
+DIGEST_NOUNS = {
+    "chat": "messages",
+    "task": "task updates",
+    "file": "file updates",
+    "poll": "poll updates",
+    "calendar": "calendar updates",
+    "project": "project updates"
+}
+
+def _find_digest_target(to_username: str, notification: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Find the unread notification a new one should be coalesced into, if any."""
+    if not notification.get("source"):
+        return None
+    
+    latest, _ = query_notifications(to_username, page_size=1, notification_type=notification["type"], read=False)
+    if not latest or latest[0].get("source") != notification["source"]:
+        return None
     
-    if to_username not in notifications_data:
-        notifications_data[to_username] = []
+    digest_since = latest[0].get("digest_since", latest[0].get("timestamp", 0))
+    if notification["timestamp"] - digest_since > NOTIFICATION_DIGEST_WINDOW_SECONDS:
+        return None
+    return latest[0]
+
+def _coalesce_notification(to_username: str, target: Dict[str, Any], notification: Dict[str, Any]) -> bool:
+    """Fold a notification into an unread one from the same source as a digest.
     
-    notification = {
-        "id": str(uuid.uuid4()),
+    Returns False, leaving the target alone, if it was read or folded into
+    by another delivery since it was found.
+    """
+    merged_ids = target.get("merged_ids", [target["id"]])
+    digest_count = target.get("digest_count", 1) + 1
+    noun = DIGEST_NOUNS.get(notification["type"], "notifications")
+    digest_items = target.get("digest_items", [{"title": target.get("title", ""), "message": target.get("message", "")}])
+    digest_items = (digest_items + [{"title": notification["title"], "message": notification["message"]}])[-NOTIFICATION_DIGEST_ITEMS_KEPT:]
+    return store_update_record(NOTIFICATIONS_FILE, to_username, target["id"], {
+        "message": f"{digest_count} new {noun} from {notification.get('source_name') or notification['source']}",
+        "digest_count": digest_count,
+        "digest_items": digest_items,
+        "digest_since": target.get("digest_since", target.get("timestamp", notification["timestamp"])),
+        "merged_ids": merged_ids + [notification["id"]],
+        "created_at": notification["created_at"],
+        "timestamp": notification["timestamp"]
+    }, only_if=lambda current: not current.get("read", False) and current.get("merged_ids") == target.get("merged_ids"))
+
+def send_bulk_notification(to_usernames: List[str], title: str, message: str, notification_type: str = "info",
+                           from_username: Optional[str] = None, priority: str = "normal",
+                           delivery_id: Optional[str] = None, source: Optional[str] = None,
+                           source_name: Optional[str] = None) -> int:
+    """Send the same notification to many users with a single store write.
+    
+    When a delivery_id is given, notification ids are derived from it so that
+    delivering the same batch again does not create duplicates. A notification
+    whose source (from_username, or `source` when given) matches the user's
+    latest unread one of the same type within NOTIFICATION_DIGEST_WINDOW_SECONDS
+    is folded into it as a digest instead of being added; source_name is what
+    the digest calls the source (default: source itself).
+    """
+    created_at = get_current_timestamp()
+    timestamp = time.time()
+    source_name = source_name or source
+    if source is None and from_username:
+        source = from_username
+        source_name = get_user_info(from_username).get("full_name", from_username)
+    
+    notifications = []
+    coalesced = 0
+    for to_username in dict.fromkeys(to_usernames):
+        if delivery_id:
+            notification_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"nafup:{delivery_id}:{to_username}"))
+        else:
+            notification_id = str(uuid.uuid4())
+        notification = {
+            "id": notification_id,
+            "title": title,
+            "message": message,
+            "type": notification_type,
+            "from_username": from_username,
+            "source": source,
+            "source_name": source_name,
+            "created_at": created_at,
+            "read": False,
+            "priority": priority,
+            "timestamp": timestamp
+        }
+        
+        target = _find_digest_target(to_username, notification)
+        if target is not None and notification_id in target.get("merged_ids", [target["id"]]):
+            continue  # Redelivery of a notification already in the digest
+        if target is not None and _coalesce_notification(to_username, target, notification):
+            coalesced += 1
+        else:
+            notifications.append((to_username, notification))
+    
+    with _store_lock(NOTIFICATIONS_FILE):
+        notifications = store_append_many(NOTIFICATIONS_FILE, notifications, skip_existing=bool(delivery_id))
+        for to_username, _ in notifications:
+            store_incr_counter(NOTIFICATIONS_FILE, to_username, "unread")
+    
+    # Show popup immediately if user is currently logged in
+    current_username = st.session_state.get("username")
+    for to_username, notification in notifications:
+        if to_username == current_username:
+            _show_notification_popup_for_current_user(notification)
+    
+    return len(notifications) + coalesced
+
+def queue_bulk_notification(to_usernames: List[str], title: str, message: str, notification_type: str = "info",
+                            from_username: Optional[str] = None, priority: str = "normal",
+                            source: Optional[str] = None, source_name: Optional[str] = None) -> Optional[str]:
+    """Queue a notification fan-out for the background worker; returns the job id."""
+    to_usernames = [to_username for to_username in dict.fromkeys(to_usernames) if to_username]
+    if not to_usernames:
+        return None
+    
+    return enqueue_job("notify", {
+        "to_usernames": to_usernames,
         "title": title,
         "message": message,
-        "type": notification_type,
+        "notification_type": notification_type,
         "from_username": from_username,
-        "created_at": get_current_timestamp(),
-        "read": False,
         "priority": priority,
-        "timestamp": time.time()
-    }
-    
-    notifications_data[to_username].append(notification)
-    save_notifications_data(notifications_data)
-    
-    # Show popup immediately if user is currently logged in
-    if "username" in st.session_state and st.session_state["username"] == to_username:
-        user_data = load_data()
-        settings = user_data.get("settings", {})
-        if settings.get("notifications", True) and settings.get("notification_popup", True):
-            # Create a modified notification that respects sound settings
-            notification_with_sound = notification.copy()
-            if not settings.get("notification_sound", True):
-                notification_with_sound["_disable_sound"] = True
-            show_notification_popup(notification_with_sound)
+        "source": source,
+        "source_name": source_name
+    })
+
+def _run_notify_job(job_id: str, payload: Dict[str, Any]):
+    """Deliver a queued notification fan-out."""
+    send_bulk_notification(
+        payload["to_usernames"],
+        payload["title"],
+        payload["message"],
+        payload.get("notification_type", "info"),
+        payload.get("from_username"),
+        payload.get("priority", "normal"),
+        delivery_id=job_id,
+        source=payload.get("source"),
+        source_name=payload.get("source_name")
+    )
+
+JOB_HANDLERS["notify"] = _run_notify_job
+
+def _show_notification_popup_for_current_user(notification: dict):
+    """Show a popup for a notification addressed to the logged-in user, honoring their settings."""
+    user_data = load_data()
+    settings = user_data.get("settings", {})
+    if settings.get("notifications", True) and settings.get("notification_popup", True):
+        # Create a modified notification that respects sound settings
+        notification_with_sound = notification.copy()
+        if not settings.get("notification_sound", True):
+            notification_with_sound["_disable_sound"] = True
+        show_notification_popup(notification_with_sound)
 
 # -------------------------------------------------------------
 # Enhanced Notification Functions for Different Types
 # -------------------------------------------------------------
 
-def send_task_notification(to_username: str, task_title: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
-    """Send task-related notification."""
+def _deliver_notification(to_username: Union[str, List[str]], title: str, message: str, notification_type: str,
+                          from_username: Optional[str], priority: str, source: Optional[str] = None,
+                          source_name: Optional[str] = None):
+    """Send to one user right away, or queue a fan-out to a list of users."""
+    if isinstance(to_username, str):
+        enhanced_send_notification(to_username, title, message, notification_type, from_username, priority,
+                                   source, source_name)
+    else:
+        queue_bulk_notification(list(to_username), title, message, notification_type, from_username, priority,
+                                source, source_name)
+
+def send_task_notification(to_username: Union[str, List[str]], task_title: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
+    """Send task-related notification to one user or a list of users."""
     title = f"Task {action.title()}"
     message = f"Task '{task_title}' has been {action}"
     if from_username:
         message += f" by {get_user_info(from_username).get('full_name', from_username)}"
     
-    enhanced_send_notification(to_username, title, message, "task", from_username, priority)
+    _deliver_notification(to_username, title, message, "task", from_username, priority)
 
-def send_file_notification(to_username: str, file_name: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
-    """Send file-related notification."""
+def send_file_notification(to_username: Union[str, List[str]], file_name: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
+    """Send file-related notification to one user or a list of users."""
     title = f"File {action.title()}"
     message = f"File '{file_name}' has been {action}"
     if from_username:
         message += f" by {get_user_info(from_username).get('full_name', from_username)}"
     
-    enhanced_send_notification(to_username, title, message, "file", from_username, priority)
+    _deliver_notification(to_username, title, message, "file", from_username, priority)
 
-def send_poll_notification(to_username: str, poll_question: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
-    """Send poll-related notification."""
+def send_poll_notification(to_username: Union[str, List[str]], poll_question: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
+    """Send poll-related notification to one user or a list of users."""
     title = f"Poll {action.title()}"
     message = f"Poll '{poll_question[:50]}{'...' if len(poll_question) > 50 else ''}' has been {action}"
     if from_username:
         message += f" by {get_user_info(from_username).get('full_name', from_username)}"
     
-    enhanced_send_notification(to_username, title, message, "poll", from_username, priority)
+    _deliver_notification(to_username, title, message, "poll", from_username, priority)
 
-def send_calendar_notification(to_username: str, event_title: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
-    """Send calendar-related notification."""
+def send_calendar_notification(to_username: Union[str, List[str]], event_title: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
+    """Send calendar-related notification to one user or a list of users."""
     title = f"Calendar Event {action.title()}"
     message = f"Event '{event_title}' has been {action}"
     if from_username:
         message += f" by {get_user_info(from_username).get('full_name', from_username)}"
     
-    enhanced_send_notification(to_username, title, message, "calendar", from_username, priority)
+    _deliver_notification(to_username, title, message, "calendar", from_username, priority)
 
-def send_chat_notification(to_username: str, sender_name: str, message_preview: str, priority: str = "normal"):
-    """Send chat-related notification."""
+def send_chat_notification(to_username: Union[str, List[str]], sender_name: str, message_preview: str, priority: str = "normal",
+                           sender_username: Optional[str] = None):
+    """Send chat-related notification to one user or a list of users."""
     title = f"New Message from {sender_name}"
     message = f"{message_preview[:100]}{'...' if len(message_preview) > 100 else ''}"
     
-    enhanced_send_notification(to_username, title, message, "chat", None, priority)
+    # Digests are keyed by the sender's username; two people can share a name
+    _deliver_notification(to_username, title, message, "chat", None, priority,
+                          source=sender_username or sender_name, source_name=sender_name)
 
-def send_project_notification(to_username: str, project_name: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
-    """Send project-related notification."""
+def send_project_notification(to_username: Union[str, List[str]], project_name: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
+    """Send project-related notification to one user or a list of users."""
     title = f"Project {action.title()}"
     message = f"Project '{project_name}' has been {action}"
     if from_username:
         message += f" by {get_user_info(from_username).get('full_name', from_username)}"
     
-    enhanced_send_notification(to_username, title, message, "project", from_username, priority)
+    _deliver_notification(to_username, title, message, "project", from_username, priority)
 
 def send_performance_notification(to_username: str, action: str, from_username: Optional[str] = None, priority: str = "normal"):
     """Send performance-related notification."""
@@ -1147,20 +3336,130 @@ def send_notification(to_username: str, title: str, message: str, notification_t
 
 def get_user_notifications(username: str) -> list:
     """Get notifications for a user."""
-    notifications_data = load_notifications_data()
-    return notifications_data.get(username, [])
+    return store_get(NOTIFICATIONS_FILE, username, [])
+
+def query_notifications(username: str, page_size: int = 20, cursor: Optional[Dict[str, Any]] = None,
+                        notification_type: Optional[str] = None,
+                        read: Optional[bool] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Get one page of a user's notifications, newest first, and the cursor for the next page."""
+    return store_query(NOTIFICATIONS_FILE, username, {"type": notification_type, "read": read},
+                       limit=page_size, cursor=cursor)
+
+def count_notifications(username: str, notification_type: Optional[str] = None, read: Optional[bool] = None) -> int:
+    """Count a user's notifications, optionally by type and read state."""
+    return store_count(NOTIFICATIONS_FILE, username, {"type": notification_type, "read": read})
+
+# Every change to a user's notifications that moves the "unread" counter
+# makes the change and its counter update under _store_lock(NOTIFICATIONS_FILE),
+# so a recount, which holds the same lock, sees both or neither and can write
+# the counter as an absolute value.
+
+def get_unread_notification_count(username: str) -> int:
+    """Get a user's unread notification count from the stored counter."""
+    counters = store_get_counters(NOTIFICATIONS_FILE, username)
+    if "unread" not in counters:
+        # No counter yet (notifications from before counters existed)
+        return reconcile_unread_notification_count(username, only_if_missing=True)
+    return max(0, counters["unread"])
+
+def reconcile_unread_notification_count(username: str, only_if_missing: bool = False) -> int:
+    """Recount a user's unread notifications and correct the stored counter."""
+    with _store_lock(NOTIFICATIONS_FILE):
+        stored_count = store_get_counters(NOTIFICATIONS_FILE, username).get("unread")
+        if only_if_missing and stored_count is not None:
+            return max(0, stored_count)  # Another session counted first
+        unread_count = count_notifications(username, read=False)
+        if stored_count != unread_count:
+            store_set_counters(NOTIFICATIONS_FILE, username, {"unread": unread_count})
+    return unread_count
+
+def _run_reconcile_unread_job(job_id: str, payload: Dict[str, Any]):
+    """Background job: recount every user's unread notifications."""
+    for username in store_keys(NOTIFICATIONS_FILE):
+        reconcile_unread_notification_count(username)
+
+JOB_HANDLERS["reconcile_unread"] = _run_reconcile_unread_job
+PERIODIC_JOBS["reconcile_unread"] = NOTIFICATION_RECONCILE_SECONDS
+
+def _notification_time(notification: Dict[str, Any]) -> float:
+    """Get when a notification was sent as a Unix timestamp."""
+    if notification.get("timestamp"):
+        return notification["timestamp"]
+    try:
+        return datetime.datetime.strptime(notification.get("created_at", ""), "%Y-%m-%d %H:%M:%S").timestamp()
+    except ValueError:
+        return time.time()  # Unknown age; keep it
+
+def compact_notifications(username: str) -> int:
+    """Apply the retention limits to one user's notifications; returns how many were removed."""
+    with _store_lock(NOTIFICATIONS_FILE):
+        notifications = store_get(NOTIFICATIONS_FILE, username)
+        if not notifications:
+            return 0
+        
+        cutoff = time.time() - NOTIFICATION_MAX_AGE_DAYS * 86400
+        kept = [n for n in notifications if _notification_time(n) >= cutoff]
+        if len(kept) > NOTIFICATION_MAX_PER_USER:
+            newest = sorted(kept, key=lambda n: (str(n.get("created_at", "")), str(n.get("id", ""))))
+            newest_ids = {n.get("id") for n in newest[-NOTIFICATION_MAX_PER_USER:]}
+            kept = [n for n in kept if n.get("id") in newest_ids]
+        
+        removed = len(notifications) - len(kept)
+        if removed:
+            store_put(NOTIFICATIONS_FILE, username, kept)
+            reconcile_unread_notification_count(username)
+    return removed
+
+def _run_compact_notifications_job(job_id: str, payload: Dict[str, Any]):
+    """Background job: apply the retention limits to every user's notifications."""
+    for username in store_keys(NOTIFICATIONS_FILE):
+        compact_notifications(username)
+
+JOB_HANDLERS["compact_notifications"] = _run_compact_notifications_job
+PERIODIC_JOBS["compact_notifications"] = NOTIFICATION_COMPACT_SECONDS
 
 def mark_notification_read(username: str, notification_id: str):
     """Mark a notification as read."""
-    notifications_data = load_notifications_data()
-    user_notifications = notifications_data.get(username, [])
-    
-    for notification in user_notifications:
-        if notification.get("id") == notification_id:
+    # Only the session whose update flips the flag counts it
+    with _store_lock(NOTIFICATIONS_FILE):
+        if store_update_record(NOTIFICATIONS_FILE, username, notification_id, {"read": True},
+                               only_if=lambda notification: not notification.get("read", False)):
+            store_incr_counter(NOTIFICATIONS_FILE, username, "unread", -1)
+
+def mark_all_notifications_read(username: str):
+    """Mark all of a user's notifications as read."""
+    with _store_lock(NOTIFICATIONS_FILE):
+        notifications = store_get(NOTIFICATIONS_FILE, username)
+        if notifications is None:
+            return
+        for notification in notifications:
             notification["read"] = True
-            break
-    
-    save_notifications_data(notifications_data)
+        store_put(NOTIFICATIONS_FILE, username, notifications)
+        reconcile_unread_notification_count(username)
+
+def delete_notification(username: str, notification_id: str) -> bool:
+    """Delete one of a user's notifications."""
+    with _store_lock(NOTIFICATIONS_FILE):
+        notification = store_get_record(NOTIFICATIONS_FILE, username, notification_id)
+        if notification is None or not store_delete_record(NOTIFICATIONS_FILE, username, notification_id):
+            return False
+        if not notification.get("read", False):
+            store_incr_counter(NOTIFICATIONS_FILE, username, "unread", -1)
+    return True
+
+def delete_read_notifications(username: str):
+    """Delete all of a user's read notifications."""
+    with _store_lock(NOTIFICATIONS_FILE):
+        notifications = store_get(NOTIFICATIONS_FILE, username)
+        if notifications is not None:
+            store_put(NOTIFICATIONS_FILE, username, [n for n in notifications if not n.get("read", False)])
+
+def delete_all_notifications(username: str):
+    """Delete all of a user's notifications."""
+    with _store_lock(NOTIFICATIONS_FILE):
+        if store_get(NOTIFICATIONS_FILE, username) is not None:
+            store_put(NOTIFICATIONS_FILE, username, [])
+            reconcile_unread_notification_count(username)
 
 # Role hierarchy for company positions
 ROLE_HIERARCHY = {
@@ -1195,15 +3494,10 @@ def can_manage_role(manager_role: str, target_role: str) -> bool:
 def send_chat_message(company_code: str, from_username: str, message: str, message_type: str = "text"):
     """Send a chat message to company chat."""
     # Validate message content
-    message_valid, message_error = validate_content(message)
+    message_valid, message_error = validate_content(message, company_code)
     if not message_valid:
         return False, message_error
     
-    chat_data = load_chat_data()
-    
-    if company_code not in chat_data:
-        chat_data[company_code] = []
-    
     user_info = get_user_info(from_username)
     
     chat_message = {
@@ -1218,66 +3512,72 @@ def send_chat_message(company_code: str, from_username: str, message: str, messa
         "deleted": False
     }
     
-    chat_data[company_code].append(chat_message)
-    save_chat_data(chat_data)
-    return True, "Message sent successfully"
+    store_append(CHAT_FILE, company_code, chat_message)
+    index_search_documents(company_code, [_chat_search_doc(chat_message)])
     
-    # Send enhanced chat notifications to all company members
+    # Send enhanced chat notifications to all company members (delivered in the background)
     employees = get_company_employees(company_code)
-    for employee in employees:
-        if employee.get("username") != from_username:
-            send_chat_notification(
-                employee.get("username"),
-                user_info.get('full_name', from_username),
-                message,
-                "normal"
-            )
+    send_chat_notification(
+        [employee.get("username") for employee in employees if employee.get("username") != from_username],
+        user_info.get('full_name', from_username),
+        message,
+        "normal",
+        sender_username=from_username
+    )
+    
+    return True, "Message sent successfully"
+
+def _is_live_message(message: Dict[str, Any]) -> bool:
+    """Check whether a chat message has not been deleted."""
+    return not message.get("deleted", False)
 
 def get_company_chat_messages(company_code: str, limit: int = 50) -> List[Dict[str, Any]]:
     """Get recent chat messages for a company."""
-    chat_data = load_chat_data()
-    messages = chat_data.get(company_code, [])
-    
-    # Filter out deleted messages and return recent ones
-    active_messages = [msg for msg in messages if not msg.get("deleted", False)]
-    return active_messages[-limit:]
+    messages, _ = get_company_chat_page(company_code, limit)
+    return messages
+
+def get_company_chat_page(company_code: str, limit: int = 50,
+                          cursor: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Get a page of company chat messages, newest page first, and a cursor for older ones."""
+    return store_tail(CHAT_FILE, company_code, limit, cursor, _is_live_message)
 
 def edit_chat_message(company_code: str, message_id: str, new_message: str, editor_username: str) -> bool:
     """Edit a chat message (only by original author)."""
-    chat_data = load_chat_data()
-    messages = chat_data.get(company_code, [])
-    
-    for message in messages:
-        if message.get("id") == message_id:
-            # Only original author can edit their own message
-            if message.get("from_username") == editor_username:
-                message["message"] = new_message
-                message["edited"] = True
-                message["edited_by"] = editor_username
-                message["edited_at"] = get_current_timestamp()
-                save_chat_data(chat_data)
-                return True
-            return False
+    message = store_get_record(CHAT_FILE, company_code, message_id)
     
-    return False
+    # Only original author can edit their own message
+    if message is None or message.get("from_username") != editor_username:
+        return False
+    
+    fields = {
+        "message": new_message,
+        "edited": True,
+        "edited_by": editor_username,
+        "edited_at": get_current_timestamp()
+    }
+    if not store_update_record(CHAT_FILE, company_code, message_id, fields):
+        return False
+    
+    index_search_documents(company_code, [_chat_search_doc(dict(message, **fields))])
+    return True
 
 def delete_chat_message(company_code: str, message_id: str, deleter_username: str) -> bool:
     """Delete a chat message (only by original author)."""
-    chat_data = load_chat_data()
-    messages = chat_data.get(company_code, [])
-    
-    for message in messages:
-        if message.get("id") == message_id:
-            # Only original author can delete their own message
-            if message.get("from_username") == deleter_username:
-                message["deleted"] = True
-                message["deleted_by"] = deleter_username
-                message["deleted_at"] = get_current_timestamp()
-                save_chat_data(chat_data)
-                return True
-            return False
+    message = store_get_record(CHAT_FILE, company_code, message_id)
     
-    return False
+    # Only original author can delete their own message
+    if message is None or message.get("from_username") != deleter_username:
+        return False
+    
+    if not store_update_record(CHAT_FILE, company_code, message_id, {
+        "deleted": True,
+        "deleted_by": deleter_username,
+        "deleted_at": get_current_timestamp()
+    }):
+        return False
+    
+    remove_search_documents(company_code, [f"chat:{message_id}"])
+    return True
 
 def change_user_role(company_code: str, target_username: str, new_role: str, changer_username: str) -> Tuple[bool, str]:
     """Change a user's role in the company."""
@@ -1296,19 +3596,20 @@ def change_user_role(company_code: str, target_username: str, new_role: str, cha
         return False, "You don't have permission to change this user's role!"
     
     # Update user role
-    auth_data = load_auth_data()
-    if target_username in auth_data:
-        auth_data[target_username]["role"] = new_role
-        save_auth_data(auth_data)
+    target_record = store_get(AUTH_FILE, target_username)
+    if target_record is not None:
+        target_record["role"] = new_role
+        store_put(AUTH_FILE, target_username, target_record)
         
         # Update in company data
-        companies_data = load_companies_data()
-        if company_code in companies_data:
-            for employee in companies_data[company_code].get("employees", []):
+        company_data = store_get(COMPANIES_FILE, company_code)
+        if company_data is not None:
+            for employee in company_data.get("employees", []):
                 if employee.get("username") == target_username:
                     employee["role"] = new_role
                     break
-            save_companies_data(companies_data)
+            store_put(COMPANIES_FILE, company_code, company_data)
+            reindex_company_member(company_code, target_username)
         
         # Send enhanced role change notification
         enhanced_send_notification(
@@ -1331,19 +3632,19 @@ def add_custom_role(company_code: str, role_name: str, role_level: int, creator_
     if not creator_info or creator_info.get("role") not in ["admin", "ceo", "cfo", "cto"]:
         return False, "Only admins can add custom roles!"
     
-    companies_data = load_companies_data()
-    if company_code in companies_data:
-        if "custom_roles" not in companies_data[company_code]:
-            companies_data[company_code]["custom_roles"] = {}
+    company_data = store_get(COMPANIES_FILE, company_code)
+    if company_data is not None:
+        if "custom_roles" not in company_data:
+            company_data["custom_roles"] = {}
         
-        companies_data[company_code]["custom_roles"][role_name.lower()] = {
+        company_data["custom_roles"][role_name.lower()] = {
             "name": role_name,
             "level": role_level,
             "created_by": creator_username,
             "created_at": get_current_timestamp()
         }
         
-        save_companies_data(companies_data)
+        store_put(COMPANIES_FILE, company_code, company_data)
         return True, f"Custom role '{role_name}' added successfully!"
     
     return False, "Company not found!"
@@ -1357,11 +3658,6 @@ def get_chat_pair_key(user1: str, user2: str) -> str:
 
 def send_private_message(from_username: str, to_username: str, message: str, message_type: str = "text") -> bool:
     """Send a private message between two users."""
-    # Validate message content
-    message_valid, message_error = validate_content(message)
-    if not message_valid:
-        return False
-    
     # Check if both users are in the same company
     from_user_info = get_user_info(from_username)
     to_user_info = get_user_info(to_username)
@@ -1375,11 +3671,12 @@ def send_private_message(from_username: str, to_username: str, message: str, mes
     if from_company != to_company:
         return False  # Users must be in the same company
     
-    private_chat_data = load_private_chat_data()
-    pair_key = get_chat_pair_key(from_username, to_username)
+    # Validate message content
+    message_valid, message_error = validate_content(message, from_company)
+    if not message_valid:
+        return False
     
-    if pair_key not in private_chat_data:
-        private_chat_data[pair_key] = []
+    pair_key = get_chat_pair_key(from_username, to_username)
     
     chat_message = {
         "id": str(uuid.uuid4()),
@@ -1394,48 +3691,47 @@ def send_private_message(from_username: str, to_username: str, message: str, mes
         "deleted": False
     }
     
-    private_chat_data[pair_key].append(chat_message)
-    save_private_chat_data(private_chat_data)
+    store_append(PRIVATE_CHAT_FILE, pair_key, chat_message)
+    for search_key in _private_search_keys(from_username, to_username, from_company):
+        index_search_documents(search_key, [_private_search_doc(chat_message)])
     
     # Send enhanced private message notification
     send_chat_notification(
         to_username,
         from_user_info.get('full_name', from_username),
         message,
-        "normal"
+        "normal",
+        sender_username=from_username
     )
     
     return True
 
 def get_private_messages(user1: str, user2: str, limit: int = 50) -> List[Dict[str, Any]]:
     """Get private messages between two users."""
-    private_chat_data = load_private_chat_data()
+    messages, _ = get_private_message_page(user1, user2, limit)
+    return messages
+
+def get_private_message_page(user1: str, user2: str, limit: int = 50,
+                             cursor: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Get a page of private messages, newest page first, and a cursor for older ones."""
     pair_key = get_chat_pair_key(user1, user2)
-    messages = private_chat_data.get(pair_key, [])
-    
-    # Filter out deleted messages and return recent ones
-    active_messages = [msg for msg in messages if not msg.get("deleted", False)]
-    return active_messages[-limit:]
+    return store_tail(PRIVATE_CHAT_FILE, pair_key, limit, cursor, _is_live_message)
 
 def mark_private_message_read(user1: str, user2: str, message_id: str):
     """Mark a private message as read."""
-    private_chat_data = load_private_chat_data()
     pair_key = get_chat_pair_key(user1, user2)
+    message = store_get_record(PRIVATE_CHAT_FILE, pair_key, message_id)
     
-    if pair_key in private_chat_data:
-        for message in private_chat_data[pair_key]:
-            if message.get("id") == message_id and message.get("to_username") == user1:
-                message["read"] = True
-                break
-        save_private_chat_data(private_chat_data)
+    if message is not None and message.get("to_username") == user1:
+        store_update_record(PRIVATE_CHAT_FILE, pair_key, message_id, {"read": True})
 
 def get_user_private_chats(username: str) -> List[Dict[str, Any]]:
     """Get all private chat conversations for a user."""
-    private_chat_data = load_private_chat_data()
     user_chats = []
     
-    for pair_key, messages in private_chat_data.items():
+    for pair_key in store_keys(PRIVATE_CHAT_FILE):
         if username in pair_key.split("|"):
+            messages = store_get(PRIVATE_CHAT_FILE, pair_key, [])
             # Get the other user in the conversation
             users = pair_key.split("|")
             other_user = users[1] if users[0] == username else users[0]
@@ -1461,11 +3757,6 @@ def get_user_private_chats(username: str) -> List[Dict[str, Any]]:
 # -------------------------------------------------------------
 def upload_file(company_code: str, uploaded_by: str, file_name: str, file_content: bytes, file_type: str = "unknown") -> bool:
     """Upload a file to company storage."""
-    files_data = load_files_data()
-    
-    if company_code not in files_data:
-        files_data[company_code] = []
-    
     file_info = {
         "id": str(uuid.uuid4()),
         "name": file_name,
@@ -1474,52 +3765,47 @@ def upload_file(company_code: str, uploaded_by: str, file_name: str, file_conten
         "uploaded_by": uploaded_by,
         "uploaded_at": get_current_timestamp(),
         "downloads": 0,
-        "content": file_content.hex()  # Store as hex string
+        "blob_key": blob_put(file_content)
     }
     
-    files_data[company_code].append(file_info)
-    save_files_data(files_data)
+    store_append(FILES_FILE, company_code, file_info)
+    index_search_documents(company_code, [_file_search_doc(file_info)])
     
     # Send enhanced file notifications to company members
     employees = get_company_employees(company_code)
-    for employee in employees:
-        if employee.get("username") != uploaded_by:
-            send_file_notification(
-                employee.get("username"),
-                file_name,
-                "shared",
-                uploaded_by,
-                "normal"
-            )
+    send_file_notification(
+        [employee.get("username") for employee in employees if employee.get("username") != uploaded_by],
+        file_name,
+        "shared",
+        uploaded_by,
+        "normal"
+    )
     
     return True
 
 def get_company_files(company_code: str) -> List[Dict[str, Any]]:
     """Get all files for a company."""
-    files_data = load_files_data()
-    return files_data.get(company_code, [])
-
-def download_file(company_code: str, file_id: str) -> Optional[bytes]:
-    """Download a file."""
-    files_data = load_files_data()
-    company_files = files_data.get(company_code, [])
-    
-    for file_info in company_files:
-        if file_info.get("id") == file_id:
-            # Increment download count
-            file_info["downloads"] = file_info.get("downloads", 0) + 1
-            save_files_data(files_data)
-            
-            # Return file content
-            return bytes.fromhex(file_info.get("content", ""))
+    files = _migrate_inline_payloads(FILES_FILE, company_code, store_get(FILES_FILE, company_code, []))
+    return _merge_download_counts(FILES_FILE, company_code, files)
+
+def download_file(company_code: str, file_id: str) -> Optional[BinaryIO]:
+    """Download a file as a stream over its blob."""
+    file_info = store_get_record(FILES_FILE, company_code, file_id)
     
-    return None
+    if file_info is None:
+        return None
+    
+    # Increment download count
+    store_incr_counter(FILES_FILE, company_code, file_id)
+    
+    # Return file content
+    return _open_record_payload(file_info)
 
 # -------------------------------------------------------------
 # Private File Functions
 # -------------------------------------------------------------
-def upload_private_file(from_username: str, to_username: str, file_name: str, file_content: bytes, file_type: str = "unknown") -> bool:
-    """Upload a private file between two users."""
+def upload_private_file(from_username: str, to_username: str, file_name: str, file_content: Any, file_type: str = "unknown") -> bool:
+    """Upload a private file between two users (file_content is bytes or a binary stream)."""
     # Check if both users are in the same company
     from_user_info = get_user_info(from_username)
     to_user_info = get_user_info(to_username)
@@ -1533,25 +3819,27 @@ def upload_private_file(from_username: str, to_username: str, file_name: str, fi
     if from_company != to_company:
         return False  # Users must be in the same company
     
-    private_files_data = load_private_files_data()
     pair_key = get_chat_pair_key(from_username, to_username)
+    file_id = str(uuid.uuid4())
     
-    if pair_key not in private_files_data:
-        private_files_data[pair_key] = []
+    if isinstance(file_content, (bytes, bytearray)):
+        file_content = io.BytesIO(file_content)
+    file_size = private_blob_write(pair_key, file_id, file_content)
     
     file_info = {
-        "id": str(uuid.uuid4()),
+        "id": file_id,
         "name": file_name,
         "type": file_type,
-        "size": len(file_content),
+        "size": file_size,
         "uploaded_by": from_username,
         "uploaded_to": to_username,
         "uploaded_at": get_current_timestamp(),
         "downloads": 0
     }
     
-    private_files_data[pair_key].append(file_info)
-    save_private_files_data(private_files_data)
+    store_append(PRIVATE_FILES_FILE, pair_key, file_info)
+    for search_key in _private_search_keys(from_username, to_username, from_company):
+        index_search_documents(search_key, [_private_file_search_doc(file_info)])
     
     # Send enhanced private file notification
     send_file_notification(to_username, file_name, "shared privately", from_username, "normal")
@@ -1560,53 +3848,51 @@ def upload_private_file(from_username: str, to_username: str, file_name: str, fi
 
 def get_private_files(user1: str, user2: str) -> List[Dict[str, Any]]:
     """Get private files shared between two users."""
-    private_files_data = load_private_files_data()
     pair_key = get_chat_pair_key(user1, user2)
-    return private_files_data.get(pair_key, [])
+    return _merge_download_counts(PRIVATE_FILES_FILE, pair_key, store_get(PRIVATE_FILES_FILE, pair_key, []))
 
-def download_private_file(user1: str, user2: str, file_id: str) -> Optional[bytes]:
-    """Download a private file."""
-    private_files_data = load_private_files_data()
+def download_private_file(user1: str, user2: str, file_id: str) -> Optional[BinaryIO]:
+    """Download a private file as a memory-mapped stream."""
     pair_key = get_chat_pair_key(user1, user2)
-    files = private_files_data.get(pair_key, [])
+    file_info = store_get_record(PRIVATE_FILES_FILE, pair_key, file_id)
     
-    for file_info in files:
-        if file_info.get("id") == file_id:
-            # Update download count
-            file_info["downloads"] = file_info.get("downloads", 0) + 1
-            save_private_files_data(private_files_data)
-            
-            # In a real app, you'd store files in a proper file system
-            # For now, we'll return a placeholder
-            return b"Private file content placeholder"
+    if file_info is None:
+        return None
     
-    return None
+    file_stream = private_blob_open(pair_key, file_id)
+    if file_stream is None:
+        return None  # Shared before file contents were persisted
+    
+    # Update download count
+    store_incr_counter(PRIVATE_FILES_FILE, pair_key, file_id)
+    
+    return file_stream
 
 def delete_private_file(user1: str, user2: str, file_id: str, deleter_username: str) -> bool:
     """Delete a private file (only by uploader)."""
-    private_files_data = load_private_files_data()
     pair_key = get_chat_pair_key(user1, user2)
-    files = private_files_data.get(pair_key, [])
-    
-    for i, file_info in enumerate(files):
-        if file_info.get("id") == file_id:
-            # Only uploader can delete the file
-            if file_info.get("uploaded_by") == deleter_username:
-                files.pop(i)
-                save_private_files_data(private_files_data)
-                return True
-            return False
+    file_info = store_get_record(PRIVATE_FILES_FILE, pair_key, file_id)
     
-    return False
+    # Only uploader can delete the file
+    if file_info is None or file_info.get("uploaded_by") != deleter_username:
+        return False
+    
+    if not store_delete_record(PRIVATE_FILES_FILE, pair_key, file_id):
+        return False
+    private_blob_path(pair_key, file_id).unlink(missing_ok=True)
+    company_code = get_user_info(file_info.get("uploaded_by")).get("company_code")
+    for search_key in _private_search_keys(file_info.get("uploaded_by"), file_info.get("uploaded_to"), company_code):
+        remove_search_documents(search_key, [f"private_file:{file_id}"])
+    return True
 
 def get_user_private_files(username: str) -> List[Dict[str, Any]]:
     """Get all private files for a user (both sent and received)."""
-    private_files_data = load_private_files_data()
     user_files = []
     
-    for pair_key, files in private_files_data.items():
+    for pair_key in store_keys(PRIVATE_FILES_FILE):
         user1, user2 = pair_key.split("|")
         if username in [user1, user2]:
+            files = _merge_download_counts(PRIVATE_FILES_FILE, pair_key, store_get(PRIVATE_FILES_FILE, pair_key, []))
             for file_info in files:
                 # Add pair info to file info
                 file_info_copy = file_info.copy()
@@ -1623,11 +3909,6 @@ def create_calendar_event(company_code: str, created_by: str, title: str, descri
                          start_date: str, end_date: str, event_type: str = "meeting", 
                          attendees: Optional[List[str]] = None) -> bool:
     """Create a calendar event."""
-    calendar_data = load_calendar_data()
-    
-    if company_code not in calendar_data:
-        calendar_data[company_code] = []
-    
     event = {
         "id": str(uuid.uuid4()),
         "title": title,
@@ -1641,27 +3922,23 @@ def create_calendar_event(company_code: str, created_by: str, title: str, descri
         "status": "active"
     }
     
-    calendar_data[company_code].append(event)
-    save_calendar_data(calendar_data)
+    store_append(CALENDAR_FILE, company_code, event)
     
     # Send enhanced calendar notifications to attendees
     if attendees:
-        for attendee in attendees:
-            if attendee != created_by:
-                send_calendar_notification(
-                    attendee,
-                    title,
-                    "created",
-                    created_by,
-                    "normal"
-                )
+        send_calendar_notification(
+            [attendee for attendee in attendees if attendee != created_by],
+            title,
+            "created",
+            created_by,
+            "normal"
+        )
     
     return True
 
 def get_company_events(company_code: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
     """Get all events for a company with optional date filtering."""
-    calendar_data = load_calendar_data()
-    events = calendar_data.get(company_code, [])
+    events = store_get(CALENDAR_FILE, company_code, [])
     
     if start_date and end_date:
         # Filter events by date range with proper validation
@@ -1696,11 +3973,6 @@ def get_user_events(username: str, company_code: str) -> List[Dict[str, Any]]:
 def create_poll(company_code: str, created_by: str, question: str, options: List[str], 
                 allow_multiple: bool = False, duration_hours: int = 24) -> bool:
     """Create a poll."""
-    polls_data = load_polls_data()
-    
-    if company_code not in polls_data:
-        polls_data[company_code] = []
-    
     poll = {
         "id": str(uuid.uuid4()),
         "question": question,
@@ -1713,77 +3985,69 @@ def create_poll(company_code: str, created_by: str, question: str, options: List
         "status": "active"
     }
     
-    polls_data[company_code].append(poll)
-    save_polls_data(polls_data)
+    store_append(POLLS_FILE, company_code, poll)
     
     # Send enhanced poll notifications to company members
     employees = get_company_employees(company_code)
-    for employee in employees:
-        if employee.get("username") != created_by:
-            send_poll_notification(
-                employee.get("username"),
-                question,
-                "created",
-                created_by,
-                "normal"
-            )
+    send_poll_notification(
+        [employee.get("username") for employee in employees if employee.get("username") != created_by],
+        question,
+        "created",
+        created_by,
+        "normal"
+    )
     
     return True
 
 def vote_poll(company_code: str, poll_id: str, username: str, selected_options: List[int]) -> bool:
     """Vote on a poll."""
     try:
-        polls_data = load_polls_data()
-        company_polls = polls_data.get(company_code, [])
+        poll = store_get_record(POLLS_FILE, company_code, poll_id)
         
-        for poll in company_polls:
-            if poll.get("id") == poll_id:
-                if poll.get("status") != "active":
-                    return False  # Poll is closed
-                
-                # Check if user already voted
-                if username in poll.get("votes", {}):
-                    return False  # Already voted
-                
-                # Convert selected_options to integers and validate
-                try:
-                    selected_options = [int(opt) for opt in selected_options]
-                except (ValueError, TypeError):
-                    return False  # Invalid option format
-                
-                # Validate options
-                if not poll.get("allow_multiple", False) and len(selected_options) > 1:
-                    return False  # Multiple votes not allowed
-                
-                if not selected_options or max(selected_options) >= len(poll.get("options", [])):
-                    return False  # Invalid option
-                
-                # Record vote
-                if "votes" not in poll:
-                    poll["votes"] = {}
-                poll["votes"][username] = selected_options
-                save_polls_data(polls_data)
-                return True
+        if poll is None:
+            return False  # Poll not found
+        
+        if poll.get("status") != "active":
+            return False  # Poll is closed
+        
+        # Check if user already voted
+        if username in poll.get("votes", {}):
+            return False  # Already voted
+        
+        # Convert selected_options to integers and validate
+        try:
+            selected_options = [int(opt) for opt in selected_options]
+        except (ValueError, TypeError):
+            return False  # Invalid option format
+        
+        # Validate options
+        if not poll.get("allow_multiple", False) and len(selected_options) > 1:
+            return False  # Multiple votes not allowed
+        
+        if not selected_options or max(selected_options) >= len(poll.get("options", [])):
+            return False  # Invalid option
         
-        return False  # Poll not found
+        # Record vote
+        votes = poll.get("votes", {})
+        votes[username] = selected_options
+        return store_update_record(POLLS_FILE, company_code, poll_id, {"votes": votes})
     except Exception as e:
         print(f"Error in vote_poll: {e}")
         return False
 
 def get_company_polls(company_code: str) -> List[Dict[str, Any]]:
     """Get all polls for a company."""
-    polls_data = load_polls_data()
-    polls = polls_data.get(company_code, [])
+    polls = store_get(POLLS_FILE, company_code, [])
     
-    # Update expired polls
+    # Update expired polls (only the ones that actually changed are written)
     current_time = datetime.datetime.now()
     for poll in polls:
         if poll.get("status") == "active":
             expires_at = datetime.datetime.strptime(poll.get("expires_at", ""), "%Y-%m-%d %H:%M:%S")
             if current_time > expires_at:
                 poll["status"] = "expired"
+                store_update_record(POLLS_FILE, company_code, poll.get("id"), {"status": "expired"})
     
-    save_polls_data(polls_data)
     return polls
 
 # -------------------------------------------------------------
@@ -1791,21 +4055,16 @@ def get_company_polls(company_code: str) -> List[Dict[str, Any]]:
 # -------------------------------------------------------------
 def update_user_status(username: str, status: str = "online", custom_status: str = ""):
     """Update user's online status."""
-    user_status_data = load_user_status_data()
-    
-    user_status_data[username] = {
+    store_put(USER_STATUS_FILE, username, {
         "status": status,  # online, away, busy, offline
         "custom_status": custom_status,
         "last_seen": get_current_timestamp(),
         "updated_at": get_current_timestamp()
-    }
-    
-    save_user_status_data(user_status_data)
+    })
 
 def get_user_status(username: str) -> Dict[str, Any]:
     """Get user's current status."""
-    user_status_data = load_user_status_data()
-    return user_status_data.get(username, {
+    return store_get(USER_STATUS_FILE, username, {
         "status": "offline",
         "custom_status": "",
         "last_seen": "",
@@ -1836,11 +4095,6 @@ def get_online_users(company_code: str) -> List[Dict[str, Any]]:
 # -------------------------------------------------------------
 def add_task_comment(task_id: str, username: str, comment: str) -> bool:
     """Add a comment to a task."""
-    task_comments_data = load_task_comments_data()
-    
-    if task_id not in task_comments_data:
-        task_comments_data[task_id] = []
-    
     comment_obj = {
         "id": str(uuid.uuid4()),
         "username": username,
@@ -1851,15 +4105,13 @@ def add_task_comment(task_id: str, username: str, comment: str) -> bool:
         "deleted": False
     }
     
-    task_comments_data[task_id].append(comment_obj)
-    save_task_comments_data(task_comments_data)
+    store_append(TASK_COMMENTS_FILE, task_id, comment_obj)
     
     return True
 
 def get_task_comments(task_id: str) -> List[Dict[str, Any]]:
     """Get all comments for a task."""
-    task_comments_data = load_task_comments_data()
-    comments = task_comments_data.get(task_id, [])
+    comments = store_get(TASK_COMMENTS_FILE, task_id, [])
     
     # Filter out deleted comments
     active_comments = [c for c in comments if not c.get("deleted", False)]
@@ -1870,13 +4122,8 @@ def get_task_comments(task_id: str) -> List[Dict[str, Any]]:
 # -------------------------------------------------------------
 def pin_message(company_code: str, message_id: str, pinned_by: str, message_type: str = "company") -> bool:
     """Pin a message in company or private chat."""
-    pinned_messages_data = load_pinned_messages_data()
-    
-    if company_code not in pinned_messages_data:
-        pinned_messages_data[company_code] = []
-    
     # Check if message is already pinned
-    for pinned in pinned_messages_data[company_code]:
+    for pinned in store_get(PINNED_MESSAGES_FILE, company_code, []):
         if pinned.get("message_id") == message_id:
             return False  # Already pinned
     
@@ -1888,29 +4135,25 @@ def pin_message(company_code: str, message_id: str, pinned_by: str, message_type
         "pinned_at": get_current_timestamp()
     }
     
-    pinned_messages_data[company_code].append(pinned_message)
-    save_pinned_messages_data(pinned_messages_data)
+    store_append(PINNED_MESSAGES_FILE, company_code, pinned_message)
     
     return True
 
 def unpin_message(company_code: str, message_id: str, unpinned_by: str) -> bool:
     """Unpin a message."""
-    pinned_messages_data = load_pinned_messages_data()
-    
-    if company_code in pinned_messages_data:
-        pinned_messages_data[company_code] = [
-            p for p in pinned_messages_data[company_code] 
-            if p.get("message_id") != message_id
-        ]
-        save_pinned_messages_data(pinned_messages_data)
+    pinned = store_get(PINNED_MESSAGES_FILE, company_code)
+    
+    if pinned is not None:
+        for p in pinned:
+            if p.get("message_id") == message_id:
+                store_delete_record(PINNED_MESSAGES_FILE, company_code, p.get("id"))
         return True
     
     return False
 
 def get_pinned_messages(company_code: str) -> List[Dict[str, Any]]:
     """Get all pinned messages for a company."""
-    pinned_messages_data = load_pinned_messages_data()
-    return pinned_messages_data.get(company_code, [])
+    return store_get(PINNED_MESSAGES_FILE, company_code, [])
 
 # -------------------------------------------------------------
 # Task Attachments Functions
@@ -1918,11 +4161,6 @@ def get_pinned_messages(company_code: str) -> List[Dict[str, Any]]:
 def add_task_attachment(task_id: str, username: str, file_name: str, file_content: bytes, 
                        file_type: str = "unknown", attachment_type: str = "file") -> bool:
     """Add an attachment to a task."""
-    task_attachments_data = load_task_attachments_data()
-    
-    if task_id not in task_attachments_data:
-        task_attachments_data[task_id] = []
-    
     attachment = {
         "id": str(uuid.uuid4()),
         "file_name": file_name,
@@ -1931,44 +4169,34 @@ def add_task_attachment(task_id: str, username: str, file_name: str, file_conten
         "size": len(file_content),
         "uploaded_by": username,
         "uploaded_at": get_current_timestamp(),
-        "content": file_content.hex()  # Store as hex string
+        "blob_key": blob_put(file_content)
     }
     
-    task_attachments_data[task_id].append(attachment)
-    save_task_attachments_data(task_attachments_data)
+    store_append(TASK_ATTACHMENTS_FILE, task_id, attachment)
     
     return True
 
 def get_task_attachments(task_id: str) -> List[Dict[str, Any]]:
     """Get all attachments for a task."""
-    task_attachments_data = load_task_attachments_data()
-    return task_attachments_data.get(task_id, [])
+    return _migrate_inline_payloads(TASK_ATTACHMENTS_FILE, task_id, store_get(TASK_ATTACHMENTS_FILE, task_id, []))
 
-def download_task_attachment(task_id: str, attachment_id: str) -> Optional[bytes]:
-    """Download a task attachment."""
-    task_attachments_data = load_task_attachments_data()
-    task_attachments = task_attachments_data.get(task_id, [])
+def download_task_attachment(task_id: str, attachment_id: str) -> Optional[BinaryIO]:
+    """Download a task attachment as a stream over its blob."""
+    attachment = store_get_record(TASK_ATTACHMENTS_FILE, task_id, attachment_id)
     
-    for attachment in task_attachments:
-        if attachment.get("id") == attachment_id:
-            return bytes.fromhex(attachment.get("content", ""))
+    if attachment is None:
+        return None
     
-    return None
+    return _open_record_payload(attachment)
 
 def delete_task_attachment(task_id: str, attachment_id: str, username: str) -> bool:
     """Delete a task attachment (only by uploader)."""
-    task_attachments_data = load_task_attachments_data()
-    task_attachments = task_attachments_data.get(task_id, [])
-    
-    for attachment in task_attachments:
-        if attachment.get("id") == attachment_id:
-            if attachment.get("uploaded_by") == username:
-                task_attachments_data[task_id] = [a for a in task_attachments if a.get("id") != attachment_id]
-                save_task_attachments_data(task_attachments_data)
-                return True
-            return False
+    attachment = store_get_record(TASK_ATTACHMENTS_FILE, task_id, attachment_id)
     
-    return False
+    if attachment is None or attachment.get("uploaded_by") != username:
+        return False
+    
+    return store_delete_record(TASK_ATTACHMENTS_FILE, task_id, attachment_id)
 
 # -------------------------------------------------------------
 # Project Management Functions
@@ -1977,11 +4205,6 @@ def create_project(company_code: str, created_by: str, name: str, description: s
                   start_date: str, end_date: str, budget: float = 0.0, 
                   project_manager: str = "", team_members: Optional[List[str]] = None) -> Tuple[bool, str]:
     """Create a new project."""
-    projects_data = load_projects_data()
-    
-    if company_code not in projects_data:
-        projects_data[company_code] = []
-    
     project = {
         "id": str(uuid.uuid4()),
         "name": name,
@@ -2001,70 +4224,55 @@ def create_project(company_code: str, created_by: str, name: str, description: s
         "documents": []
     }
     
-    projects_data[company_code].append(project)
-    save_projects_data(projects_data)
+    store_append(PROJECTS_FILE, company_code, project)
     
     # Send enhanced project notifications to team members
     if team_members:
-        for member in team_members:
-            if member != created_by:
-                send_project_notification(
-                    member,
-                    name,
-                    "assigned",
-                    created_by,
-                    "normal"
-                )
+        send_project_notification(
+            [member for member in team_members if member != created_by],
+            name,
+            "assigned",
+            created_by,
+            "normal"
+        )
     
     return True, f"Project '{name}' created successfully!"
 
 def get_company_projects(company_code: str) -> List[Dict[str, Any]]:
     """Get all projects for a company."""
-    projects_data = load_projects_data()
-    return projects_data.get(company_code, [])
+    return store_get(PROJECTS_FILE, company_code, [])
 
 def update_project_progress(company_code: str, project_id: str, progress: int, 
                           updated_by: str) -> bool:
     """Update project progress."""
-    projects_data = load_projects_data()
-    company_projects = projects_data.get(company_code, [])
-    
-    for project in company_projects:
-        if project.get("id") == project_id:
-            project["progress"] = max(0, min(100, progress))
-            project["updated_at"] = get_current_timestamp()
-            project["updated_by"] = updated_by
-            save_projects_data(projects_data)
-            return True
-    
-    return False
+    return store_update_record(PROJECTS_FILE, company_code, project_id, {
+        "progress": max(0, min(100, progress)),
+        "updated_at": get_current_timestamp(),
+        "updated_by": updated_by
+    })
 
 def add_project_milestone(company_code: str, project_id: str, title: str, 
                          description: str, due_date: str, created_by: str) -> bool:
     """Add a milestone to a project."""
-    projects_data = load_projects_data()
-    company_projects = projects_data.get(company_code, [])
-    
-    for project in company_projects:
-        if project.get("id") == project_id:
-            milestone = {
-                "id": str(uuid.uuid4()),
-                "title": title,
-                "description": description,
-                "due_date": due_date,
-                "created_by": created_by,
-                "created_at": get_current_timestamp(),
-                "status": "pending",  # pending, completed, overdue
-                "completed_at": None
-            }
-            
-            if "milestones" not in project:
-                project["milestones"] = []
-            project["milestones"].append(milestone)
-            save_projects_data(projects_data)
-            return True
+    project = store_get_record(PROJECTS_FILE, company_code, project_id)
     
-    return False
+    if project is None:
+        return False
+    
+    milestone = {
+        "id": str(uuid.uuid4()),
+        "title": title,
+        "description": description,
+        "due_date": due_date,
+        "created_by": created_by,
+        "created_at": get_current_timestamp(),
+        "status": "pending",  # pending, completed, overdue
+        "completed_at": None
+    }
+    
+    milestones = project.get("milestones", [])
+    milestones.append(milestone)
+    return store_update_record(PROJECTS_FILE, company_code, project_id, {"milestones": milestones})
 
 # -------------------------------------------------------------
 # Department Management Functions
@@ -2072,11 +4280,6 @@ def add_project_milestone(company_code: str, project_id: str, title: str,
 def create_department(company_code: str, name: str, description: str, 
                      manager_username: str, created_by: str) -> Tuple[bool, str]:
     """Create a new department."""
-    departments_data = load_departments_data()
-    
-    if company_code not in departments_data:
-        departments_data[company_code] = []
-    
     department = {
         "id": str(uuid.uuid4()),
         "name": name,
@@ -2090,32 +4293,25 @@ def create_department(company_code: str, name: str, description: str,
         "performance_metrics": {}
     }
     
-    departments_data[company_code].append(department)
-    save_departments_data(departments_data)
+    store_append(DEPARTMENTS_FILE, company_code, department)
     
     return True, f"Department '{name}' created successfully!"
 
 def get_company_departments(company_code: str) -> List[Dict[str, Any]]:
     """Get all departments for a company."""
-    departments_data = load_departments_data()
-    return departments_data.get(company_code, [])
+    return store_get(DEPARTMENTS_FILE, company_code, [])
 
 def assign_employee_to_department(company_code: str, department_id: str, 
                                 employee_username: str) -> bool:
     """Assign an employee to a department."""
-    departments_data = load_departments_data()
-    company_departments = departments_data.get(company_code, [])
-    
-    for department in company_departments:
-        if department.get("id") == department_id:
-            if employee_username not in department.get("employees", []):
-                if "employees" not in department:
-                    department["employees"] = []
-                department["employees"].append(employee_username)
-                save_departments_data(departments_data)
-                return True
+    department = store_get_record(DEPARTMENTS_FILE, company_code, department_id)
     
-    return False
+    if department is None or employee_username in department.get("employees", []):
+        return False
+    
+    employees = department.get("employees", [])
+    employees.append(employee_username)
+    return store_update_record(DEPARTMENTS_FILE, company_code, department_id, {"employees": employees})
 
 # -------------------------------------------------------------
 # Performance Management Functions
@@ -2125,11 +4321,6 @@ def create_performance_review(company_code: str, employee_username: str,
                             goals_achieved: List[str], areas_improvement: List[str],
                             overall_rating: int, comments: str) -> Tuple[bool, str]:
     """Create a performance review."""
-    performance_data = load_performance_data()
-    
-    if company_code not in performance_data:
-        performance_data[company_code] = []
-    
     review = {
         "id": str(uuid.uuid4()),
         "employee_username": employee_username,
@@ -2143,8 +4334,7 @@ def create_performance_review(company_code: str, employee_username: str,
         "status": "submitted"  # submitted, approved, rejected
     }
     
-    performance_data[company_code].append(review)
-    save_performance_data(performance_data)
+    store_append(PERFORMANCE_FILE, company_code, review)
     
     # Send enhanced performance notification
     send_performance_notification(
@@ -2158,8 +4348,7 @@ def create_performance_review(company_code: str, employee_username: str,
 
 def get_employee_performance_reviews(company_code: str, employee_username: str) -> List[Dict[str, Any]]:
     """Get performance reviews for an employee."""
-    performance_data = load_performance_data()
-    company_reviews = performance_data.get(company_code, [])
+    company_reviews = store_get(PERFORMANCE_FILE, company_code, [])
     
     return [review for review in company_reviews if review.get("employee_username") == employee_username]
 
@@ -2170,11 +4359,6 @@ def create_budget_item(company_code: str, category: str, description: str,
                       amount: float, budget_type: str, created_by: str,
                       department: str = "", project: str = "") -> Tuple[bool, str]:
     """Create a budget item."""
-    budget_data = load_budget_data()
-    
-    if company_code not in budget_data:
-        budget_data[company_code] = []
-    
     budget_item = {
         "id": str(uuid.uuid4()),
         "category": category,  # income, expense, investment
@@ -2188,15 +4372,13 @@ def create_budget_item(company_code: str, category: str, description: str,
         "date": get_current_timestamp().split()[0]
     }
     
-    budget_data[company_code].append(budget_item)
-    save_budget_data(budget_data)
+    store_append(BUDGET_FILE, company_code, budget_item)
     
     return True, "Budget item created successfully!"
 
 def get_company_budget(company_code: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
     """Get budget items for a company."""
-    budget_data = load_budget_data()
-    budget_items = budget_data.get(company_code, [])
+    budget_items = store_get(BUDGET_FILE, company_code, [])
     
     if start_date and end_date:
         budget_items = [item for item in budget_items 
@@ -2229,11 +4411,6 @@ def calculate_budget_summary(company_code: str) -> Dict[str, Any]:
 def generate_comprehensive_report(company_code: str, report_type: str, 
                                 start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, Any]:
     """Generate comprehensive reports."""
-    reports_data = load_reports_data()
-    
-    if company_code not in reports_data:
-        reports_data[company_code] = []
-    
     report = {
         "id": str(uuid.uuid4()),
         "type": report_type,
@@ -2248,27 +4425,24 @@ def generate_comprehensive_report(company_code: str, report_type: str,
         employees = get_company_employees(company_code)
         performance_data = []
         
+        task_counts = get_company_task_table(company_code).groupby("assignee")["completed"].agg(["size", "sum"])
         for employee in employees:
             username = employee.get("username")
-            user_file = Path(f"user_{username}.json")
+            if username in task_counts.index:
+                total_tasks = int(task_counts.at[username, "size"])
+                completed_tasks = int(task_counts.at[username, "sum"])
+            else:
+                total_tasks = completed_tasks = 0
+            completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
             
-            if user_file.exists():
-                with user_file.open("r", encoding="utf-8") as f:
-                    user_data = json.load(f)
-                    assigned_tasks = user_data.get("assigned_tasks", [])
-                    
-                    total_tasks = len(assigned_tasks)
-                    completed_tasks = len([t for t in assigned_tasks if t.get("completed", False)])
-                    completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-                    
-                    performance_data.append({
-                        "employee": employee.get("full_name", username),
-                        "username": username,
-                        "role": employee.get("role", "employee"),
-                        "total_tasks": total_tasks,
-                        "completed_tasks": completed_tasks,
-                        "completion_rate": completion_rate
-                    })
+            performance_data.append({
+                "employee": employee.get("full_name", username),
+                "username": username,
+                "role": employee.get("role", "employee"),
+                "total_tasks": total_tasks,
+                "completed_tasks": completed_tasks,
+                "completion_rate": completion_rate
+            })
         
         report["data"] = {
             "performance_data": performance_data,
@@ -2296,8 +4470,7 @@ def generate_comprehensive_report(company_code: str, report_type: str,
         budget_summary = calculate_budget_summary(company_code)
         report["data"] = budget_summary
     
-    reports_data[company_code].append(report)
-    save_reports_data(reports_data)
+    store_append(REPORTS_FILE, company_code, report)
     
     return report
 
@@ -2307,11 +4480,6 @@ def generate_comprehensive_report(company_code: str, report_type: str,
 def create_workflow(company_code: str, name: str, description: str, 
                    steps: List[Dict[str, Any]], created_by: str) -> Tuple[bool, str]:
     """Create a workflow."""
-    workflows_data = load_workflows_data()
-    
-    if company_code not in workflows_data:
-        workflows_data[company_code] = []
-    
     workflow = {
         "id": str(uuid.uuid4()),
         "name": name,
@@ -2323,42 +4491,37 @@ def create_workflow(company_code: str, name: str, description: str,
         "instances": []
     }
     
-    workflows_data[company_code].append(workflow)
-    save_workflows_data(workflows_data)
+    store_append(WORKFLOWS_FILE, company_code, workflow)
     
     return True, f"Workflow '{name}' created successfully!"
 
 def get_company_workflows(company_code: str) -> List[Dict[str, Any]]:
     """Get all workflows for a company."""
-    workflows_data = load_workflows_data()
-    return workflows_data.get(company_code, [])
+    return store_get(WORKFLOWS_FILE, company_code, [])
 
 def start_workflow_instance(company_code: str, workflow_id: str, 
                            initiator_username: str, data: Dict[str, Any]) -> Tuple[bool, str]:
     """Start a workflow instance."""
-    workflows_data = load_workflows_data()
-    company_workflows = workflows_data.get(company_code, [])
-    
-    for workflow in company_workflows:
-        if workflow.get("id") == workflow_id:
-            instance = {
-                "id": str(uuid.uuid4()),
-                "workflow_id": workflow_id,
-                "initiator": initiator_username,
-                "started_at": get_current_timestamp(),
-                "status": "running",  # running, completed, cancelled
-                "current_step": 0,
-                "data": data,
-                "history": []
-            }
-            
-            if "instances" not in workflow:
-                workflow["instances"] = []
-            workflow["instances"].append(instance)
-            save_workflows_data(workflows_data)
-            return True, f"Workflow instance started successfully!"
+    workflow = store_get_record(WORKFLOWS_FILE, company_code, workflow_id)
+    
+    if workflow is None:
+        return False, "Workflow not found!"
     
-    return False, "Workflow not found!"
+    instance = {
+        "id": str(uuid.uuid4()),
+        "workflow_id": workflow_id,
+        "initiator": initiator_username,
+        "started_at": get_current_timestamp(),
+        "status": "running",  # running, completed, cancelled
+        "current_step": 0,
+        "data": data,
+        "history": []
+    }
+    
+    instances = workflow.get("instances", [])
+    instances.append(instance)
+    store_update_record(WORKFLOWS_FILE, company_code, workflow_id, {"instances": instances})
+    return True, f"Workflow instance started successfully!"
 
 # -------------------------------------------------------------
 # Knowledge Base Functions
@@ -2367,11 +4530,6 @@ def create_knowledge_article(company_code: str, title: str, content: str,
                            category: str, author_username: str, 
                            tags: Optional[List[str]] = None) -> Tuple[bool, str]:
     """Create a knowledge base article."""
-    knowledge_base_data = load_knowledge_base_data()
-    
-    if company_code not in knowledge_base_data:
-        knowledge_base_data[company_code] = []
-    
     article = {
         "id": str(uuid.uuid4()),
         "title": title,
@@ -2386,15 +4544,14 @@ def create_knowledge_article(company_code: str, title: str, content: str,
         "status": "published"  # draft, published, archived
     }
     
-    knowledge_base_data[company_code].append(article)
-    save_knowledge_base_data(knowledge_base_data)
+    store_append(KNOWLEDGE_BASE_FILE, company_code, article)
+    index_search_documents(company_code, [_knowledge_search_doc(article)])
     
     return True, f"Knowledge article '{title}' created successfully!"
 
 def get_knowledge_articles(company_code: str, category: Optional[str] = None) -> List[Dict[str, Any]]:
     """Get knowledge base articles."""
-    knowledge_base_data = load_knowledge_base_data()
-    articles = knowledge_base_data.get(company_code, [])
+    articles = store_get(KNOWLEDGE_BASE_FILE, company_code, [])
     
     if category:
         articles = [article for article in articles if article.get("category") == category]
@@ -2403,16 +4560,8 @@ def get_knowledge_articles(company_code: str, category: Optional[str] = None) ->
 
 def search_knowledge_base(company_code: str, query: str) -> List[Dict[str, Any]]:
     """Search knowledge base articles."""
-    articles = get_knowledge_articles(company_code)
-    results = []
-    
-    for article in articles:
-        if (query.lower() in article.get("title", "").lower() or
-            query.lower() in article.get("content", "").lower() or
-            any(query.lower() in tag.lower() for tag in article.get("tags", []))):
-            results.append(article)
-    
-    return results
+    results, _ = search_partition(company_code, None, query, ["knowledge_article"], limit=None)
+    return [result["article"] for result in results]
 
 # -------------------------------------------------------------
 # Integration Management Functions
@@ -2420,11 +4569,6 @@ def search_knowledge_base(company_code: str, query: str) -> List[Dict[str, Any]]
 def create_integration(company_code: str, name: str, integration_type: str,
                       config: Dict[str, Any], created_by: str) -> Tuple[bool, str]:
     """Create an integration."""
-    integrations_data = load_integrations_data()
-    
-    if company_code not in integrations_data:
-        integrations_data[company_code] = []
-    
     integration = {
         "id": str(uuid.uuid4()),
         "name": name,
@@ -2436,84 +4580,448 @@ def create_integration(company_code: str, name: str, integration_type: str,
         "last_sync": None
     }
     
-    integrations_data[company_code].append(integration)
-    save_integrations_data(integrations_data)
+    store_append(INTEGRATIONS_FILE, company_code, integration)
+    
+    return True, f"Integration '{name}' created successfully!"
+
+def get_company_integrations(company_code: str) -> List[Dict[str, Any]]:
+    """Get all integrations for a company."""
+    return store_get(INTEGRATIONS_FILE, company_code, [])
+
+# -------------------------------------------------------------
+# Search Index
+# -------------------------------------------------------------
+# SEARCH_INDEX_FILE holds one search document per chat message, private
+# message, task, shared file and knowledge base article, partitioned by
+# company code ("user:<username>" for users without a company). Write paths
+# append the new version of a document, or a {"deleted": True} tombstone,
+# under the same id, so each partition is an append-only log. Every process
+# keeps an inverted index per partition in memory and only reads the
+# documents written since it last looked (store_read_since), so a search
+# costs the postings of its terms rather than a scan of the whole history.
+# A partition is backfilled from the source stores the first time it is
+# searched.
+#
+# Documents with a short "name" (members, shared and private files, tasks)
+# are also indexed by the trigrams of that name, which backs the
+# filter-as-you-type boxes: search_names() finds names containing the query
+# and, failing that, names within SEARCH_FUZZY_THRESHOLD trigram similarity.
+
+def _search_tokens(text: str) -> List[str]:
+    """Split text into lower-case search terms."""
+    return re.findall(r"[^\W_]+", text.lower())
+
+def _word_trigrams(word: str) -> frozenset:
+    """Get the trigrams of a word, padded as "  word " so its start counts double."""
+    padded = f"  {word} "
+    return frozenset(padded[position:position + 3] for position in range(len(padded) - 2))
+
+def _search_key(company_code: Optional[str], username: str) -> str:
+    """Get the search index partition of a user's documents."""
+    return company_code or f"user:{username}"
+
+def _private_search_keys(from_username: str, to_username: str, company_code: Optional[str]) -> List[str]:
+    """Get the search index partitions a private message is indexed in."""
+    if company_code:
+        return [company_code]
+    return list(dict.fromkeys([_search_key(None, from_username), _search_key(None, to_username)]))
+
+def _chat_search_doc(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the search document of a company chat message."""
+    return {
+        "id": f"chat:{message.get('id')}",
+        "kind": "company_chat",
+        "visible_to": None,
+        "text": f"{message.get('from_name', '')} {message.get('message', '')}",
+        "timestamp": message.get("timestamp", ""),
+        "result": {"type": "company_chat", "message": message, "context": "Company Chat"}
+    }
+
+def _private_search_doc(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the search document of a private message."""
+    return {
+        "id": f"private:{message.get('id')}",
+        "kind": "private_chat",
+        "visible_to": [message.get("from_username"), message.get("to_username")],
+        "text": f"{message.get('from_name', '')} {message.get('message', '')}",
+        "timestamp": message.get("timestamp", ""),
+        "result": {
+            "type": "private_chat",
+            "message": message,
+            "context": f"Private Chat with {message.get('from_name', 'Unknown')}"
+        }
+    }
+
+def _task_search_doc(username: str, task: Dict[str, Any], kind: str) -> Dict[str, Any]:
+    """Build the search document of a personal ("personal_task") or assigned ("assigned_task") task."""
+    return {
+        "id": f"{kind}:{username}:{task.get('id')}",
+        "kind": kind,
+        "visible_to": [username],
+        "text": " ".join([task.get("title", ""), task.get("description", "") or ""] + list(task.get("tags", []))),
+        "name": task.get("title", ""),
+        "timestamp": task.get("created_at") or task.get("assigned_at", ""),
+        "result": {
+            "type": kind,
+            "task": task,
+            "context": "Personal Tasks" if kind == "personal_task" else "Assigned Tasks"
+        }
+    }
+
+def _file_search_doc(file_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the search document of a shared file."""
+    return {
+        "id": f"file:{file_info.get('id')}",
+        "kind": "file",
+        "visible_to": None,
+        "text": file_info.get("name", ""),
+        "name": file_info.get("name", ""),
+        "timestamp": file_info.get("uploaded_at", ""),
+        "result": {"type": "file", "file": file_info, "context": "Shared Files"}
+    }
+
+def _private_file_search_doc(file_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the search document of a privately shared file."""
+    return {
+        "id": f"private_file:{file_info.get('id')}",
+        "kind": "private_file",
+        "visible_to": [file_info.get("uploaded_by"), file_info.get("uploaded_to")],
+        "text": file_info.get("name", ""),
+        "name": file_info.get("name", ""),
+        "timestamp": file_info.get("uploaded_at", ""),
+        "result": {"type": "private_file", "file": file_info, "context": "Private Files"}
+    }
+
+def _member_search_doc(employee: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the search document of a company member."""
+    name = f"{employee.get('full_name', '')} {employee.get('role', '')}"
+    return {
+        "id": f"member:{employee.get('username')}",
+        "kind": "member",
+        "visible_to": None,
+        "text": name,
+        "name": name,
+        "timestamp": employee.get("joined_at", ""),
+        "result": {"type": "member", "member": employee, "context": "Team Members"}
+    }
+
+def _knowledge_search_doc(article: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the search document of a knowledge base article."""
+    return {
+        "id": f"kb:{article.get('id')}",
+        "kind": "knowledge_article",
+        "visible_to": None,
+        "text": " ".join([article.get("title", ""), article.get("content", "")] + list(article.get("tags", []))),
+        "timestamp": article.get("created_at", ""),
+        "result": {"type": "knowledge_article", "article": article, "context": "Knowledge Base"}
+    }
+
+def _user_task_search_docs(username: str, user_data: Optional[dict]) -> Dict[str, Dict[str, Any]]:
+    """Build the search documents of every task in a user's data, by document id."""
+    documents = {}
+    for kind, field in (("personal_task", "tasks"), ("assigned_task", "assigned_tasks")):
+        for task in (user_data or {}).get(field, []):
+            document = _task_search_doc(username, task, kind)
+            documents[document["id"]] = document
+    return documents
+
+def index_search_documents(key: str, documents: List[Dict[str, Any]]):
+    """Add documents to a search index partition, replacing any with the same id."""
+    store_append_many(SEARCH_INDEX_FILE, [(key, document) for document in documents])
+
+def remove_search_documents(key: str, document_ids: List[str]):
+    """Remove documents from a search index partition."""
+    index_search_documents(key, [{"id": document_id, "deleted": True} for document_id in document_ids])
+
+def reindex_user_tasks(username: str, before: Optional[dict], after: Optional[dict]):
+    """Index the tasks that changed between two versions of a user's data."""
+    before_docs = _user_task_search_docs(username, before)
+    after_docs = _user_task_search_docs(username, after)
+    key = _search_key(get_user_info(username).get("company_code"), username)
+    
+    index_search_documents(key, [document for document_id, document in after_docs.items()
+                                 if before_docs.get(document_id) != document])
+    remove_search_documents(key, [document_id for document_id in before_docs if document_id not in after_docs])
+
+def reindex_company_member(company_code: str, username: str):
+    """Index a member's current name and role, or drop them if they left the company."""
+    for employee in get_company_employees(company_code):
+        if employee.get("username") == username:
+            index_search_documents(company_code, [_member_search_doc(employee)])
+            return
+    remove_search_documents(company_code, [f"member:{username}"])
+
+def rebuild_search_index(key: str):
+    """Index every existing document of a search index partition from the source stores."""
+    if key.startswith("user:"):
+        company_code = None
+        usernames = [key[len("user:"):]]
+    else:
+        company_code = key
+        usernames = [employee.get("username") for employee in get_company_employees(company_code)
+                     if employee.get("username")]
+    
+    documents = []
+    if company_code:
+        documents += [_chat_search_doc(message) for message in store_get(CHAT_FILE, company_code, [])
+                      if _is_live_message(message)]
+        documents += [_file_search_doc(file_info) for file_info in get_company_files(company_code)]
+        documents += [_knowledge_search_doc(article) for article in get_knowledge_articles(company_code)]
+        documents += [_member_search_doc(employee) for employee in get_company_employees(company_code)
+                      if employee.get("username")]
+    
+    # Private chats and files between this partition's users
+    members = set(usernames)
+    for path, build_doc in ((PRIVATE_CHAT_FILE, _private_search_doc), (PRIVATE_FILES_FILE, _private_file_search_doc)):
+        for pair_key in store_keys(path):
+            pair = pair_key.split("|")
+            if company_code:
+                if not set(pair) <= members:
+                    continue
+            elif usernames[0] not in pair or any(get_user_info(user).get("company_code") for user in pair):
+                continue
+            documents += [build_doc(record) for record in store_get(path, pair_key, [])
+                          if not record.get("deleted", False)]
+    
+    for username, user_data in zip(usernames, load_user_files(usernames, ("tasks", "assigned_tasks"))):
+        if user_data is not None:
+            tasks = {collection: all_user_tasks(user_data, collection) for collection in TASK_ARCHIVE_COLLECTIONS}
+            documents += list(_user_task_search_docs(username, tasks).values())
+    
+    index_search_documents(key, documents)
+    if "built" not in store_get_counters(SEARCH_INDEX_FILE, key):
+        store_incr_counter(SEARCH_INDEX_FILE, key, "built")
+
+@st.cache_resource
+def _get_search_indexes() -> Dict[str, Any]:
+    """Get the process-wide in-memory search indexes by partition key."""
+    return {"partitions": {}, "lock": threading.Lock()}
+
+def _reset_search_index(index: Dict[str, Any]):
+    """Empty an in-memory search index."""
+    index.update({"cursor": None, "docs": {}, "postings": {}, "vocab": [], "total_length": 0,
+                  "names": {}, "trigrams": {}})
+
+def _search_index_add(index: Dict[str, Any], document: Dict[str, Any]):
+    """Apply one written search document (or tombstone) to an in-memory index."""
+    document_id = document.get("id")
+    previous = index["docs"].pop(document_id, None)
+    if previous is not None:
+        _, term_counts, length = previous
+        index["total_length"] -= length
+        for term in term_counts:
+            postings = index["postings"][term]
+            postings.discard(document_id)
+            if not postings:
+                del index["postings"][term]
+                del index["vocab"][bisect.bisect_left(index["vocab"], term)]
+    previous_name = index["names"].pop(document_id, None)
+    if previous_name is not None:
+        for trigram in frozenset().union(*previous_name[1]):
+            postings = index["trigrams"][trigram]
+            postings.discard(document_id)
+            if not postings:
+                del index["trigrams"][trigram]
+    if document.get("deleted"):
+        return
     
-    return True, f"Integration '{name}' created successfully!"
-
-def get_company_integrations(company_code: str) -> List[Dict[str, Any]]:
-    """Get all integrations for a company."""
-    integrations_data = load_integrations_data()
-    return integrations_data.get(company_code, [])
+    term_counts = Counter(_search_tokens(document.get("text", "")))
+    length = sum(term_counts.values())
+    index["docs"][document_id] = (document, term_counts, length)
+    index["total_length"] += length
+    for term in term_counts:
+        if term not in index["postings"]:
+            index["postings"][term] = set()
+            bisect.insort(index["vocab"], term)
+        index["postings"][term].add(document_id)
+    
+    words = _search_tokens(document.get("name", ""))
+    if words:
+        word_trigrams = [_word_trigrams(word) for word in words]
+        index["names"][document_id] = (" ".join(words), word_trigrams)
+        for trigram in frozenset().union(*word_trigrams):
+            index["trigrams"].setdefault(trigram, set()).add(document_id)
+
+def _get_search_index(key: str) -> Dict[str, Any]:
+    """Get the in-memory index of a search partition (catch it up under its lock before use)."""
+    indexes = _get_search_indexes()
+    with indexes["lock"]:
+        if key not in indexes["partitions"]:
+            indexes["partitions"][key] = {"lock": threading.Lock(), "built": False}
+            _reset_search_index(indexes["partitions"][key])
+        return indexes["partitions"][key]
+
+def _catch_up_search_index(key: str, index: Dict[str, Any]):
+    """Apply the documents written since an in-memory index was last read (caller holds its lock)."""
+    if not index["built"]:
+        if "built" not in store_get_counters(SEARCH_INDEX_FILE, key):
+            rebuild_search_index(key)
+        index["built"] = True
+    
+    documents, cursor = store_read_since(SEARCH_INDEX_FILE, key, index["cursor"])
+    if documents is None:
+        # The partition was compacted since the last read; start over
+        _reset_search_index(index)
+        documents, cursor = store_read_since(SEARCH_INDEX_FILE, key)
+    full_read = index["cursor"] is None
+    for document in documents:
+        _search_index_add(index, document)
+    index["cursor"] = cursor
+    
+    # Reading the partition through store_get lets the store queue dropping
+    # superseded versions; the next catch-up then starts over from the compacted log
+    if full_read and len(documents) >= LOG_COMPACT_MIN_EVENTS and len(documents) > 2 * len(index["docs"]):
+        store_get(SEARCH_INDEX_FILE, key)
+
+def _expand_search_term(index: Dict[str, Any], term: str) -> List[str]:
+    """Get the indexed terms a query term matches (itself and words it is a prefix of)."""
+    vocab = index["vocab"]
+    expansions = []
+    for position in range(bisect.bisect_left(vocab, term), len(vocab)):
+        if not vocab[position].startswith(term) or len(expansions) >= SEARCH_PREFIX_EXPANSIONS:
+            break
+        expansions.append(vocab[position])
+    return expansions
+
+def search_partition(key: str, username: Optional[str], query: str, kinds: Optional[List[str]] = None,
+                     limit: Optional[int] = SEARCH_PAGE_SIZE, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """Search one search index partition.
+    
+    Every query term has to match a document, either exactly or as the prefix
+    of one of its words. Matches are ranked by BM25, newest first on ties, and
+    restricted to `kinds` and to documents `username` may see. Returns
+    (results[offset:offset + limit], total number of matches); each result is
+    the document's display dict plus its "score".
+    """
+    terms = list(dict.fromkeys(_search_tokens(query)))
+    if not terms:
+        return [], 0
+    
+    index = _get_search_index(key)
+    with index["lock"]:
+        _catch_up_search_index(key, index)
+        document_count = len(index["docs"])
+        average_length = index["total_length"] / document_count if document_count else 0
+        
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for expansion in _expand_search_term(index, term):
+                postings = index["postings"][expansion]
+                idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for document_id in postings:
+                    _, term_counts, length = index["docs"][document_id]
+                    frequency = term_counts[expansion]
+                    norm = 1 - SEARCH_BM25_B + SEARCH_BM25_B * length / average_length
+                    score = idf * frequency * (SEARCH_BM25_K1 + 1) / (frequency + SEARCH_BM25_K1 * norm)
+                    # A word matched by several expansions counts once
+                    term_scores[document_id] = max(score, term_scores.get(document_id, 0.0))
+            scores = term_scores if scores is None else {
+                document_id: scores[document_id] + score
+                for document_id, score in term_scores.items() if document_id in scores
+            }
+            if not scores:
+                return [], 0
+        
+        matches = []
+        for document_id, score in scores.items():
+            document = index["docs"][document_id][0]
+            if kinds is not None and document.get("kind") not in kinds:
+                continue
+            visible_to = document.get("visible_to")
+            if visible_to is not None and username not in visible_to:
+                continue
+            matches.append((score, document))
+    
+    matches.sort(key=lambda match: match[1].get("timestamp") or "", reverse=True)
+    matches.sort(key=lambda match: match[0], reverse=True)
+    page = matches[offset:] if limit is None else matches[offset:offset + limit]
+    return [dict(document["result"], score=round(score, 4)) for score, document in page], len(matches)
+
+def search_index(username: str, query: str, kinds: Optional[List[str]] = None,
+                 limit: Optional[int] = SEARCH_PAGE_SIZE, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """Search everything a user can see (their company's partition, or their own)."""
+    key = _search_key(get_user_info(username).get("company_code"), username)
+    return search_partition(key, username, query, kinds, limit, offset)
+
+def _trigram_similarity(query_words: List[frozenset], name_words: List[frozenset]) -> float:
+    """Average, over the query's words, of the best trigram similarity with a word of the name."""
+    total = 0.0
+    for query_trigrams in query_words:
+        total += max(len(query_trigrams & word_trigrams) / len(query_trigrams | word_trigrams)
+                     for word_trigrams in name_words)
+    return total / len(query_words)
+
+def search_names(key: str, username: Optional[str], query: str, kinds: Optional[List[str]] = None,
+                 threshold: float = SEARCH_FUZZY_THRESHOLD, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Filter the named documents (members, files, tasks) of a search partition by name.
+    
+    Names containing the query score 1. Otherwise a name scores the average,
+    over the query's words, of the best trigram (Jaccard) similarity with one
+    of its words, and is kept if that reaches `threshold`, so "smiht" still
+    finds "Smith". Typo-tolerant matches are only looked for when the
+    substring matches don't already fill `limit`. Results are ordered by
+    score, then name.
+    """
+    query_tokens = _search_tokens(query)
+    if not query_tokens:
+        return []
+    query = " ".join(query_tokens)
+    query_words = [_word_trigrams(word) for word in query_tokens]
+    inner_trigrams = {word[position:position + 3] for word in query_tokens for position in range(len(word) - 2)}
+    
+    def allowed(document: Dict[str, Any]) -> bool:
+        visible_to = document.get("visible_to")
+        return ((kinds is None or document.get("kind") in kinds) and
+                (visible_to is None or username in visible_to))
+    
+    index = _get_search_index(key)
+    with index["lock"]:
+        _catch_up_search_index(key, index)
+        names = index["names"]
+        
+        # Substring matches contain every trigram inside the query's words
+        if inner_trigrams:
+            candidates = set.intersection(*(index["trigrams"].get(trigram, set()) for trigram in inner_trigrams))
+        else:
+            candidates = names.keys()  # Too short for trigrams; check every name
+        matches = [(1.0, names[document_id][0], index["docs"][document_id][0]) for document_id in candidates
+                   if query in names[document_id][0] and allowed(index["docs"][document_id][0])]
+        
+        if limit is None or len(matches) < limit:
+            # A name can only reach the threshold on some query word if it
+            # shares at least threshold * that word's trigrams
+            shared = Counter()
+            for trigram in frozenset().union(*query_words):
+                shared.update(index["trigrams"].get(trigram, ()))
+            min_shared = threshold * min(len(trigrams) for trigrams in query_words)
+            substring_ids = {document["id"] for _, _, document in matches}
+            for document_id, count in shared.items():
+                if count < min_shared or document_id in substring_ids:
+                    continue
+                name, name_words = names[document_id]
+                similarity = _trigram_similarity(query_words, name_words)
+                if similarity >= threshold and allowed(index["docs"][document_id][0]):
+                    matches.append((similarity, name, index["docs"][document_id][0]))
+    
+    matches.sort(key=lambda match: (-match[0], match[1]))
+    if limit is not None:
+        matches = matches[:limit]
+    return [dict(document["result"], score=round(score, 4)) for score, _, document in matches]
 
 # -------------------------------------------------------------
 # Search Functions
 # -------------------------------------------------------------
-def search_messages(company_code: str, query: str, search_type: str = "all") -> List[Dict[str, Any]]:
-    """Search through chat messages."""
-    results = []
-    
-    if search_type in ["all", "company"]:
-        # Search company chat
-        chat_data = load_chat_data()
-        messages = chat_data.get(company_code, [])
-        
-        for message in messages:
-            if (query.lower() in message.get("message", "").lower() or
-                query.lower() in message.get("from_name", "").lower()):
-                results.append({
-                    "type": "company_chat",
-                    "message": message,
-                    "context": "Company Chat"
-                })
-    
-    if search_type in ["all", "private"]:
-        # Search private chats
-        private_chat_data = load_private_chat_data()
-        
-        for pair_key, messages in private_chat_data.items():
-            if company_code in pair_key:  # Only search within company
-                for message in messages:
-                    if query.lower() in message.get("message", "").lower():
-                        results.append({
-                            "type": "private_chat",
-                            "message": message,
-                            "context": f"Private Chat with {message.get('from_name', 'Unknown')}"
-                        })
-    
+def search_messages(company_code: str, query: str, search_type: str = "all",
+                    username: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Search through chat messages (private ones only from `username`'s own chats)."""
+    kinds = {"company": ["company_chat"], "private": ["private_chat"]}.get(search_type, ["company_chat", "private_chat"])
+    results, _ = search_partition(company_code, username, query, kinds, limit=None)
     return results
 
 def search_tasks(username: str, query: str) -> List[Dict[str, Any]]:
     """Search through user's tasks."""
-    results = []
-    
-    # Search personal tasks
-    user_file = Path(f"user_{username}.json")
-    if user_file.exists():
-        with user_file.open("r", encoding="utf-8") as f:
-            user_data = json.load(f)
-            
-            tasks = user_data.get("tasks", [])
-            for task in tasks:
-                if (query.lower() in task.get("title", "").lower() or
-                    query.lower() in task.get("description", "").lower()):
-                    results.append({
-                        "type": "personal_task",
-                        "task": task,
-                        "context": "Personal Tasks"
-                    })
-            
-            # Search assigned tasks
-            assigned_tasks = user_data.get("assigned_tasks", [])
-            for task in assigned_tasks:
-                if (query.lower() in task.get("title", "").lower() or
-                    query.lower() in task.get("description", "").lower()):
-                    results.append({
-                        "type": "assigned_task",
-                        "task": task,
-                        "context": "Assigned Tasks"
-                    })
-    
+    results, _ = search_index(username, query, ["personal_task", "assigned_task"], limit=None)
     return results
 
 # -------------------------------------------------------------
@@ -2521,26 +5029,14 @@ def search_tasks(username: str, query: str) -> List[Dict[str, Any]]:
 # -------------------------------------------------------------
 def get_user_theme(username: str) -> str:
     """Get user's preferred theme."""
-    user_file = Path(f"user_{username}.json")
-    if user_file.exists():
-        with user_file.open("r", encoding="utf-8") as f:
-            user_data = json.load(f)
-            return user_data.get("settings", {}).get("theme", "light")
+    user_data = _read_user_file(username)
+    if user_data is not None:
+        return user_data.get("settings", {}).get("theme", "light")
     return "light"
 
 def update_user_theme(username: str, theme: str):
     """Update user's theme preference."""
-    user_file = Path(f"user_{username}.json")
-    if user_file.exists():
-        with user_file.open("r", encoding="utf-8") as f:
-            user_data = json.load(f)
-        
-        if "settings" not in user_data:
-            user_data["settings"] = {}
-        user_data["settings"]["theme"] = theme
-        
-        with user_file.open("w", encoding="utf-8") as f:
-            json.dump(user_data, f, indent=2, ensure_ascii=False)
+    update_user_settings(username, {"theme": theme})
 
 def show_login_page():
     """Display enhanced login/register page."""
@@ -2565,7 +5061,7 @@ def show_login_page():
         st.markdown('<h3 class="gradient-text">👋 Welcome Back!</h3>', unsafe_allow_html=True)
         
         with st.form("login_form"):
-            username = st.text_input("Username", placeholder="Enter your username")
+            username = st.text_input("Username or Email", placeholder="Enter your username or email")
             password = st.text_input("Password", type="password", placeholder="Enter your password")
             
             login_button = st.form_submit_button("🔐 Login", use_container_width=True)
@@ -2574,6 +5070,7 @@ def show_login_page():
                 if not username or not password:
                     st.error("Please fill in all fields!")
                 else:
+                    username = lookup_username(username) or username
                     success, message = authenticate_user(username, password)
                     if success:
                         st.session_state["authenticated"] = True
@@ -2658,6 +5155,662 @@ def show_login_page():
     </div>
     """, unsafe_allow_html=True)
 
+# -------------------------------------------------------------
+# Content Moderation
+# -------------------------------------------------------------
+# Blocked words are matched with an Aho-Corasick automaton, compiled once per
+# distinct word list and cached, so a text is checked in a single pass no
+# matter how many words the list has. Matches must be whole words ("class"
+# and "assignment" don't contain "ass"); a list entry ending in "*" also
+# matches any longer word starting with it ("fuck*" matches "fucking").
+# Companies can replace DEFAULT_MODERATION_WORDS in their settings.
+
+def _build_moderation_automaton(words: Tuple[str, ...]) -> Dict[str, Any]:
+    """Compile blocked words into an Aho-Corasick automaton."""
+    goto = [{}]
+    fail = [0]
+    output = [[]]
+    for entry in words:
+        word = entry.rstrip("*")
+        state = 0
+        for char in word:
+            if char not in goto[state]:
+                goto.append({})
+                fail.append(0)
+                output.append([])
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        output[state].append((word, entry.endswith("*")))
+    
+    # Breadth-first, so a state's failure link is final before its children's
+    # are derived from it (states one character deep fail back to the root)
+    queue = list(goto[0].values())
+    for state in queue:
+        for char, next_state in goto[state].items():
+            queue.append(next_state)
+            fallback = fail[state]
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[next_state] = goto[fallback].get(char, 0)
+            output[next_state] = output[next_state] + output[fail[next_state]]
+    return {"goto": goto, "fail": fail, "output": output}
+
+@st.cache_resource
+def _get_moderation_automata() -> Dict[str, Any]:
+    """Get the process-wide cache of compiled moderation automata by word list."""
+    return {"automata": OrderedDict(), "lock": threading.Lock()}
+
+def _moderation_automaton(words: List[str]) -> Dict[str, Any]:
+    """Get the compiled automaton of a word list, compiling it on first use."""
+    cache_key = tuple(sorted({word.strip().lower() for word in words if word.strip().rstrip("*")}))
+    cache = _get_moderation_automata()
+    with cache["lock"]:
+        automaton = cache["automata"].get(cache_key)
+        if automaton is not None:
+            cache["automata"].move_to_end(cache_key)
+            return automaton
+    
+    automaton = _build_moderation_automaton(cache_key)
+    with cache["lock"]:
+        cache["automata"][cache_key] = automaton
+        while len(cache["automata"]) > MODERATION_AUTOMATON_CACHE_SIZE:
+            cache["automata"].popitem(last=False)
+    return automaton
+
+def get_moderation_words(company_code: Optional[str] = None) -> List[str]:
+    """Get the blocked word list of a company (the default list without one)."""
+    if company_code:
+        company_words = store_get(COMPANIES_FILE, company_code, {}).get("company_settings", {}).get("moderation_words")
+        if company_words is not None:
+            return company_words
+    return DEFAULT_MODERATION_WORDS
+
+def _is_word_char(char: str) -> bool:
+    """Check whether a character continues a word."""
+    return char.isalnum() or char == "_"
+
+def _scan_for_blocked_words(automaton: Dict[str, Any], content: str) -> List[Dict[str, Any]]:
+    """Run a moderation automaton over content in one pass."""
+    goto, fail, output = automaton["goto"], automaton["fail"], automaton["output"]
+    root = goto[0]
+    
+    lowered = content.lower()
+    if len(lowered) != len(content):
+        # Some characters lower-case to several; keep positions aligned with content
+        lowered = "".join(char.lower() if len(char.lower()) == 1 else char for char in content)
+    
+    matches = []
+    state = 0
+    for position, char in enumerate(lowered):
+        if not state:
+            state = root.get(char, 0)
+            if not state:
+                continue
+        else:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+        for word, any_ending in output[state]:
+            start = position + 1 - len(word)
+            if start > 0 and _is_word_char(content[start - 1]):
+                continue
+            end = position + 1
+            if any_ending:
+                while end < len(content) and _is_word_char(content[end]):
+                    end += 1
+            elif end < len(content) and _is_word_char(content[end]):
+                continue
+            matches.append({"word": word, "start": start, "end": end, "text": content[start:end]})
+    
+    matches.sort(key=lambda match: (match["start"], match["end"]))
+    return matches
+
+def find_inappropriate_language(content: str, company_code: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Find every blocked word in content.
+    
+    Returns one {"word", "start", "end", "text"} dict per match in order of
+    position, where content[start:end] is the matched text and "word" is the
+    blocked word it matched (without any trailing "*").
+    """
+    return _scan_for_blocked_words(_moderation_automaton(get_moderation_words(company_code)), content)
+
+def validate_contents(fields: Dict[str, str], company_code: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Check several fields at once; returns the matches of every field that has any."""
+    automaton = _moderation_automaton(get_moderation_words(company_code))
+    results = {}
+    for field, content in fields.items():
+        matches = _scan_for_blocked_words(automaton, content or "")
+        if matches:
+            results[field] = matches
+    return results
+
+def describe_inappropriate_language(matches: List[Dict[str, Any]]) -> str:
+    """Describe moderation matches for an error message."""
+    found = list(dict.fromkeys(match["text"] for match in matches))
+    return f"Content contains inappropriate language: {', '.join(repr(text) for text in found)}"
+
+# -------------------------------------------------------------
+# User Data Storage
+# -------------------------------------------------------------
+# A user's data is split into one store per collection so that a page only
+# parses what it renders: user_<name>.<collection>.json for each of
+# USER_DATA_COLLECTIONS and user_<name>.json for every other field
+# (categories, ...), which also marks that the user exists. Each of these
+# parts is a dict of the fields it holds plus its own "_version", and a
+# missing collection file holds what a new user starts with (so registering
+# writes only user_<name>.json). load_data hands out a UserData proxy that
+# reads a part the first time one of its fields is used.
+#
+# Single edits are appended to the part's log (user_<name>.log.jsonl or
+# user_<name>.<collection>.log.jsonl) rather than rewriting the part, one
+# event per line:
+#   {"op": "append", "collection": "notes", "record": {...}}
+#   {"op": "update", "collection": "tasks", "id": ..., "fields": {...}}
+#   {"op": "delete", "collection": "tasks", "id": ...}
+#   {"op": "set", "field": "categories", "value": [...]}
+#   {"op": "merge", "field": "settings", "fields": {...}}
+# each stamped with the "version" it brings the part to. Readers apply the
+# events newer than the part file's _version; once USER_LOG_COMPACT_EVENTS
+# have piled up the part file is rewritten and its log dropped (a crash in
+# between only leaves events the new file already covers). Whole saves
+# (save_data) fold the log the same way.
+#
+# Applying an edit needs the current part to find the record, so the folded
+# parts of recently edited users stay in memory, checked against the disk
+# stamps of the part file and its log under the part's _store_lock.
+#
+# A user_<name>.json from before the split still holds everything. The first
+# access splits it under the file's lock: the collection files are written
+# before user_<name>.json is replaced by one marked with "_collections", so
+# a crash part-way leaves the old file in charge.
+
+USER_DATA_COLLECTIONS = ("tasks", "notes", "contacts", "goals", "assigned_tasks", "settings")
+
+def _user_data_part(field: str) -> Optional[str]:
+    """Get the part a field of user data lives in (None for user_<name>.json)."""
+    return field if field in USER_DATA_COLLECTIONS else None
+
+def _user_part_file(username: str, part: Optional[str] = None) -> Path:
+    """Get the file of one part of a user's data."""
+    return Path(f"user_{username}.json" if part is None else f"user_{username}.{part}.json")
+
+def _user_log_file(username: str, part: Optional[str] = None) -> Path:
+    """Get the edit log of one part of a user's data."""
+    return Path(f"user_{username}.log.jsonl" if part is None else f"user_{username}.{part}.log.jsonl")
+
+def _user_data_stamp(username: str, part: Optional[str] = None) -> Tuple[Optional[Tuple[int, int, int]], Optional[Tuple[int, int, int]]]:
+    """Get the disk stamps of one part of a user's data and its edit log."""
+    return (_json_store_disk_stamp(_user_part_file(username, part)),
+            _json_store_disk_stamp(_user_log_file(username, part)))
+
+def _apply_user_event(data: dict, event: dict):
+    """Apply one logged edit to a part of user data."""
+    op = event.get("op")
+    if op == "set":
+        data[event["field"]] = event["value"]
+    elif op == "merge":
+        data.setdefault(event["field"], {}).update(event["fields"])
+    else:
+        records = data.setdefault(event["collection"], [])
+        if op == "append":
+            records.append(event["record"])
+        else:
+            for position, record in enumerate(records):
+                if record.get("id") == event.get("id"):
+                    if op == "update":
+                        record.update(event["fields"])
+                    else:
+                        del records[position]
+                    break
+    data["_version"] = event["version"]
+
+def _fold_user_part(username: str, part: Optional[str] = None) -> Tuple[Optional[dict], int]:
+    """Read one part of a user's data and apply its edit log; returns (part, logged events).
+    
+    The part is None only when user_<name>.json itself is missing.
+    """
+    part_file = _user_part_file(username, part)
+    while True:
+        stamp = _json_store_disk_stamp(part_file)
+        try:
+            with part_file.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            if part is None:
+                return None, 0
+            data = {part: _new_user_data()[part]}
+        
+        events = 0
+        try:
+            with _user_log_file(username, part).open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn write from a crash mid-append
+                    events += 1
+                    if event.get("version", 0) > data.get("_version", 0):
+                        _apply_user_event(data, event)
+        except FileNotFoundError:
+            pass
+        
+        # A compaction in between may have dropped log events the data read above lacks
+        if _json_store_disk_stamp(part_file) == stamp:
+            return data, events
+
+@st.cache_resource
+def _get_user_data_states() -> Dict[str, Any]:
+    """Get the process-wide folded parts of recently edited users."""
+    return {"parts": OrderedDict(), "split": set(), "lock": threading.Lock()}
+
+def _write_new_user_data(username: str, data: dict):
+    """Write a new user's data, one file per collection that isn't as for any new user."""
+    defaults = _new_user_data()
+    for collection in USER_DATA_COLLECTIONS:
+        if collection in data and data[collection] != defaults[collection]:
+            write_json_file(_user_part_file(username, collection), {"_version": 1, collection: data[collection]})
+    main_part = {field: value for field, value in data.items() if field not in USER_DATA_COLLECTIONS}
+    # Past every edit logged against a file from before the split
+    main_part["_version"] = data.get("_version", 0) + 1
+    main_part["_collections"] = list(USER_DATA_COLLECTIONS)
+    write_json_file(_user_part_file(username), main_part)
+    _user_log_file(username).unlink(missing_ok=True)
+
+def _user_data_ready(username: str) -> bool:
+    """Split a user's data into its collection files unless done already; False if there is no such user."""
+    states = _get_user_data_states()
+    if username in states["split"]:
+        return True
+    
+    user_file = _user_part_file(username)
+    with _store_lock(user_file):
+        data, _ = _fold_user_part(username)
+        if data is None:
+            return False
+        if "_collections" not in data:
+            _write_new_user_data(username, data)
+    with states["lock"]:
+        states["split"].add(username)
+    return True
+
+def _user_data_state(username: str, part: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Get one folded part of a user's data and its log size for applying edits (hold its _store_lock)."""
+    states = _get_user_data_states()
+    stamp = _user_data_stamp(username, part)
+    with states["lock"]:
+        state = states["parts"].get((username, part))
+        if state is not None and state["stamp"] == stamp:
+            states["parts"].move_to_end((username, part))
+            return state
+    
+    data, events = _fold_user_part(username, part)
+    if data is None:
+        return None
+    state = {"stamp": stamp, "data": data, "events": events}
+    with states["lock"]:
+        states["parts"][(username, part)] = state
+        while len(states["parts"]) > USER_DATA_STATE_CACHE_SIZE:
+            states["parts"].popitem(last=False)
+    return state
+
+def _write_user_part(username: str, part: Optional[str], data: dict):
+    """Write one part of a user's data as its next version (hold its _store_lock)."""
+    data["_version"] = data.get("_version", 0) + 1
+    write_json_file(_user_part_file(username, part), data)
+    # Every logged edit is folded into data, so the log is spent
+    _user_log_file(username, part).unlink(missing_ok=True)
+    if part in TASK_ARCHIVE_COLLECTIONS:
+        _lower_task_archive_due(username, part, data.get(part, []))
+
+class UserData(MutableMapping):
+    """A user's data, reading each collection's file the first time it is used.
+    
+    With `session` set (load_data), every part read is remembered as the
+    base save_data merges the session's changes against.
+    """
+    
+    def __init__(self, username: str, session: bool = False):
+        self.username = username
+        self.session = session
+        self.parts: Dict[Optional[str], dict] = {}
+    
+    def part(self, part: Optional[str]) -> dict:
+        """Get one part of the data, reading it on first use."""
+        if part not in self.parts:
+            data = None
+            if _user_data_ready(self.username):
+                data, _ = _fold_user_part(self.username, part)
+            self.parts[part] = data if data is not None else {}
+            if self.session:
+                _remember_user_data_base(self.username, part, self.parts[part])
+        return self.parts[part]
+    
+    def __getitem__(self, field: str) -> Any:
+        return self.part(_user_data_part(field))[field]
+    
+    def __setitem__(self, field: str, value: Any):
+        self.part(_user_data_part(field))[field] = value
+    
+    def __delitem__(self, field: str):
+        del self.part(_user_data_part(field))[field]
+    
+    def __iter__(self):
+        for part in (None,) + USER_DATA_COLLECTIONS:
+            yield from (field for field in self.part(part) if not field.startswith("_"))
+    
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+def _patch_user_data(username: str, event: dict) -> Optional[Tuple[Optional[dict], Optional[dict]]]:
+    """Log one edit of a user's data.
+    
+    Returns copies of the edited record before and after the edit ((None,
+    None) for field edits), or None if the user or the record doesn't exist.
+    """
+    if not _user_data_ready(username):
+        return None
+    
+    part = _user_data_part(event.get("collection") or event["field"])
+    part_file = _user_part_file(username, part)
+    with _store_lock(part_file):
+        state = _user_data_state(username, part)
+        data = state["data"]
+        before = None
+        if event["op"] in ("update", "delete"):
+            before = next((record for record in data.get(event["collection"], [])
+                           if record.get("id") == event["id"]), None)
+            if before is None:
+                return None
+            before = dict(before)
+        
+        # Round-trip through JSON so the caller's objects aren't shared with the state
+        event = json.loads(json.dumps(dict(event, version=data.get("_version", 0) + 1), ensure_ascii=False))
+        _log_append(_user_log_file(username, part), [event])
+        _apply_user_event(data, event)
+        state["events"] += 1
+        if state["events"] >= USER_LOG_COMPACT_EVENTS:
+            write_json_file(part_file, data)
+            _user_log_file(username, part).unlink(missing_ok=True)
+            state["events"] = 0
+        state["stamp"] = _user_data_stamp(username, part)
+        
+        after = None
+        if event["op"] == "append":
+            after = dict(event["record"])
+        elif event["op"] == "update":
+            after = dict(before, **event["fields"])
+        if after is not None and part in TASK_ARCHIVE_COLLECTIONS:
+            _lower_task_archive_due(username, part, [after])
+        return before, after
+
+def _record_user_edit(username: str, collection: str, before: Optional[dict], after: Optional[dict]):
+    """Bring the search index and team statistics up to date after a record edit."""
+    if collection in ("tasks", "assigned_tasks"):
+        reindex_user_tasks(username, {collection: [before]} if before else None,
+                           {collection: [after]} if after else None)
+    if collection == "assigned_tasks":
+        record_assigned_task_change(username, before, after)
+
+def _team_stats_edit_lock(username: str, collection: str):
+    """Get the lock to hold across an edit of a user's records and its team statistics update.
+    
+    Assigned task edits hold their company's _team_stats_lock, so a recount
+    sees each edit either with its counter update or not at all.
+    """
+    company_code = get_user_info(username).get("company_code") if collection == "assigned_tasks" else None
+    return _team_stats_lock(company_code) if company_code else contextlib.nullcontext()
+
+def _edit_user_record(username: str, collection: str, event: dict) -> bool:
+    """Log one record edit of a user's data and bring what depends on it up to date."""
+    with _team_stats_edit_lock(username, collection):
+        result = _patch_user_data(username, event)
+        if result is None:
+            return False
+        _record_user_edit(username, collection, *result)
+    return True
+
+def append_user_record(username: str, collection: str, record: dict) -> bool:
+    """Append a record (task, note, contact, goal, ...) to a user's data."""
+    return _edit_user_record(username, collection, {"op": "append", "collection": collection, "record": record})
+
+def update_user_record(username: str, collection: str, record_id: str, fields: dict) -> bool:
+    """Update fields of one record of a user's data."""
+    return _edit_user_record(username, collection,
+                             {"op": "update", "collection": collection, "id": record_id, "fields": fields})
+
+def delete_user_record(username: str, collection: str, record_id: str) -> bool:
+    """Delete one record of a user's data."""
+    return _edit_user_record(username, collection, {"op": "delete", "collection": collection, "id": record_id})
+
+def set_user_field(username: str, field: str, value: Any) -> bool:
+    """Replace one top-level field (categories, settings, ...) of a user's data."""
+    return _patch_user_data(username, {"op": "set", "field": field, "value": value}) is not None
+
+def update_user_settings(username: str, fields: dict) -> bool:
+    """Update some of a user's settings."""
+    return _patch_user_data(username, {"op": "merge", "field": "settings", "fields": fields}) is not None
+
+def update_task(username: str, task_id: str, fields: dict) -> bool:
+    """Update fields of one of a user's personal tasks."""
+    return update_user_record(username, "tasks", task_id, fields)
+
+def update_assigned_task(username: str, task_id: str, fields: dict) -> bool:
+    """Update fields of one of the tasks assigned to a user."""
+    return update_user_record(username, "assigned_tasks", task_id, fields)
+
+def append_note(username: str, note: dict) -> bool:
+    """Add a note to a user's data."""
+    return append_user_record(username, "notes", note)
+
+# -------------------------------------------------------------
+# Completed Task Archive
+# -------------------------------------------------------------
+# Completed tasks pile up in user_<name>.tasks.json (and .assigned_tasks.json)
+# and would be parsed on every page forever, so a periodic job moves those
+# completed more than TASK_ARCHIVE_AGE_DAYS ago into gzip-compressed segments,
+# user_<name>.<collection>.archive.<n>.json.gz, of at most
+# TASK_ARCHIVE_SEGMENT_SIZE tasks each, oldest completion first. The
+# collection part lists its segments under "_archive" as
+#   {"segment": n, "count": ..., "oldest": <completed_at>, "newest": <completed_at>}
+# and both are written under the part's _store_lock, the segments first, so
+# a crash in between only leaves a segment the next run overwrites.
+#
+# Archiving is not an edit: the search index and team counters keep
+# counting archived tasks, and paths that need every task (counter and
+# index rebuilds, the team task table, exports) read the segments back
+# through all_user_tasks. The completed task views page into them with
+# get_archived_tasks. Segments never change once listed, so decompressed
+# ones are kept in a small process-wide cache.
+#
+# So that the job only opens the files of users with something to archive,
+# TASK_ARCHIVE_DUE_FILE maps "<collection>:<username>" to the oldest
+# completed_at still in that collection part. Writes of the part only ever
+# lower it; archive_completed_tasks sets it exactly (or drops it). Both run
+# under the part's _store_lock. The first run of the job visits every user
+# once to seed it.
+
+TASK_ARCHIVE_COLLECTIONS = ("tasks", "assigned_tasks")
+
+def _task_archive_due_key(username: str, collection: str) -> str:
+    """Get the archive watermark key of one of a user's task collections."""
+    return f"{collection}:{username}"
+
+def _oldest_completed_at(tasks: List[dict]) -> Optional[str]:
+    """Get the earliest completed_at of the completed tasks (None if there are none)."""
+    return min((task["completed_at"] for task in tasks if task.get("completed", False) and task.get("completed_at")),
+               default=None)
+
+def _lower_task_archive_due(username: str, collection: str, tasks: List[dict]):
+    """Lower a collection's archive watermark to cover these tasks (hold the part's _store_lock)."""
+    oldest = _oldest_completed_at(tasks)
+    if oldest is None:
+        return
+    key = _task_archive_due_key(username, collection)
+    current = store_get(TASK_ARCHIVE_DUE_FILE, key)
+    if current is None or oldest < current:
+        store_put(TASK_ARCHIVE_DUE_FILE, key, oldest)
+
+def _set_task_archive_due(username: str, collection: str, oldest: Optional[str]):
+    """Set a collection's archive watermark, dropping it when nothing is completed (hold the part's _store_lock)."""
+    key = _task_archive_due_key(username, collection)
+    if store_get(TASK_ARCHIVE_DUE_FILE, key) == oldest:
+        return
+    if oldest is None:
+        store_delete(TASK_ARCHIVE_DUE_FILE, key)
+    else:
+        store_put(TASK_ARCHIVE_DUE_FILE, key, oldest)
+
+def _task_archive_cutoff() -> str:
+    """Get the completed_at before which tasks are archived."""
+    return (datetime.datetime.now() - datetime.timedelta(days=TASK_ARCHIVE_AGE_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+
+def _task_archive_file(username: str, collection: str, segment: int) -> Path:
+    """Get the file of one archive segment of a user's tasks."""
+    return Path(f"user_{username}.{collection}.archive.{segment}.json.gz")
+
+def _write_task_archive_segment(path: Path, tasks: List[dict]):
+    """Write an archive segment atomically."""
+    tmp_file = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    with tmp_file.open("wb") as f:
+        with gzip.GzipFile(fileobj=f, mode="wb") as gz:
+            gz.write(json.dumps(tasks, ensure_ascii=False).encode("utf-8"))
+        _sync_file(f)
+    _replace_file(tmp_file, path)
+
+@st.cache_resource
+def _get_task_archive_cache() -> Dict[str, Any]:
+    """Get the process-wide cache of decompressed archive segments."""
+    return {"segments": OrderedDict(), "lock": threading.Lock()}
+
+def _read_task_archive_segment(username: str, collection: str, segment: int) -> List[dict]:
+    """Read one archive segment of a user's tasks (shared; don't modify the tasks)."""
+    path = _task_archive_file(username, collection, segment)
+    stamp = _json_store_disk_stamp(path)
+    cache = _get_task_archive_cache()
+    with cache["lock"]:
+        entry = cache["segments"].get(str(path))
+        if entry is not None and entry[0] == stamp:
+            cache["segments"].move_to_end(str(path))
+            return entry[1]
+    
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            tasks = json.load(f)
+    except FileNotFoundError:
+        tasks = []
+    with cache["lock"]:
+        cache["segments"][str(path)] = (stamp, tasks)
+        while len(cache["segments"]) > TASK_ARCHIVE_SEGMENT_CACHE_SIZE:
+            cache["segments"].popitem(last=False)
+    return tasks
+
+def _task_archive_segments(data: UserData, collection: str) -> List[Dict[str, Any]]:
+    """Get the archive segments listed in a user's data, oldest first."""
+    return data.part(collection).get("_archive", [])
+
+def count_archived_tasks(data: UserData, collection: str = "tasks") -> int:
+    """Count a user's archived tasks without reading the archive."""
+    return sum(segment["count"] for segment in _task_archive_segments(data, collection))
+
+def get_archived_tasks(data: UserData, collection: str = "tasks", page: int = 0,
+                       page_size: int = TASK_ARCHIVE_PAGE_SIZE) -> List[dict]:
+    """Get one page of a user's archived tasks, most recently completed first."""
+    skip = page * page_size
+    tasks = []
+    for segment in reversed(_task_archive_segments(data, collection)):
+        if skip >= segment["count"]:
+            skip -= segment["count"]
+            continue
+        newest_first = _read_task_archive_segment(data.username, collection, segment["segment"])[::-1]
+        tasks += newest_first[skip:skip + page_size - len(tasks)]
+        skip = 0
+        if len(tasks) >= page_size:
+            break
+    return tasks
+
+def all_user_tasks(data: UserData, collection: str = "tasks") -> List[dict]:
+    """Get a user's tasks including the archived ones, oldest archived first."""
+    tasks = data.get(collection, [])
+    # A stale session's save may bring an archived task back; its live copy wins
+    live_ids = {task.get("id") for task in tasks}
+    archived = [task
+                for segment in _task_archive_segments(data, collection)
+                for task in _read_task_archive_segment(data.username, collection, segment["segment"])
+                if task.get("id") not in live_ids]
+    return archived + tasks
+
+def archive_completed_tasks(username: str) -> int:
+    """Move a user's tasks completed more than TASK_ARCHIVE_AGE_DAYS ago to the archive; returns how many moved."""
+    if not _user_data_ready(username):
+        for collection in TASK_ARCHIVE_COLLECTIONS:
+            store_delete(TASK_ARCHIVE_DUE_FILE, _task_archive_due_key(username, collection))
+        return 0
+    
+    cutoff = _task_archive_cutoff()
+    moved = 0
+    for collection in TASK_ARCHIVE_COLLECTIONS:
+        with _store_lock(_user_part_file(username, collection)):
+            data, _ = _fold_user_part(username, collection)
+            kept, old = [], []
+            for task in data.get(collection, []):
+                is_old = task.get("completed", False) and task.get("completed_at") and task["completed_at"] < cutoff
+                (old if is_old else kept).append(task)
+            if old:
+                old.sort(key=lambda task: task["completed_at"])
+                segments = data.setdefault("_archive", [])
+                next_segment = max((segment["segment"] for segment in segments), default=0) + 1
+                for start in range(0, len(old), TASK_ARCHIVE_SEGMENT_SIZE):
+                    chunk = old[start:start + TASK_ARCHIVE_SEGMENT_SIZE]
+                    _write_task_archive_segment(_task_archive_file(username, collection, next_segment), chunk)
+                    segments.append({"segment": next_segment, "count": len(chunk),
+                                     "oldest": chunk[0]["completed_at"], "newest": chunk[-1]["completed_at"]})
+                    next_segment += 1
+                data[collection] = kept
+                _write_user_part(username, collection, data)
+            _set_task_archive_due(username, collection, _oldest_completed_at(kept))
+        moved += len(old)
+    return moved
+
+def clear_task_archive(username: str):
+    """Delete all of a user's archived tasks, from the search index and team counters too."""
+    if not _user_data_ready(username):
+        return
+    
+    for collection in TASK_ARCHIVE_COLLECTIONS:
+        with _team_stats_edit_lock(username, collection):
+            with _store_lock(_user_part_file(username, collection)):
+                data, _ = _fold_user_part(username, collection)
+                segments = data.pop("_archive", [])
+                if not segments:
+                    continue
+                archived = [task for segment in segments
+                            for task in _read_task_archive_segment(username, collection, segment["segment"])]
+                _write_user_part(username, collection, data)
+            
+            if collection == "assigned_tasks":
+                for task in archived:
+                    record_assigned_task_change(username, task, None)
+        
+        for segment in segments:
+            _task_archive_file(username, collection, segment["segment"]).unlink(missing_ok=True)
+        reindex_user_tasks(username, {collection: archived}, None)
+
+def _run_archive_completed_tasks_job(job_id: str, payload: Dict[str, Any]):
+    """Background job: archive the long-completed tasks of the users that have any."""
+    if "built" not in store_get_counters(TASK_ARCHIVE_DUE_FILE, "meta"):
+        for username in store_keys(AUTH_FILE):
+            archive_completed_tasks(username)
+        store_incr_counter(TASK_ARCHIVE_DUE_FILE, "meta", "built")
+        return
+    
+    cutoff = _task_archive_cutoff()
+    due = {key.split(":", 1)[1] for key, oldest in store_load_all(TASK_ARCHIVE_DUE_FILE).items() if oldest < cutoff}
+    for username in sorted(due):
+        archive_completed_tasks(username)
+
+JOB_HANDLERS["archive_completed_tasks"] = _run_archive_completed_tasks_job
+PERIODIC_JOBS["archive_completed_tasks"] = TASK_ARCHIVE_SECONDS
+
 # -------------------------------------------------------------
 # Helper Functions
 # -------------------------------------------------------------
@@ -2667,7 +5820,7 @@ def load_data():
         return {}
     
     username = st.session_state["username"]
-    user_file = Path(f"user_{username}.json")
+    user_file = _user_part_file(username)
     
     if not user_file.exists():
         initial_data = {
@@ -2687,21 +5840,152 @@ def load_data():
                 "show_team_tasks": True
             }
         }
-        user_file.write_text(json.dumps(initial_data, indent=2), encoding="utf-8")
+        _write_new_user_data(username, initial_data)
     
-    with user_file.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return UserData(username, session=True)
 
 def save_data(data: dict):
-    """Save user data."""
+    """Save user data, merging in changes other sessions made since it was loaded."""
     if "username" not in st.session_state:
         return
     
     username = st.session_state["username"]
-    user_file = Path(f"user_{username}.json")
+    if not _user_data_ready(username):
+        return
+    
+    previous_tasks, saved_tasks = {}, {}
+    for part, part_data in data.parts.items():
+        with _store_lock(_user_part_file(username, part)):
+            previous_data = _fold_user_part(username, part)[0] or {}
+            base = _user_data_base(username, part, part_data.get("_version", 0))
+            if base is not None and _record_etag(base) == _record_etag(part_data):
+                continue  # Only read this rerun
+            if previous_data.get("_version", 0) != part_data.get("_version", 0):
+                merged = _merge_user_data(base, part_data, previous_data)
+                part_data.clear()
+                part_data.update(merged)
+            part_data["_version"] = previous_data.get("_version", 0)
+            _write_user_part(username, part, part_data)
+        
+        _remember_user_data_base(username, part, part_data)
+        if part in ("tasks", "assigned_tasks"):
+            previous_tasks[part] = previous_data.get(part, [])
+            saved_tasks[part] = part_data.get(part, [])
+    
+    if saved_tasks:
+        reindex_user_tasks(username, previous_tasks, saved_tasks)
+
+# Each part of a user's data carries a "_version" that every write bumps. A
+# session works on the parts load_data gave it for a whole rerun while other
+# sessions may write the same files meanwhile (assign_task_to_user adds to
+# the assignee's assigned tasks), so writers hold the part's _store_lock and
+# save_data compares versions part by part: if a part moved on, the
+# session's changes are merged into the newer part instead of overwriting
+# it. The merge is three-way against the copy the session read (kept pickled
+# in session_state by part and version): lists of records are merged record
+# by record using a content-hash ETag to tell which side changed each
+# record, any other field is taken from whichever side changed it, and the
+# session wins when both did. Parts the session only read match their base
+# and aren't written at all.
+
+def _remember_user_data_base(username: str, part: Optional[str], data: dict):
+    """Keep a copy of one part of user data as read or saved, to merge later edits against."""
+    bases = st.session_state.get("user_data_bases")
+    if not bases or bases.get("username") != username:
+        bases = {"username": username, "parts": {}}
+        st.session_state["user_data_bases"] = bases
+    versions = bases["parts"].setdefault(part, OrderedDict())
+    versions[data.get("_version", 0)] = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    versions.move_to_end(data.get("_version", 0))
+    while len(versions) > USER_DATA_BASES_KEPT:
+        versions.popitem(last=False)
+
+def _user_data_base(username: str, part: Optional[str], version: int) -> Optional[dict]:
+    """Get the copy of a version of one part of user data this session read (None if unknown)."""
+    bases = st.session_state.get("user_data_bases")
+    if not bases or bases.get("username") != username or version not in bases["parts"].get(part, {}):
+        return None
+    return pickle.loads(bases["parts"][part][version])
+
+def _record_etag(value: Any) -> str:
+    """Get the content hash identifying one version of a record."""
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _is_record_list(value: Any) -> bool:
+    """Check whether a value is a list of records with ids."""
+    return isinstance(value, list) and all(isinstance(item, dict) and "id" in item for item in value)
+
+def _merge_records(base: List[dict], mine: List[dict], theirs: List[dict]) -> List[dict]:
+    """Three-way merge two edited copies of a list of records."""
+    base_etags = {record["id"]: _record_etag(record) for record in base}
+    mine_by_id = {record["id"]: record for record in mine}
+    theirs_ids = {record["id"] for record in theirs}
+    
+    merged = []
+    for record in theirs:
+        my_record = mine_by_id.get(record["id"])
+        if my_record is None:
+            # Deleted here; an edit made elsewhere meanwhile keeps it alive
+            if base_etags.get(record["id"]) != _record_etag(record):
+                merged.append(record)
+        elif base_etags.get(record["id"]) == _record_etag(my_record):
+            merged.append(record)
+        else:
+            merged.append(my_record)
+    
+    for record in mine:
+        if record["id"] in theirs_ids:
+            continue
+        # Added here, or deleted elsewhere after being edited here
+        if base_etags.get(record["id"]) != _record_etag(record):
+            merged.append(record)
+    return merged
+
+def _merge_user_data(base: Optional[dict], mine: dict, theirs: dict) -> dict:
+    """Three-way merge a session's copy of user data into a newer saved version.
     
-    with user_file.open("w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    Without the base the session loaded, every field of the session's copy
+    counts as changed: records are unioned and other fields taken from it.
+    """
+    base = base or {}
+    merged = {}
+    for field in list(theirs) + [field for field in mine if field not in theirs]:
+        if field == "_version":
+            continue
+        if field in mine and field in theirs and _is_record_list(mine[field]) and _is_record_list(theirs[field]):
+            base_records = base.get(field) if _is_record_list(base.get(field)) else []
+            merged[field] = _merge_records(base_records, mine[field], theirs[field])
+        elif (field in mine) != (field in base) or (field in mine and _record_etag(mine[field]) != _record_etag(base[field])):
+            if field in mine:
+                merged[field] = mine[field]
+        elif field in theirs:
+            merged[field] = theirs[field]
+    return merged
+
+@st.cache_resource
+def _get_user_file_pool() -> ThreadPoolExecutor:
+    """Get the process-wide thread pool for bulk user file loads."""
+    return ThreadPoolExecutor(max_workers=USER_FILE_LOAD_WORKERS, thread_name_prefix="nafup-user-files")
+
+def _read_user_file(username: str) -> Optional[UserData]:
+    """Get one user's data, reading each collection when first used (None if there's no such user)."""
+    if not _user_data_ready(username):
+        return None
+    return UserData(username)
+
+def _read_user_collections(username: str, collections: Tuple[str, ...]) -> Optional[UserData]:
+    """Read some collections of one user's data up front (None if there's no such user)."""
+    data = _read_user_file(username)
+    if data is not None:
+        for collection in collections:
+            data.part(collection)
+    return data
+
+def load_user_files(usernames: List[str], collections: Tuple[str, ...] = USER_DATA_COLLECTIONS) -> List[Optional[UserData]]:
+    """Load some collections of many users' data concurrently, in the order of `usernames`."""
+    if len(usernames) <= 1:
+        return [_read_user_collections(username, collections) for username in usernames]
+    return list(_get_user_file_pool().map(lambda username: _read_user_collections(username, collections), usernames))
 
 def get_current_timestamp():
     """Get current timestamp."""
@@ -2726,30 +6010,16 @@ def refresh_session():
     if "authenticated" in st.session_state and st.session_state["authenticated"]:
         st.session_state["session_timestamp"] = get_session_timestamp()
 
-def validate_content(content: str) -> tuple[bool, str]:
+def validate_content(content: str, company_code: Optional[str] = None) -> tuple[bool, str]:
     """Validate content for inappropriate language."""
-    inappropriate_words = [
-        "fuck", "shit", "bitch", "ass", "dick", "pussy", "cock", "cunt", "whore", "slut",
-        "nigger", "faggot", "retard", "idiot", "stupid", "dumb", "moron"
-    ]
-    
-    content_lower = content.lower()
-    for word in inappropriate_words:
-        if word in content_lower:
-            return False, f"Content contains inappropriate language: '{word}'"
+    matches = find_inappropriate_language(content, company_code)
+    if matches:
+        return False, describe_inappropriate_language(matches)
     
     return True, "Content is appropriate"
 
 def assign_task_to_user(from_username: str, to_username: str, task_data: dict):
     """Assign a task to another user."""
-    # Load target user's data
-    target_user_file = Path(f"user_{to_username}.json")
-    if not target_user_file.exists():
-        return False, "Target user not found!"
-    
-    with target_user_file.open("r", encoding="utf-8") as f:
-        target_data = json.load(f)
-    
     # Create assigned task
     assigned_task = {
         "id": str(uuid.uuid4()),
@@ -2767,14 +6037,10 @@ def assign_task_to_user(from_username: str, to_username: str, task_data: dict):
         "tags": task_data.get("tags", [])
     }
     
-    # Add to target user's assigned tasks
-    if "assigned_tasks" not in target_data:
-        target_data["assigned_tasks"] = []
-    target_data["assigned_tasks"].append(assigned_task)
-    
-    # Save target user's data
-    with target_user_file.open("w", encoding="utf-8") as f:
-        json.dump(target_data, f, indent=2, ensure_ascii=False)
+    # Add to target user's assigned tasks; the assignee's own session merges
+    # this in if it saves a copy loaded before it
+    if not append_user_record(to_username, "assigned_tasks", assigned_task):
+        return False, "Target user not found!"
     
     # Send enhanced task notification
     send_task_notification(to_username, task_data['title'], "assigned", from_username, "high")
@@ -2791,6 +6057,195 @@ def get_role_display(role: str) -> str:
     }
     return role_badges.get(role, f'<span class="role-badge">{role.title()}</span>')
 
+# -------------------------------------------------------------
+# Team Statistics
+# -------------------------------------------------------------
+# Analytics over assigned tasks read per-company counters from TEAM_STATS_FILE
+# instead of opening every employee's file. Each assigned task contributes
+#   tasks, priority:<priority>, assigned:<username>
+# and, once completed,
+#   completed, completed:<username>, day:<completion date>
+# and every assign/complete/incomplete/delete adds the difference between
+# the task's contributions before and after the change. Recent assignments
+# and completions are appended to TEAM_ACTIVITY_FILE. A company is rebuilt
+# from the employee files the first time it is read and then periodically,
+# which also repairs anything changed outside these hooks. A rebuild holds
+# the company's _team_stats_lock and writes the counts as absolute values,
+# so concurrent rebuilds can't add the same correction twice.
+
+def _assigned_task_contributions(username: str, task: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Get the team counters one assigned task contributes to."""
+    if not task:
+        return {}
+    
+    contributions = {"tasks": 1, f"priority:{task.get('priority', 'medium')}": 1, f"assigned:{username}": 1}
+    if task.get("completed", False):
+        contributions["completed"] = 1
+        contributions[f"completed:{username}"] = 1
+        if task.get("completed_at"):
+            contributions[f"day:{task['completed_at'].split()[0]}"] = 1
+    return contributions
+
+def _assigned_task_activities(username: str, task: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Get the activity entries of one assigned task."""
+    activities = [{
+        "id": f"{task.get('id')}:assigned",
+        "type": "task_assigned",
+        "username": username,
+        "title": task.get("title", "Untitled"),
+        "timestamp": task.get("assigned_at", "Unknown")
+    }]
+    if task.get("completed", False):
+        activities.append({
+            "id": f"{task.get('id')}:completed",
+            "type": "task_completed",
+            "username": username,
+            "title": task.get("title", "Untitled"),
+            "timestamp": task.get("completed_at", "Unknown")
+        })
+    return activities
+
+def record_assigned_task_change(username: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+    """Update the team statistics after an assigned task of a user changed.
+    
+    `before` is None for a newly assigned task and `after` is None for a
+    deleted one.
+    """
+    _update_assigner_index(username, before, after)
+    
+    company_code = get_user_info(username).get("company_code")
+    if not company_code:
+        return
+    
+    amounts = _assigned_task_contributions(username, after)
+    for counter_id, amount in _assigned_task_contributions(username, before).items():
+        amounts[counter_id] = amounts.get(counter_id, 0) - amount
+    store_incr_counters(TEAM_STATS_FILE, company_code, {counter_id: amount for counter_id, amount in amounts.items() if amount})
+    
+    task = after or before
+    was_completed = bool(before and before.get("completed", False))
+    is_completed = bool(after and after.get("completed", False))
+    if before is None:
+        store_append(TEAM_ACTIVITY_FILE, company_code, _assigned_task_activities(username, after)[0])
+    if after is None:
+        store_delete_record(TEAM_ACTIVITY_FILE, company_code, f"{task.get('id')}:assigned")
+    if is_completed and not was_completed:
+        store_append(TEAM_ACTIVITY_FILE, company_code, _assigned_task_activities(username, after)[-1])
+    elif was_completed and not is_completed:
+        store_delete_record(TEAM_ACTIVITY_FILE, company_code, f"{task.get('id')}:completed")
+
+# Paths that still need every assigned task (rebuilding the counters, the
+# team performance report) share one columnar table per company, read with a
+# single pass over the employee files. It is cached per company and rebuilt
+# whenever any employee file or edit log changes on disk, i.e. on any task write.
+
+TASK_TABLE_COLUMNS = ["task_id", "title", "assignee", "department", "priority",
+                      "completed", "assigned_at", "completed_at"]
+
+@st.cache_resource
+def _get_task_table_cache() -> Dict[str, Any]:
+    """Get the process-wide cache of per-company task tables."""
+    return {"entries": {}, "lock": threading.Lock()}
+
+def get_company_task_table(company_code: str) -> pd.DataFrame:
+    """Get a company's assigned tasks as a columnar table (one row per task)."""
+    employees = [employee for employee in get_company_employees(company_code) if employee.get("username")]
+    stamps = tuple((employee["username"], _user_data_stamp(employee["username"], "assigned_tasks")) for employee in employees)
+    
+    cache = _get_task_table_cache()
+    with cache["lock"]:
+        entry = cache["entries"].get(company_code)
+    if entry is not None and entry[0] == stamps:
+        return entry[1].copy()
+    
+    rows = []
+    for employee, user_data in zip(employees, load_user_files([employee["username"] for employee in employees], ("assigned_tasks",))):
+        if user_data is None:
+            continue
+        for task in all_user_tasks(user_data, "assigned_tasks"):
+            rows.append((
+                task.get("id"),
+                task.get("title", "Untitled"),
+                employee["username"],
+                employee.get("department", "General"),
+                task.get("priority", "medium"),
+                bool(task.get("completed", False)),
+                task.get("assigned_at", "Unknown"),
+                task.get("completed_at") or None
+            ))
+    table = pd.DataFrame.from_records(rows, columns=TASK_TABLE_COLUMNS)
+    table["completed"] = table["completed"].astype(bool)
+    
+    with cache["lock"]:
+        cache["entries"][company_code] = (stamps, table)
+    return table.copy()
+
+def _team_stats_lock(company_code: str):
+    """Hold the lock that orders changes to a company's team statistics against recounts."""
+    log_file, _ = _counter_files(TEAM_STATS_FILE, company_code)
+    log_file.parent.mkdir(exist_ok=True)
+    return _store_lock(log_file)
+
+def rebuild_team_stats(company_code: str, only_if_unseeded: bool = False) -> Dict[str, int]:
+    """Recount a company's team statistics from the employee files."""
+    with _team_stats_lock(company_code):
+        counters = store_get_counters(TEAM_STATS_FILE, company_code)
+        if only_if_unseeded and "seeded" in counters:
+            return counters  # Seeded by another session meanwhile
+        return _recount_team_stats(company_code)
+
+def _recount_team_stats(company_code: str) -> Dict[str, int]:
+    """Write a company's team counters and activity as counted from the employee files (hold its _team_stats_lock)."""
+    # Read under the lock: the table is re-validated against the employee
+    # files here, and every assigned task edit that reached them has also
+    # reached the counters
+    tasks = get_company_task_table(company_code)
+    completed = tasks[tasks["completed"]]
+    completion_days = completed["completed_at"].dropna().str.split().str[0]
+    
+    wanted = {"seeded": 1}
+    if len(tasks):
+        wanted["tasks"] = len(tasks)
+    if len(completed):
+        wanted["completed"] = len(completed)
+    for prefix, counts in (("priority:", tasks["priority"].value_counts()),
+                           ("assigned:", tasks["assignee"].value_counts()),
+                           ("completed:", completed["assignee"].value_counts()),
+                           ("day:", completion_days.value_counts())):
+        wanted.update({f"{prefix}{value}": int(count) for value, count in counts.items()})
+    
+    store_set_counters(TEAM_STATS_FILE, company_code, wanted)
+    
+    activities = [{"id": f"{row.task_id}:assigned", "type": "task_assigned", "username": row.assignee,
+                   "title": row.title, "timestamp": row.assigned_at}
+                  for row in tasks.itertuples(index=False)]
+    activities += [{"id": f"{row.task_id}:completed", "type": "task_completed", "username": row.assignee,
+                    "title": row.title, "timestamp": row.completed_at or "Unknown"}
+                   for row in completed.itertuples(index=False)]
+    activities.sort(key=lambda activity: activity.get("timestamp", ""))
+    store_put(TEAM_ACTIVITY_FILE, company_code, activities)
+    return wanted
+
+def get_team_stats_counters(company_code: str) -> Dict[str, int]:
+    """Get a company's team counters, building them on first use."""
+    counters = store_get_counters(TEAM_STATS_FILE, company_code)
+    if "seeded" not in counters:
+        return rebuild_team_stats(company_code, only_if_unseeded=True)
+    return counters
+
+def _team_counters_with_prefix(counters: Dict[str, int], prefix: str) -> Dict[str, int]:
+    """Get the counters under one prefix, keyed by the rest of their id."""
+    return {counter_id[len(prefix):]: value for counter_id, value in counters.items()
+            if counter_id.startswith(prefix) and value}
+
+def _run_reconcile_team_stats_job(job_id: str, payload: Dict[str, Any]):
+    """Background job: rebuild every company's team statistics."""
+    for company_code in store_keys(COMPANIES_FILE):
+        rebuild_team_stats(company_code)
+
+JOB_HANDLERS["reconcile_team_stats"] = _run_reconcile_team_stats_job
+PERIODIC_JOBS["reconcile_team_stats"] = TEAM_STATS_RECONCILE_SECONDS
+
 def calculate_team_stats(company_code: str) -> dict:
     """Calculate team statistics."""
     employees = get_company_employees(company_code)
@@ -2798,22 +6253,10 @@ def calculate_team_stats(company_code: str) -> dict:
     total_employees = len(employees)
     active_employees = len([e for e in employees if e.get("active", True)])
     
-    # Calculate task statistics across all employees
-    total_tasks = 0
-    completed_tasks = 0
-    
-    for employee in employees:
-        username = employee.get("username")
-        user_file = Path(f"user_{username}.json")
-        
-        if user_file.exists():
-            with user_file.open("r", encoding="utf-8") as f:
-                user_data = json.load(f)
-                
-                # Count assigned tasks
-                assigned_tasks = user_data.get("assigned_tasks", [])
-                total_tasks += len(assigned_tasks)
-                completed_tasks += len([t for t in assigned_tasks if t.get("completed", False)])
+    # Task statistics across all employees come from the team counters
+    counters = get_team_stats_counters(company_code)
+    total_tasks = counters.get("tasks", 0)
+    completed_tasks = counters.get("completed", 0)
     
     completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
     
@@ -2852,8 +6295,7 @@ def save_session_to_file():
         # Save to file
         session_file = Path(f"temp_session_{session_id}.json")
         try:
-            with session_file.open("w", encoding="utf-8") as f:
-                json.dump(session_data, f, indent=2, ensure_ascii=False)
+            write_json_file(session_file, session_data)
         except Exception as e:
             pass  # Silently fail if file write fails
 
@@ -2979,6 +6421,9 @@ def main():
     </style>
     """, unsafe_allow_html=True)
     
+    # Make sure the background job worker is running in this process
+    get_job_worker()
+    
     # Initialize session state
     if "authenticated" not in st.session_state:
         st.session_state["authenticated"] = False
@@ -3162,8 +6607,7 @@ def main():
                 navigate_to_page("create_company")
         
         # Notifications with enhanced counter
-        notifications = get_user_notifications(username)
-        unread_count = len([n for n in notifications if not n.get("read", False)])
+        unread_count = get_unread_notification_count(username)
         
         # Show notification button with badge
         if unread_count > 0:
@@ -3265,7 +6709,7 @@ def show_dashboard(username: str, user_info: dict, company_info: dict, data: dic
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_tasks = len(data.get("tasks", []))
+        total_tasks = len(data.get("tasks", [])) + count_archived_tasks(data)
         st.markdown(f"""
         <div class="metric-card">
             <h3>📋 Total Tasks</h3>
@@ -3274,7 +6718,8 @@ def show_dashboard(username: str, user_info: dict, company_info: dict, data: dic
         """, unsafe_allow_html=True)
     
     with col2:
-        completed_tasks = len([t for t in data.get("tasks", []) if t.get("completed", False)])
+        # Archived tasks are all completed
+        completed_tasks = len([t for t in data.get("tasks", []) if t.get("completed", False)]) + count_archived_tasks(data)
         st.markdown(f"""
         <div class="metric-card">
             <h3>✅ Completed</h3>
@@ -3422,13 +6867,14 @@ def show_tasks_page(data: dict):
                     st.error("Please enter a task title!")
                 else:
                     # Validate content
-                    title_valid, title_error = validate_content(task_title.strip())
-                    desc_valid, desc_error = validate_content(task_description.strip())
+                    content_issues = validate_contents(
+                        {"Task title": task_title.strip(), "Task description": task_description.strip()},
+                        get_user_info(st.session_state.get("username", "")).get("company_code")
+                    )
                     
-                    if not title_valid:
-                        st.error(f"Task title: {title_error}")
-                    elif not desc_valid:
-                        st.error(f"Task description: {desc_error}")
+                    if content_issues:
+                        for field, matches in content_issues.items():
+                            st.error(f"{field}: {describe_inappropriate_language(matches)}")
                     else:
                         new_task = {
                             "id": str(uuid.uuid4()),
@@ -3443,8 +6889,7 @@ def show_tasks_page(data: dict):
                             "updated_at": get_current_timestamp()
                         }
                         
-                        data["tasks"].append(new_task)
-                        save_data(data)
+                        append_user_record(st.session_state["username"], "tasks", new_task)
                         refresh_session()  # Refresh session on task creation
                         st.success("Task created successfully!")
                         st.rerun()
@@ -3509,12 +6954,17 @@ def show_tasks_page(data: dict):
                                 st.write(f"Uploaded by: {attachment['uploaded_by']} on {attachment['uploaded_at']}")
                             with col2:
                                 if st.button("📥 Download", key=f"download_{attachment['id']}"):
-                                    st.download_button(
-                                        label="Download File",
-                                        data=attachment['content'],
-                                        file_name=attachment['name'],
-                                        mime=attachment['type']
-                                    )
+                                    attachment_stream = _open_record_payload(attachment)
+                                    if attachment_stream is not None:
+                                        with attachment_stream:
+                                            st.download_button(
+                                                label="Download File",
+                                                data=attachment_stream.read(),
+                                                file_name=attachment['name'],
+                                                mime=attachment['type']
+                                            )
+                                    else:
+                                        st.error("Attachment content is missing!")
                 
                 # Show code snippets if they exist
                 if task.get("code_snippets"):
@@ -3536,10 +6986,11 @@ def show_tasks_page(data: dict):
                 with col1:
                     if not task.get("completed", False):
                         if st.button("✅ Mark Complete", key=f"complete_task_{task['id']}"):
-                            task["completed"] = True
-                            task["completed_at"] = get_current_timestamp()
-                            task["updated_at"] = get_current_timestamp()
-                            save_data(data)
+                            update_task(st.session_state["username"], task["id"], {
+                                "completed": True,
+                                "completed_at": get_current_timestamp(),
+                                "updated_at": get_current_timestamp()
+                            })
                             refresh_session()  # Refresh session on task completion
                             st.success("Task marked as complete!")
                             st.rerun()
@@ -3554,8 +7005,7 @@ def show_tasks_page(data: dict):
                 with col3:
                     if st.button("🗑️ Delete", key=f"delete_task_{task['id']}"):
                         if st.session_state.get(f"confirm_delete_task_{task['id']}"):
-                            data["tasks"] = [t for t in data["tasks"] if t["id"] != task["id"]]
-                            save_data(data)
+                            delete_user_record(st.session_state["username"], "tasks", task["id"])
                             refresh_session()  # Refresh session on task deletion
                             st.success("Task deleted!")
                             st.rerun()
@@ -3586,17 +7036,15 @@ def show_tasks_page(data: dict):
                         col1, col2 = st.columns(2)
                         with col1:
                             if st.form_submit_button("💾 Save Changes"):
-                                for t in data["tasks"]:
-                                    if t["id"] == task["id"]:
-                                        t["title"] = edit_title
-                                        t["description"] = edit_description
-                                        t["category"] = edit_category
-                                        t["priority"] = edit_priority
-                                        t["due_date"] = edit_due_date.strftime("%Y-%m-%d") if edit_due_date else None
-                                        t["tags"] = [tag.strip() for tag in edit_tags.split(",") if tag.strip()]
-                                        t["updated_at"] = get_current_timestamp()
-                                        break
-                                save_data(data)
+                                update_task(st.session_state["username"], task["id"], {
+                                    "title": edit_title,
+                                    "description": edit_description,
+                                    "category": edit_category,
+                                    "priority": edit_priority,
+                                    "due_date": edit_due_date.strftime("%Y-%m-%d") if edit_due_date else None,
+                                    "tags": [tag.strip() for tag in edit_tags.split(",") if tag.strip()],
+                                    "updated_at": get_current_timestamp()
+                                })
                                 st.session_state[f"edit_task_{task['id']}"] = False
                                 st.success("Task updated!")
                                 st.rerun()
@@ -3639,50 +7087,46 @@ def show_tasks_page(data: dict):
                         with col1:
                             if st.form_submit_button("✅ Mark Incomplete"):
                                 # Mark task as incomplete
-                                task["completed"] = False
-                                task["updated_at"] = get_current_timestamp()
-                                if "completed_at" in task:
-                                    del task["completed_at"]
+                                fields = {
+                                    "completed": False,
+                                    "completed_at": None,
+                                    "updated_at": get_current_timestamp()
+                                }
                                 
                                 # Add comments if provided
                                 if comments.strip():
-                                    if "incomplete_comments" not in task:
-                                        task["incomplete_comments"] = []
-                                    task["incomplete_comments"].append({
+                                    fields["incomplete_comments"] = task.get("incomplete_comments", []) + [{
                                         "comment": comments.strip(),
                                         "timestamp": get_current_timestamp(),
                                         "user": st.session_state.get("username", "Unknown")
-                                    })
+                                    }]
                                 
                                 # Add code snippet if provided
                                 if code_snippet.strip():
-                                    if "code_snippets" not in task:
-                                        task["code_snippets"] = []
-                                    task["code_snippets"].append({
+                                    fields["code_snippets"] = task.get("code_snippets", []) + [{
                                         "code": code_snippet.strip(),
                                         "timestamp": get_current_timestamp(),
                                         "user": st.session_state.get("username", "Unknown")
-                                    })
+                                    }]
                                 
                                 # Handle file uploads
                                 if uploaded_files:
-                                    if "attachments" not in task:
-                                        task["attachments"] = []
+                                    fields["attachments"] = list(task.get("attachments", []))
                                     
                                     for uploaded_file in uploaded_files:
-                                        file_content = uploaded_file.read()
+                                        blob_key, file_size = blob_put_stream(uploaded_file)
                                         attachment = {
                                             "id": str(uuid.uuid4()),
                                             "name": uploaded_file.name,
                                             "type": uploaded_file.type or "unknown",
-                                            "size": len(file_content),
+                                            "size": file_size,
                                             "uploaded_at": get_current_timestamp(),
                                             "uploaded_by": st.session_state.get("username", "Unknown"),
-                                            "content": file_content
+                                            "blob_key": blob_key
                                         }
-                                        task["attachments"].append(attachment)
+                                        fields["attachments"].append(attachment)
                                 
-                                save_data(data)
+                                update_task(st.session_state["username"], task["id"], fields)
                                 st.session_state[f"mark_incomplete_{task['id']}"] = False
                                 st.success("Task marked as incomplete with attachments!")
                                 st.rerun()
@@ -3698,9 +7142,10 @@ def show_tasks_page(data: dict):
     
     # Completed tasks section
     completed_tasks = [t for t in tasks if t.get("completed", False)]
-    if completed_tasks:
+    total_completed = len(completed_tasks) + count_archived_tasks(data)
+    if total_completed:
         st.markdown("### ✅ Completed Tasks")
-        st.info(f"You have {len(completed_tasks)} completed tasks. They are archived here for reference.")
+        st.info(f"You have {total_completed} completed tasks. They are archived here for reference.")
         
         # Show completed tasks in a compact format
         for task in completed_tasks[-10:]:  # Show last 10 completed tasks
@@ -3713,8 +7158,8 @@ def show_tasks_page(data: dict):
             </div>
             """, unsafe_allow_html=True)
         
-        if len(completed_tasks) > 10:
-            st.info(f"Showing last 10 of {len(completed_tasks)} completed tasks")
+        if total_completed > 10:
+            st.info(f"Showing last {len(completed_tasks[-10:])} of {total_completed} completed tasks")
         
         # Option to view all completed tasks
         if st.button("📋 View All Completed Tasks", key="view_all_completed"):
@@ -3722,7 +7167,10 @@ def show_tasks_page(data: dict):
         
         if st.session_state.get("show_all_completed"):
             st.markdown("#### 📋 All Completed Tasks")
-            for task in completed_tasks:
+            # Older ones come from the archive, a page at a time
+            archive_pages = st.session_state.get("completed_archive_pages", 1)
+            archived_tasks = get_archived_tasks(data, "tasks", page_size=archive_pages * TASK_ARCHIVE_PAGE_SIZE)
+            for task in completed_tasks + archived_tasks:
                 completed_date = task.get("completed_at", "Unknown")
                 st.markdown(f"""
                 <div class="task-card completed-task" style="opacity: 0.7;">
@@ -3733,8 +7181,14 @@ def show_tasks_page(data: dict):
                 </div>
                 """, unsafe_allow_html=True)
             
+            if len(completed_tasks) + len(archived_tasks) < total_completed:
+                if st.button("⬇️ Load Older Completed Tasks", key="load_older_completed"):
+                    st.session_state["completed_archive_pages"] = archive_pages + 1
+                    st.rerun()
+            
             if st.button("🔽 Hide All Completed Tasks", key="hide_all_completed"):
                 st.session_state["show_all_completed"] = False
+                st.session_state["completed_archive_pages"] = 1
                 st.rerun()
     
     # Assigned tasks - Only show incomplete assigned tasks
@@ -3770,12 +7224,17 @@ def show_tasks_page(data: dict):
                                 st.write(f"Uploaded by: {attachment['uploaded_by']} on {attachment['uploaded_at']}")
                             with col2:
                                 if st.button("📥 Download", key=f"download_assigned_{attachment['id']}"):
-                                    st.download_button(
-                                        label="Download File",
-                                        data=attachment['content'],
-                                        file_name=attachment['name'],
-                                        mime=attachment['type']
-                                    )
+                                    attachment_stream = _open_record_payload(attachment)
+                                    if attachment_stream is not None:
+                                        with attachment_stream:
+                                            st.download_button(
+                                                label="Download File",
+                                                data=attachment_stream.read(),
+                                                file_name=attachment['name'],
+                                                mime=attachment['type']
+                                            )
+                                    else:
+                                        st.error("Attachment content is missing!")
                 
                 # Show code snippets if they exist
                 if task.get("code_snippets"):
@@ -3797,10 +7256,11 @@ def show_tasks_page(data: dict):
                 with col1:
                     if not task.get("completed", False):
                         if st.button("✅ Mark Complete", key=f"complete_assigned_{task['id']}"):
-                            task["completed"] = True
-                            task["completed_at"] = get_current_timestamp()
-                            task["updated_at"] = get_current_timestamp()
-                            save_data(data)
+                            update_assigned_task(st.session_state["username"], task["id"], {
+                                "completed": True,
+                                "completed_at": get_current_timestamp(),
+                                "updated_at": get_current_timestamp()
+                            })
                             st.success("Task marked as complete!")
                             st.rerun()
                     else:
@@ -3819,9 +7279,10 @@ def show_tasks_page(data: dict):
                         col1, col2 = st.columns(2)
                         with col1:
                             if st.form_submit_button("💾 Save Feedback"):
-                                task["feedback"] = feedback
-                                task["updated_at"] = get_current_timestamp()
-                                save_data(data)
+                                update_assigned_task(st.session_state["username"], task["id"], {
+                                    "feedback": feedback,
+                                    "updated_at": get_current_timestamp()
+                                })
                                 st.session_state[f"add_feedback_{task['id']}"] = False
                                 st.success("Feedback added!")
                                 st.rerun()
@@ -3864,50 +7325,46 @@ def show_tasks_page(data: dict):
                         with col1:
                             if st.form_submit_button("✅ Mark Incomplete"):
                                 # Mark task as incomplete
-                                task["completed"] = False
-                                task["updated_at"] = get_current_timestamp()
-                                if "completed_at" in task:
-                                    del task["completed_at"]
+                                fields = {
+                                    "completed": False,
+                                    "completed_at": None,
+                                    "updated_at": get_current_timestamp()
+                                }
                                 
                                 # Add comments if provided
                                 if comments.strip():
-                                    if "incomplete_comments" not in task:
-                                        task["incomplete_comments"] = []
-                                    task["incomplete_comments"].append({
+                                    fields["incomplete_comments"] = task.get("incomplete_comments", []) + [{
                                         "comment": comments.strip(),
                                         "timestamp": get_current_timestamp(),
                                         "user": st.session_state.get("username", "Unknown")
-                                    })
+                                    }]
                                 
                                 # Add code snippet if provided
                                 if code_snippet.strip():
-                                    if "code_snippets" not in task:
-                                        task["code_snippets"] = []
-                                    task["code_snippets"].append({
+                                    fields["code_snippets"] = task.get("code_snippets", []) + [{
                                         "code": code_snippet.strip(),
                                         "timestamp": get_current_timestamp(),
                                         "user": st.session_state.get("username", "Unknown")
-                                    })
+                                    }]
                                 
                                 # Handle file uploads
                                 if uploaded_files:
-                                    if "attachments" not in task:
-                                        task["attachments"] = []
+                                    fields["attachments"] = list(task.get("attachments", []))
                                     
                                     for uploaded_file in uploaded_files:
-                                        file_content = uploaded_file.read()
+                                        blob_key, file_size = blob_put_stream(uploaded_file)
                                         attachment = {
                                             "id": str(uuid.uuid4()),
                                             "name": uploaded_file.name,
                                             "type": uploaded_file.type or "unknown",
-                                            "size": len(file_content),
+                                            "size": file_size,
                                             "uploaded_at": get_current_timestamp(),
                                             "uploaded_by": st.session_state.get("username", "Unknown"),
-                                            "content": file_content
+                                            "blob_key": blob_key
                                         }
-                                        task["attachments"].append(attachment)
+                                        fields["attachments"].append(attachment)
                                 
-                                save_data(data)
+                                update_assigned_task(st.session_state["username"], task["id"], fields)
                                 st.session_state[f"mark_incomplete_assigned_{task['id']}"] = False
                                 st.success("Task marked as incomplete with attachments!")
                                 st.rerun()
@@ -3923,9 +7380,10 @@ def show_tasks_page(data: dict):
     
     # Completed assigned tasks section
     completed_assigned_tasks = [t for t in assigned_tasks if t.get("completed", False)]
-    if completed_assigned_tasks:
+    total_completed_assigned = len(completed_assigned_tasks) + count_archived_tasks(data, "assigned_tasks")
+    if total_completed_assigned:
         st.markdown("### ✅ Completed Assigned Tasks")
-        st.info(f"You have {len(completed_assigned_tasks)} completed assigned tasks.")
+        st.info(f"You have {total_completed_assigned} completed assigned tasks.")
         
         # Show completed assigned tasks in a compact format
         for task in completed_assigned_tasks[-5:]:  # Show last 5 completed assigned tasks
@@ -3939,8 +7397,8 @@ def show_tasks_page(data: dict):
             </div>
             """, unsafe_allow_html=True)
         
-        if len(completed_assigned_tasks) > 5:
-            st.info(f"Showing last 5 of {len(completed_assigned_tasks)} completed assigned tasks")
+        if total_completed_assigned > 5:
+            st.info(f"Showing last {len(completed_assigned_tasks[-5:])} of {total_completed_assigned} completed assigned tasks")
         
         # Option to view all completed assigned tasks
         if st.button("📋 View All Completed Assigned Tasks", key="view_all_completed_assigned"):
@@ -3948,7 +7406,10 @@ def show_tasks_page(data: dict):
         
         if st.session_state.get("show_all_completed_assigned"):
             st.markdown("#### 📋 All Completed Assigned Tasks")
-            for task in completed_assigned_tasks:
+            # Older ones come from the archive, a page at a time
+            archive_pages = st.session_state.get("completed_assigned_archive_pages", 1)
+            archived_tasks = get_archived_tasks(data, "assigned_tasks", page_size=archive_pages * TASK_ARCHIVE_PAGE_SIZE)
+            for task in completed_assigned_tasks + archived_tasks:
                 completed_date = task.get("completed_at", "Unknown")
                 st.markdown(f"""
                 <div class="task-card assigned-task" style="opacity: 0.7;">
@@ -3961,8 +7422,14 @@ def show_tasks_page(data: dict):
                 </div>
                 """, unsafe_allow_html=True)
             
+            if len(completed_assigned_tasks) + len(archived_tasks) < total_completed_assigned:
+                if st.button("⬇️ Load Older Completed Assigned Tasks", key="load_older_completed_assigned"):
+                    st.session_state["completed_assigned_archive_pages"] = archive_pages + 1
+                    st.rerun()
+            
             if st.button("🔽 Hide All Completed Assigned Tasks", key="hide_all_completed_assigned"):
                 st.session_state["show_all_completed_assigned"] = False
+                st.session_state["completed_assigned_archive_pages"] = 1
                 st.rerun()
 
 def show_notes_page(data: dict):
@@ -3998,10 +7465,7 @@ def show_notes_page(data: dict):
                         "updated_at": get_current_timestamp()
                     }
                     
-                    if "notes" not in data:
-                        data["notes"] = []
-                    data["notes"].append(new_note)
-                    save_data(data)
+                    append_note(st.session_state["username"], new_note)
                     refresh_session()  # Refresh session on note creation
                     st.success("Note created successfully!")
                     st.rerun()
@@ -4039,8 +7503,7 @@ def show_notes_page(data: dict):
                     if st.button("🗑️ Delete", key=f"delete_note_{note['id']}"):
                         if st.session_state.get(f"confirm_delete_note_{note['id']}"):
                             # Remove note
-                            data["notes"] = [n for n in data["notes"] if n["id"] != note["id"]]
-                            save_data(data)
+                            delete_user_record(st.session_state["username"], "notes", note["id"])
                             st.success("Note deleted!")
                             st.rerun()
                         else:
@@ -4062,15 +7525,13 @@ def show_notes_page(data: dict):
                         with col1:
                             if st.form_submit_button("💾 Save Changes"):
                                 # Update note
-                                for n in data["notes"]:
-                                    if n["id"] == note["id"]:
-                                        n["title"] = edit_title
-                                        n["content"] = edit_content
-                                        n["category"] = edit_category
-                                        n["tags"] = [tag.strip() for tag in edit_tags.split(",") if tag.strip()]
-                                        n["updated_at"] = get_current_timestamp()
-                                        break
-                                save_data(data)
+                                update_user_record(st.session_state["username"], "notes", note["id"], {
+                                    "title": edit_title,
+                                    "content": edit_content,
+                                    "category": edit_category,
+                                    "tags": [tag.strip() for tag in edit_tags.split(",") if tag.strip()],
+                                    "updated_at": get_current_timestamp()
+                                })
                                 st.session_state[f"edit_note_{note['id']}"] = False
                                 st.success("Note updated!")
                                 st.rerun()
@@ -4129,10 +7590,7 @@ def show_contacts_page(data: dict):
                         "updated_at": get_current_timestamp()
                     }
                     
-                    if "contacts" not in data:
-                        data["contacts"] = []
-                    data["contacts"].append(new_contact)
-                    save_data(data)
+                    append_user_record(st.session_state["username"], "contacts", new_contact)
                     st.success("Contact added successfully!")
                     st.rerun()
     
@@ -4178,8 +7636,7 @@ def show_contacts_page(data: dict):
                 with col2:
                     if st.button("🗑️ Delete", key=f"delete_contact_{contact['id']}"):
                         if st.session_state.get(f"confirm_delete_contact_{contact['id']}"):
-                            data["contacts"] = [c for c in data["contacts"] if c["id"] != contact["id"]]
-                            save_data(data)
+                            delete_user_record(st.session_state["username"], "contacts", contact["id"])
                             st.success("Contact deleted!")
                             st.rerun()
                         else:
@@ -4209,18 +7666,16 @@ def show_contacts_page(data: dict):
                         col1, col2 = st.columns(2)
                         with col1:
                             if st.form_submit_button("💾 Save Changes"):
-                                for c in data["contacts"]:
-                                    if c["id"] == contact["id"]:
-                                        c["name"] = edit_name
-                                        c["email"] = edit_email
-                                        c["phone"] = edit_phone
-                                        c["company"] = edit_company
-                                        c["position"] = edit_position
-                                        c["category"] = edit_category
-                                        c["notes"] = edit_notes
-                                        c["updated_at"] = get_current_timestamp()
-                                        break
-                                save_data(data)
+                                update_user_record(st.session_state["username"], "contacts", contact["id"], {
+                                    "name": edit_name,
+                                    "email": edit_email,
+                                    "phone": edit_phone,
+                                    "company": edit_company,
+                                    "position": edit_position,
+                                    "category": edit_category,
+                                    "notes": edit_notes,
+                                    "updated_at": get_current_timestamp()
+                                })
                                 st.session_state[f"edit_contact_{contact['id']}"] = False
                                 st.success("Contact updated!")
                                 st.rerun()
@@ -4279,10 +7734,7 @@ def show_goals_page(data: dict):
                         "updated_at": get_current_timestamp()
                     }
                     
-                    if "goals" not in data:
-                        data["goals"] = []
-                    data["goals"].append(new_goal)
-                    save_data(data)
+                    append_user_record(st.session_state["username"], "goals", new_goal)
                     st.success("Goal created successfully!")
                     st.rerun()
     
@@ -4343,8 +7795,7 @@ def show_goals_page(data: dict):
                 with col3:
                     if st.button("🗑️ Delete", key=f"delete_goal_{goal['id']}"):
                         if st.session_state.get(f"confirm_delete_goal_{goal['id']}"):
-                            data["goals"] = [g for g in data["goals"] if g["id"] != goal["id"]]
-                            save_data(data)
+                            delete_user_record(st.session_state["username"], "goals", goal["id"])
                             st.success("Goal deleted!")
                             st.rerun()
                         else:
@@ -4364,21 +7815,18 @@ def show_goals_page(data: dict):
                         col1, col2 = st.columns(2)
                         with col1:
                             if st.form_submit_button("💾 Save Progress"):
-                                for g in data["goals"]:
-                                    if g["id"] == goal["id"]:
-                                        g["progress"] = new_progress
-                                        g["status"] = new_status
-                                        g["updated_at"] = get_current_timestamp()
-                                        if progress_note:
-                                            if "progress_notes" not in g:
-                                                g["progress_notes"] = []
-                                            g["progress_notes"].append({
-                                                "note": progress_note,
-                                                "timestamp": get_current_timestamp(),
-                                                "progress": new_progress
-                                            })
-                                        break
-                                save_data(data)
+                                fields = {
+                                    "progress": new_progress,
+                                    "status": new_status,
+                                    "updated_at": get_current_timestamp()
+                                }
+                                if progress_note:
+                                    fields["progress_notes"] = goal.get("progress_notes", []) + [{
+                                        "note": progress_note,
+                                        "timestamp": get_current_timestamp(),
+                                        "progress": new_progress
+                                    }]
+                                update_user_record(st.session_state["username"], "goals", goal["id"], fields)
                                 st.session_state[f"update_progress_{goal['id']}"] = False
                                 st.success("Progress updated!")
                                 st.rerun()
@@ -4414,18 +7862,16 @@ def show_goals_page(data: dict):
                         col1, col2 = st.columns(2)
                         with col1:
                             if st.form_submit_button("💾 Save Changes"):
-                                for g in data["goals"]:
-                                    if g["id"] == goal["id"]:
-                                        g["title"] = edit_title
-                                        g["category"] = edit_category
-                                        g["priority"] = edit_priority
-                                        g["target_date"] = edit_target_date.strftime("%Y-%m-%d") if edit_target_date else None
-                                        g["status"] = edit_status
-                                        g["progress"] = edit_progress
-                                        g["description"] = edit_description
-                                        g["updated_at"] = get_current_timestamp()
-                                        break
-                                save_data(data)
+                                update_user_record(st.session_state["username"], "goals", goal["id"], {
+                                    "title": edit_title,
+                                    "category": edit_category,
+                                    "priority": edit_priority,
+                                    "target_date": edit_target_date.strftime("%Y-%m-%d") if edit_target_date else None,
+                                    "status": edit_status,
+                                    "progress": edit_progress,
+                                    "description": edit_description,
+                                    "updated_at": get_current_timestamp()
+                                })
                                 st.session_state[f"edit_goal_{goal['id']}"] = False
                                 st.success("Goal updated!")
                                 st.rerun()
@@ -4467,9 +7913,11 @@ def show_team_page(company_info: dict):
         search_query = st.text_input("🔍 Search team members", placeholder="Search by name or role")
         
         if search_query:
-            team_members = [m for m in team_members if 
-                          search_query.lower() in m.get("full_name", "").lower() or
-                          search_query.lower() in m.get("role", "").lower()]
+            # Best matches first, tolerating typos in names and roles
+            members_by_username = {m.get("username"): m for m in team_members}
+            team_members = [members_by_username[result["member"].get("username")]
+                            for result in search_names(company_code, None, search_query, ["member"])
+                            if result["member"].get("username") in members_by_username]
         
         # Display team members
         for member in team_members:
@@ -4588,13 +8036,13 @@ def show_assign_tasks_page(username: str, company_info: dict):
                 st.error("Please select a team member!")
             else:
                 # Validate content
-                title_valid, title_error = validate_content(task_title.strip())
-                desc_valid, desc_error = validate_content(task_description.strip())
+                content_issues = validate_contents(
+                    {"Task title": task_title.strip(), "Task description": task_description.strip()}, company_code
+                )
                 
-                if not title_valid:
-                    st.error(f"Task title: {title_error}")
-                elif not desc_valid:
-                    st.error(f"Task description: {desc_error}")
+                if content_issues:
+                    for field, matches in content_issues.items():
+                        st.error(f"{field}: {describe_inappropriate_language(matches)}")
                 else:
                     # Get selected member username
                     selected_username = selected_member.split("(")[1].split(")")[0]
@@ -4872,115 +8320,127 @@ def show_analytics_page(company_info: dict):
 
 def get_team_members(company_code: str) -> List[Dict[str, Any]]:
     """Get all team members of a company."""
-    companies_data = load_companies_data()
-    company_data = companies_data.get(company_code, {})
+    company_data = store_get(COMPANIES_FILE, company_code, {})
     return company_data.get("employees", [])
 
 def remove_user_from_company(username: str):
     """Remove a user from a company."""
-    auth_data = load_auth_data()
-    companies_data = load_companies_data()
+    user_record = store_get(AUTH_FILE, username)
     
-    if username in auth_data:
-        company_code = auth_data[username].get("company_code")
-        if company_code and company_code in companies_data:
+    if user_record is not None:
+        company_code = user_record.get("company_code")
+        company_data = store_get(COMPANIES_FILE, company_code) if company_code else None
+        if company_data is not None:
             # Remove from company employees list
-            companies_data[company_code]["employees"] = [
-                emp for emp in companies_data[company_code]["employees"] 
+            company_data["employees"] = [
+                emp for emp in company_data["employees"] 
                 if emp.get("username") != username
             ]
-            save_companies_data(companies_data)
+            store_put(COMPANIES_FILE, company_code, company_data)
+            reindex_company_member(company_code, username)
             
             # Remove company code from user
-            auth_data[username]["company_code"] = None
-            save_auth_data(auth_data)
+            user_record["company_code"] = None
+            store_put(AUTH_FILE, username, user_record)
+
+# ASSIGNER_INDEX_FILE maps each assigner to the tasks they assigned, as
+# {"id": task id, "assignee": username, "completed": bool} records in
+# assignment order, so "tasks I assigned" only opens the assignees' files.
+# It is kept up to date by record_assigned_task_change and built from every
+# company's employee files the first time it is needed.
+
+def _update_assigner_index(username: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+    """Apply one assigned task change to the assigner index."""
+    task = after or before
+    assigned_by = task.get("assigned_by") if task else None
+    if not assigned_by or "built" not in store_get_counters(ASSIGNER_INDEX_FILE, "meta"):
+        return  # The first lookup builds the whole index
+    
+    if before is None:
+        store_append(ASSIGNER_INDEX_FILE, assigned_by, {
+            "id": after.get("id"), "assignee": username, "completed": bool(after.get("completed", False))
+        })
+    elif after is None:
+        store_delete_record(ASSIGNER_INDEX_FILE, assigned_by, before.get("id"))
+    elif bool(before.get("completed", False)) != bool(after.get("completed", False)):
+        store_update_record(ASSIGNER_INDEX_FILE, assigned_by, after.get("id"),
+                            {"completed": bool(after.get("completed", False))})
+
+def rebuild_assigner_index():
+    """Build the assigner index from every company's employee files."""
+    employee_usernames = [employee.get("username")
+                          for company_data in load_companies_data().values()
+                          for employee in company_data.get("employees", [])
+                          if employee.get("username")]
+    index = {}
+    for assignee, user_data in zip(employee_usernames, load_user_files(employee_usernames, ("assigned_tasks",))):
+        for task in (all_user_tasks(user_data, "assigned_tasks") if user_data is not None else []):
+            if task.get("assigned_by"):
+                index.setdefault(task["assigned_by"], []).append({
+                    "id": task.get("id"), "assignee": assignee, "completed": bool(task.get("completed", False))
+                })
+    
+    for assigned_by, entries in index.items():
+        store_put(ASSIGNER_INDEX_FILE, assigned_by, entries)
+    if "built" not in store_get_counters(ASSIGNER_INDEX_FILE, "meta"):
+        store_incr_counter(ASSIGNER_INDEX_FILE, "meta", "built")
 
 def get_assigned_tasks_by_user(username: str) -> List[Dict[str, Any]]:
     """Get all tasks assigned by a specific user."""
-    companies_data = load_companies_data()
-    all_assigned_tasks = []
-    
-    for company_code, company_data in companies_data.items():
-        employees = company_data.get("employees", [])
-        for employee in employees:
-            emp_username = employee.get("username")
-            if emp_username:
-                user_file = Path(f"user_{emp_username}.json")
-                if user_file.exists():
-                    with user_file.open("r", encoding="utf-8") as f:
-                        user_data = json.load(f)
-                        assigned_tasks = user_data.get("assigned_tasks", [])
-                        # Filter tasks assigned by the specified user
-                        user_assigned_tasks = [task for task in assigned_tasks if task.get("assigned_by") == username]
-                        all_assigned_tasks.extend(user_assigned_tasks)
-    
-    return all_assigned_tasks
+    if "built" not in store_get_counters(ASSIGNER_INDEX_FILE, "meta"):
+        rebuild_assigner_index()
+    
+    entries = store_get(ASSIGNER_INDEX_FILE, username, [])
+    assignees = list(dict.fromkeys(entry["assignee"] for entry in entries))
+    tasks_by_id = {}
+    users = load_user_files(assignees, ("assigned_tasks",))
+    for assignee, user_data in zip(assignees, users):
+        for task in (user_data or {}).get("assigned_tasks", []):
+            if task.get("assigned_by") == username:
+                tasks_by_id[task.get("id")] = task
+    
+    # Tasks not found in an assignee's live tasks may have been archived
+    archived_assignees = {entry["assignee"] for entry in entries if entry["id"] not in tasks_by_id}
+    for assignee, user_data in zip(assignees, users):
+        if assignee in archived_assignees and user_data is not None:
+            for task in all_user_tasks(user_data, "assigned_tasks"):
+                if task.get("assigned_by") == username:
+                    tasks_by_id.setdefault(task.get("id"), task)
+    
+    # Entries whose task has since disappeared are skipped
+    return [tasks_by_id[entry["id"]] for entry in entries if entry["id"] in tasks_by_id]
 
 def get_task_priority_distribution(company_code: str) -> List[Dict[str, Any]]:
     """Get task priority distribution for a company."""
-    employees = get_company_employees(company_code)
     priority_counts = {"low": 0, "medium": 0, "high": 0}
-    
-    for employee in employees:
-        username = employee.get("username")
-        user_file = Path(f"user_{username}.json")
-        
-        if user_file.exists():
-            with user_file.open("r", encoding="utf-8") as f:
-                user_data = json.load(f)
-                assigned_tasks = user_data.get("assigned_tasks", [])
-                
-                for task in assigned_tasks:
-                    priority = task.get("priority", "medium")
-                    priority_counts[priority] = priority_counts.get(priority, 0) + 1
+    priority_counts.update(_team_counters_with_prefix(get_team_stats_counters(company_code), "priority:"))
     
     return [{"priority": k.title(), "count": v} for k, v in priority_counts.items() if v > 0]
 
 def get_team_performance_data(company_code: str) -> List[Dict[str, Any]]:
     """Get individual team member performance data."""
     employees = get_company_employees(company_code)
+    counters = get_team_stats_counters(company_code)
     performance_data = []
     
     for employee in employees:
         username = employee.get("username")
-        user_file = Path(f"user_{username}.json")
+        total_tasks = counters.get(f"assigned:{username}", 0)
+        completed_tasks = counters.get(f"completed:{username}", 0)
+        completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
         
-        if user_file.exists():
-            with user_file.open("r", encoding="utf-8") as f:
-                user_data = json.load(f)
-                assigned_tasks = user_data.get("assigned_tasks", [])
-                
-                total_tasks = len(assigned_tasks)
-                completed_tasks = len([t for t in assigned_tasks if t.get("completed", False)])
-                completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-                
-                performance_data.append({
-                    "Employee": employee.get("full_name", username),
-                    "Total Tasks": total_tasks,
-                    "Completed": completed_tasks,
-                    "Completion Rate (%)": round(completion_rate, 1)
-                })
+        performance_data.append({
+            "Employee": employee.get("full_name", username),
+            "Total Tasks": total_tasks,
+            "Completed": completed_tasks,
+            "Completion Rate (%)": round(completion_rate, 1)
+        })
     
     return performance_data
 
 def get_task_completion_trends(company_code: str) -> List[Dict[str, Any]]:
     """Get task completion trends over time."""
-    employees = get_company_employees(company_code)
-    completion_dates = {}
-    
-    for employee in employees:
-        username = employee.get("username")
-        user_file = Path(f"user_{username}.json")
-        
-        if user_file.exists():
-            with user_file.open("r", encoding="utf-8") as f:
-                user_data = json.load(f)
-                assigned_tasks = user_data.get("assigned_tasks", [])
-                
-                for task in assigned_tasks:
-                    if task.get("completed", False) and task.get("completed_at"):
-                        date = task.get("completed_at").split()[0]  # Get just the date part
-                        completion_dates[date] = completion_dates.get(date, 0) + 1
+    completion_dates = _team_counters_with_prefix(get_team_stats_counters(company_code), "day:")
     
     # Convert to list and sort by date
     trends = [{"date": date, "completed_tasks": count} for date, count in completion_dates.items()]
@@ -4991,6 +8451,7 @@ def get_task_completion_trends(company_code: str) -> List[Dict[str, Any]]:
 def get_department_analytics(company_code: str) -> Dict[str, Any]:
     """Get department-wise analytics."""
     employees = get_company_employees(company_code)
+    counters = get_team_stats_counters(company_code)
     dept_data = {}
     
     for employee in employees:
@@ -5007,20 +8468,9 @@ def get_department_analytics(company_code: str) -> Dict[str, Any]:
         employee_count = len(data["employees"])
         dept_distribution.append({"department": dept, "employee_count": employee_count})
         
-        # Calculate completion rate for department
-        total_tasks = 0
-        completed_tasks = 0
-        
-        for emp in data["employees"]:
-            username = emp.get("username")
-            user_file = Path(f"user_{username}.json")
-            
-            if user_file.exists():
-                with user_file.open("r", encoding="utf-8") as f:
-                    user_data = json.load(f)
-                    assigned_tasks = user_data.get("assigned_tasks", [])
-                    total_tasks += len(assigned_tasks)
-                    completed_tasks += len([t for t in assigned_tasks if t.get("completed", False)])
+        # Calculate completion rate for department from its members' counters
+        total_tasks = sum(counters.get(f"assigned:{emp.get('username')}", 0) for emp in data["employees"])
+        completed_tasks = sum(counters.get(f"completed:{emp.get('username')}", 0) for emp in data["employees"])
         
         completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
         dept_performance.append({"department": dept, "completion_rate": round(completion_rate, 1)})
@@ -5032,40 +8482,28 @@ def get_department_analytics(company_code: str) -> Dict[str, Any]:
 
 def get_recent_team_activities(company_code: str) -> List[Dict[str, Any]]:
     """Get recent team activities."""
-    employees = get_company_employees(company_code)
+    get_team_stats_counters(company_code)  # Make sure the activity log has been built
+    recent, _ = store_tail(TEAM_ACTIVITY_FILE, company_code, 50)
+    names = {employee.get("username"): employee.get("full_name", employee.get("username"))
+             for employee in get_company_employees(company_code)}
     activities = []
     
-    for employee in employees:
-        username = employee.get("username")
-        user_file = Path(f"user_{username}.json")
-        
-        if user_file.exists():
-            with user_file.open("r", encoding="utf-8") as f:
-                user_data = json.load(f)
-                
-                # Get recent task completions
-                assigned_tasks = user_data.get("assigned_tasks", [])
-                for task in assigned_tasks:
-                    if task.get("completed", False):
-                        activities.append({
-                            "type": "task_completed",
-                            "user": employee.get("full_name", username),
-                            "action": f"completed task '{task.get('title', 'Untitled')}'",
-                            "timestamp": task.get("completed_at", "Unknown")
-                        })
-                
-                # Get recent task assignments
-                for task in assigned_tasks:
-                    activities.append({
-                        "type": "task_assigned",
-                        "user": employee.get("full_name", username),
-                        "action": f"was assigned task '{task.get('title', 'Untitled')}'",
-                        "timestamp": task.get("assigned_at", "Unknown")
-                    })
+    for activity in recent:
+        username = activity.get("username")
+        if activity.get("type") == "task_completed":
+            action = f"completed task '{activity.get('title', 'Untitled')}'"
+        else:
+            action = f"was assigned task '{activity.get('title', 'Untitled')}'"
+        activities.append({
+            "type": activity.get("type"),
+            "user": names.get(username, username),
+            "action": action,
+            "timestamp": activity.get("timestamp", "Unknown")
+        })
     
     # Sort by timestamp (most recent first)
     activities.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-    return activities[:50]  # Return last 50 activities
+    return activities
 
 def generate_team_report(company_code: str) -> Optional[str]:
     """Generate a CSV team report."""
@@ -5133,8 +8571,7 @@ def show_company_settings_page(username: str, company_info: dict):
         st.error("Only company admins can access company settings.")
         return
     
-    companies_data = load_companies_data()
-    company_data = companies_data.get(company_code, {})
+    company_data = store_get(COMPANIES_FILE, company_code, {})
     
     st.markdown("### 🏢 Company Information")
     
@@ -5161,6 +8598,8 @@ def show_company_settings_page(username: str, company_info: dict):
         default_role = st.selectbox("Default Employee Role", 
                                   ["employee", "manager"], 
                                   index=0 if company_data.get("company_settings", {}).get("default_employee_role", "employee") == "employee" else 1)
+        moderation_words = st.text_area("Blocked Words (one per line; end a word with * to also block longer words starting with it)",
+                                        value="\n".join(get_moderation_words(company_code)))
         
         if st.form_submit_button("💾 Save Settings"):
             if "company_settings" not in company_data:
@@ -5169,9 +8608,11 @@ def show_company_settings_page(username: str, company_info: dict):
             company_data["company_settings"]["allow_self_registration"] = allow_self_registration
             company_data["company_settings"]["require_approval"] = require_approval
             company_data["company_settings"]["default_employee_role"] = default_role
+            company_data["company_settings"]["moderation_words"] = [
+                word.strip().lower() for word in moderation_words.splitlines() if word.strip()
+            ]
             
-            companies_data[company_code] = company_data
-            save_companies_data(companies_data)
+            store_put(COMPANIES_FILE, company_code, company_data)
             st.success("Company settings updated successfully!")
     
     # Department management
@@ -5193,8 +8634,7 @@ def show_company_settings_page(username: str, company_info: dict):
                 if new_dept.strip() and new_dept not in departments:
                     departments.append(new_dept.strip())
                     company_data["departments"] = departments
-                    companies_data[company_code] = company_data
-                    save_companies_data(companies_data)
+                    store_put(COMPANIES_FILE, company_code, company_data)
                     st.success(f"Department '{new_dept}' added!")
                     st.rerun()
                 elif new_dept in departments:
@@ -5203,6 +8643,27 @@ def show_company_settings_page(username: str, company_info: dict):
     # Employee management
     st.markdown("### 👥 Employee Management")
     
+    with st.expander("📥 Bulk Add Employees (CSV)"):
+        st.caption("Columns: username, email, full_name, password, role (optional). Nothing is added unless every row is valid.")
+        with st.form("bulk_register_employees"):
+            employees_csv = st.file_uploader("Employee CSV", type=["csv"])
+            user_role = get_user_info(username).get("role", "employee")
+            bulk_role = st.selectbox("Role for rows without one",
+                                     [role for role in ("employee", "manager") if can_manage_role(user_role, role)] or ["employee"])
+            
+            if st.form_submit_button("📥 Add Employees"):
+                if employees_csv is None:
+                    st.error("Please choose a CSV file!")
+                else:
+                    registered, errors = bulk_register_users(employees_csv.getvalue().decode("utf-8", errors="replace"),
+                                                             company_code, username, bulk_role)
+                    if errors:
+                        for error in errors:
+                            st.error(error)
+                    else:
+                        st.success(f"Added {len(registered)} employees!")
+                        st.rerun()
+    
     employees = company_data.get("employees", [])
     
     if employees:
@@ -5229,18 +8690,18 @@ def show_company_settings_page(username: str, company_info: dict):
                     if employee.get("role") != "admin":
                         if st.button("👑 Make Admin", key=f"make_admin_{employee['username']}"):
                             # Update user role to admin
-                            auth_data = load_auth_data()
-                            if employee["username"] in auth_data:
-                                auth_data[employee["username"]]["role"] = "admin"
-                                save_auth_data(auth_data)
+                            employee_record = store_get(AUTH_FILE, employee["username"])
+                            if employee_record is not None:
+                                employee_record["role"] = "admin"
+                                store_put(AUTH_FILE, employee["username"], employee_record)
                                 
                                 # Update in company data
                                 for emp in company_data["employees"]:
                                     if emp["username"] == employee["username"]:
                                         emp["role"] = "admin"
                                         break
-                                companies_data[company_code] = company_data
-                                save_companies_data(companies_data)
+                                store_put(COMPANIES_FILE, company_code, company_data)
+                                reindex_company_member(company_code, employee["username"])
                                 
                                 st.success(f"Made {employee.get('full_name', 'User')} an admin!")
                                 st.rerun()
@@ -5286,22 +8747,22 @@ def show_create_company_page(username: str):
                     company_code = result
                     
                     # Update company settings
-                    companies_data = load_companies_data()
-                    if company_code in companies_data:
-                        companies_data[company_code]["company_settings"] = {
+                    company_data = store_get(COMPANIES_FILE, company_code)
+                    if company_data is not None:
+                        company_data["company_settings"] = {
                             "allow_self_registration": allow_self_registration,
                             "require_approval": require_approval,
                             "default_employee_role": default_role
                         }
-                        companies_data[company_code]["departments"] = departments
-                        save_companies_data(companies_data)
+                        company_data["departments"] = departments
+                        store_put(COMPANIES_FILE, company_code, company_data)
                     
                     # Update user's company code
-                    auth_data = load_auth_data()
-                    if username in auth_data:
-                        auth_data[username]["company_code"] = company_code
-                        auth_data[username]["role"] = "admin"
-                        save_auth_data(auth_data)
+                    user_record = store_get(AUTH_FILE, username)
+                    if user_record is not None:
+                        user_record["company_code"] = company_code
+                        user_record["role"] = "admin"
+                        store_put(AUTH_FILE, username, user_record)
                     
                     st.success(f"Company '{company_name}' created successfully!")
                     st.info(f"Your company code is: **{company_code}**")
@@ -5329,9 +8790,7 @@ def show_notifications_page(username: str):
     </div>
     """, unsafe_allow_html=True)
     
-    notifications = get_user_notifications(username)
-    
-    if notifications:
+    if count_notifications(username) > 0:
         # Filter options
         col1, col2 = st.columns(2)
         
@@ -5341,20 +8800,21 @@ def show_notifications_page(username: str):
         with col2:
             filter_read = st.selectbox("Filter by Status", ["all", "unread", "read"])
         
-        # Apply filters
-        filtered_notifications = notifications
-        
-        if filter_type != "all":
-            filtered_notifications = [n for n in filtered_notifications if n.get("type") == filter_type]
-        
-        if filter_read != "all":
-            if filter_read == "unread":
-                filtered_notifications = [n for n in filtered_notifications if not n.get("read", False)]
-            else:
-                filtered_notifications = [n for n in filtered_notifications if n.get("read", False)]
+        # Apply filters in the store and page through the results
+        notification_type = None if filter_type == "all" else filter_type
+        read = None if filter_read == "all" else filter_read == "read"
+        pages_key = f"notification_pages_{filter_type}_{filter_read}"
+        filtered_notifications, next_cursor = query_notifications(username, page_size=20, notification_type=notification_type, read=read)
+        for _ in range(st.session_state.get(pages_key, 1) - 1):
+            if not next_cursor:
+                break
+            more_notifications, next_cursor = query_notifications(username, page_size=20, cursor=next_cursor,
+                                                                  notification_type=notification_type, read=read)
+            filtered_notifications += more_notifications
         
         # Display notifications
-        st.markdown(f"### 📋 Notifications ({len(filtered_notifications)})")
+        total_count = count_notifications(username, notification_type=notification_type, read=read)
+        st.markdown(f"### 📋 Notifications ({total_count})")
         
         for notification in filtered_notifications:
             notification_type = notification.get("type", "info")
@@ -5382,6 +8842,7 @@ def show_notifications_page(username: str):
             <div class="{style_class}" style="border-left: 4px solid {color};">
                 <h4>{icon} {notification.get('title', 'Notification')}</h4>
                 <p>{notification.get('message', 'No message')}</p>
+                {_digest_items_html(notification)}
                 <small>
                     <strong>From:</strong> {notification.get('from_username', 'System')} | 
                     <strong>Time:</strong> {notification.get('created_at', 'Unknown')}
@@ -5403,15 +8864,16 @@ def show_notifications_page(username: str):
             with col2:
                 if st.button("🗑️ Delete", key=f"delete_notif_{notification['id']}"):
                     # Remove notification
-                    notifications_data = load_notifications_data()
-                    if username in notifications_data:
-                        notifications_data[username] = [n for n in notifications_data[username] if n.get("id") != notification["id"]]
-                        save_notifications_data(notifications_data)
+                    if delete_notification(username, notification["id"]):
                         st.success("Notification deleted!")
                         st.rerun()
             
             st.markdown("---")
         
+        if next_cursor and st.button("⬇️ Load more", key="load_more_notifications"):
+            st.session_state[pages_key] = st.session_state.get(pages_key, 1) + 1
+            st.rerun()
+        
         # Bulk actions
         st.markdown("### 🔧 Bulk Actions")
         
@@ -5419,32 +8881,22 @@ def show_notifications_page(username: str):
         
         with col1:
             if st.button("✅ Mark All as Read", use_container_width=True):
-                notifications_data = load_notifications_data()
-                if username in notifications_data:
-                    for notification in notifications_data[username]:
-                        notification["read"] = True
-                    save_notifications_data(notifications_data)
-                    st.success("All notifications marked as read!")
-                    st.rerun()
+                mark_all_notifications_read(username)
+                st.success("All notifications marked as read!")
+                st.rerun()
         
         with col2:
             if st.button("🗑️ Delete All Read", use_container_width=True):
-                notifications_data = load_notifications_data()
-                if username in notifications_data:
-                    notifications_data[username] = [n for n in notifications_data[username] if not n.get("read", False)]
-                    save_notifications_data(notifications_data)
-                    st.success("All read notifications deleted!")
-                    st.rerun()
+                delete_read_notifications(username)
+                st.success("All read notifications deleted!")
+                st.rerun()
         
         with col3:
             if st.button("🗑️ Delete All", use_container_width=True):
                 if st.session_state.get("confirm_delete_all_notifications"):
-                    notifications_data = load_notifications_data()
-                    if username in notifications_data:
-                        notifications_data[username] = []
-                        save_notifications_data(notifications_data)
-                        st.success("All notifications deleted!")
-                        st.rerun()
+                    delete_all_notifications(username)
+                    st.success("All notifications deleted!")
+                    st.rerun()
                 else:
                     st.session_state["confirm_delete_all_notifications"] = True
                     st.warning("Click delete again to confirm!")
@@ -5537,8 +8989,7 @@ def show_settings_page(data: dict):
                 "default_priority": default_priority,
                 "show_team_tasks": show_team_tasks
             }
-            save_data(data)
-            update_user_theme(username, theme)
+            set_user_field(username, "settings", data["settings"])
             refresh_session()  # Refresh session on settings save
             st.success("Settings saved successfully!")
     
@@ -5635,7 +9086,7 @@ def show_settings_page(data: dict):
                 if new_category.strip() and new_category not in categories:
                     categories.append(new_category.strip())
                     data["categories"] = categories
-                    save_data(data)
+                    set_user_field(username, "categories", categories)
                     st.success(f"Category '{new_category}' added!")
                     st.rerun()
                 elif new_category in categories:
@@ -5651,11 +9102,11 @@ def show_settings_page(data: dict):
             # Export user data
             export_data = {
                 "user_info": user_info,
-                "tasks": data.get("tasks", []),
+                "tasks": all_user_tasks(data, "tasks"),
                 "notes": data.get("notes", []),
                 "contacts": data.get("contacts", []),
                 "goals": data.get("goals", []),
-                "assigned_tasks": data.get("assigned_tasks", []),
+                "assigned_tasks": all_user_tasks(data, "assigned_tasks"),
                 "exported_at": get_current_timestamp()
             }
             
@@ -5671,7 +9122,8 @@ def show_settings_page(data: dict):
         if st.button("🗑️ Clear All Data", use_container_width=True):
             if st.session_state.get("confirm_clear_data"):
                 # Clear all user data
-                data = {
+                cleared_assigned_tasks = data.get("assigned_tasks", [])
+                data.update({
                     "tasks": [],
                     "notes": [],
                     "contacts": [],
@@ -5685,8 +9137,12 @@ def show_settings_page(data: dict):
                         "default_priority": "medium",
                         "show_team_tasks": True
                     }
-                }
-                save_data(data)
+                })
+                with _team_stats_edit_lock(username, "assigned_tasks"):
+                    save_data(data)
+                    for task in cleared_assigned_tasks:
+                        record_assigned_task_change(username, task, None)
+                clear_task_archive(username)
                 st.success("All data cleared!")
                 st.rerun()
             else:
@@ -5703,7 +9159,7 @@ def show_settings_page(data: dict):
                     "default_priority": "medium",
                     "show_team_tasks": True
                 }
-                save_data(data)
+                set_user_field(username, "settings", data["settings"])
                 st.success("Settings reset to defaults!")
                 st.rerun()
             else:
@@ -5723,10 +9179,10 @@ def show_settings_page(data: dict):
         if st.button("🚪 Deactivate Account", use_container_width=True):
             if st.session_state.get("confirm_deactivate"):
                 # Deactivate account
-                auth_data = load_auth_data()
-                if username in auth_data:
-                    auth_data[username]["active"] = False
-                    save_auth_data(auth_data)
+                user_record = store_get(AUTH_FILE, username)
+                if user_record is not None:
+                    user_record["active"] = False
+                    store_put(AUTH_FILE, username, user_record)
                     st.success("Account deactivated!")
                     st.session_state["authenticated"] = False
                     st.session_state["username"] = ""
@@ -5756,12 +9212,12 @@ def show_settings_page(data: dict):
                         st.error("Password must be at least 6 characters long!")
                     else:
                         # Verify current password
-                        auth_data = load_auth_data()
-                        if username in auth_data:
-                            if auth_data[username]["password_hash"] == hash_password(current_password):
+                        user_record = store_get(AUTH_FILE, username)
+                        if user_record is not None:
+                            if user_record["password_hash"] == hash_password(current_password):
                                 # Update password
-                                auth_data[username]["password_hash"] = hash_password(new_password)
-                                save_auth_data(auth_data)
+                                user_record["password_hash"] = hash_password(new_password)
+                                store_put(AUTH_FILE, username, user_record)
                                 st.success("Password changed successfully!")
                                 st.session_state["show_change_password"] = False
                                 st.rerun()
@@ -5796,8 +9252,18 @@ def show_company_chat_page(username: str, company_info: dict):
     # Chat interface
     st.markdown("### 💬 Team Chat")
     
-    # Display chat messages
-    messages = get_company_chat_messages(company_code, limit=100)
+    # Display chat messages, walking back one page per "load older" click
+    pages_key = f"chat_pages_{company_code}"
+    messages, older_cursor = get_company_chat_page(company_code, limit=100)
+    for _ in range(st.session_state.get(pages_key, 1) - 1):
+        if not older_cursor:
+            break
+        older_messages, older_cursor = get_company_chat_page(company_code, limit=100, cursor=older_cursor)
+        messages = older_messages + messages
+    
+    if older_cursor and st.button("⬆️ Load older messages", key=f"load_older_{company_code}"):
+        st.session_state[pages_key] = st.session_state.get(pages_key, 1) + 1
+        st.rerun()
     
     # Chat container with scrollable area
     chat_container = st.container()
@@ -6102,8 +9568,19 @@ def show_private_chat_page(username: str, company_info: dict):
             selected_user_info = get_user_info(selected_user)
             st.markdown(f"### 💬 Chat with {selected_user_info.get('full_name', selected_user)}")
             
-            # Display chat messages
-            messages = get_private_messages(username, selected_user, limit=100)
+            # Display chat messages, walking back one page per "load older" click
+            pages_key = f"private_chat_pages_{get_chat_pair_key(username, selected_user)}"
+            messages, older_cursor = get_private_message_page(username, selected_user, limit=100)
+            for _ in range(st.session_state.get(pages_key, 1) - 1):
+                if not older_cursor:
+                    break
+                older_messages, older_cursor = get_private_message_page(username, selected_user, limit=100,
+                                                                        cursor=older_cursor)
+                messages = older_messages + messages
+            
+            if older_cursor and st.button("⬆️ Load older messages", key=f"load_older_private_{selected_user}"):
+                st.session_state[pages_key] = st.session_state.get(pages_key, 1) + 1
+                st.rerun()
             
             chat_container = st.container()
             with chat_container:
@@ -6212,10 +9689,10 @@ def show_file_sharing_page(username: str, company_info: dict):
                     
                     if st.form_submit_button("📤 Share Privately", use_container_width=True):
                         if uploaded_file is not None and selected_recipient:
-                            file_content = uploaded_file.read()
                             recipient_username = selected_recipient.split("(")[1].split(")")[0]
                             
-                            if upload_private_file(username, recipient_username, uploaded_file.name, file_content, uploaded_file.type):
+                            # Pass the upload through as a stream so it is copied to disk in chunks
+                            if upload_private_file(username, recipient_username, uploaded_file.name, uploaded_file, uploaded_file.type):
                                 st.success(f"File '{uploaded_file.name}' shared privately with {selected_recipient.split('(')[0].strip()}!")
                                 st.rerun()
                             else:
@@ -6235,10 +9712,14 @@ def show_file_sharing_page(username: str, company_info: dict):
             search_query = st.text_input("🔍 Search files", placeholder="Search by filename...", key="company_search")
             
             if search_query:
-                files = [f for f in files if search_query.lower() in f.get("name", "").lower()]
-            
-            # Sort by upload date (newest first)
-            files = sorted(files, key=lambda x: x.get("uploaded_at", ""), reverse=True)
+                # Best matches first, tolerating typos in file names
+                files_by_id = {f.get("id"): f for f in files}
+                files = [files_by_id[result["file"].get("id")]
+                         for result in search_names(company_code, username, search_query, ["file"])
+                         if result["file"].get("id") in files_by_id]
+            else:
+                # Sort by upload date (newest first)
+                files = sorted(files, key=lambda x: x.get("uploaded_at", ""), reverse=True)
             
             for file_info in files:
                 with st.container():
@@ -6257,15 +9738,17 @@ def show_file_sharing_page(username: str, company_info: dict):
                     
                     with col3:
                         if st.button("📥 Download", key=f"download_{file_info['id']}"):
-                            file_content = download_file(company_code, file_info["id"])
-                            if file_content:
-                                st.download_button(
-                                    label="📥 Download File",
-                                    data=file_content,
-                                    file_name=file_info.get("name", "file"),
-                                    mime=file_info.get("type", "application/octet-stream"),
-                                    use_container_width=True
-                                )
+                            file_stream = download_file(company_code, file_info["id"])
+                            if file_stream is not None:
+                                # download_button keeps the bytes, so the blob can be closed right away
+                                with file_stream:
+                                    st.download_button(
+                                        label="📥 Download File",
+                                        data=file_stream.read(),
+                                        file_name=file_info.get("name", "file"),
+                                        mime=file_info.get("type", "application/octet-stream"),
+                                        use_container_width=True
+                                    )
                             else:
                                 st.error("Failed to download file!")
                     
@@ -6290,10 +9773,14 @@ def show_file_sharing_page(username: str, company_info: dict):
             search_query = st.text_input("🔍 Search private files", placeholder="Search by filename...", key="private_search")
             
             if search_query:
-                private_files = [f for f in private_files if search_query.lower() in f.get("name", "").lower()]
-            
-            # Sort by upload date (newest first)
-            private_files = sorted(private_files, key=lambda x: x.get("uploaded_at", ""), reverse=True)
+                # Best matches first, tolerating typos in file names
+                private_files_by_id = {f.get("id"): f for f in private_files}
+                private_files = [private_files_by_id[result["file"].get("id")]
+                                 for result in search_names(company_code, username, search_query, ["private_file"])
+                                 if result["file"].get("id") in private_files_by_id]
+            else:
+                # Sort by upload date (newest first)
+                private_files = sorted(private_files, key=lambda x: x.get("uploaded_at", ""), reverse=True)
             
             for file_info in private_files:
                 with st.container():
@@ -6319,15 +9806,17 @@ def show_file_sharing_page(username: str, company_info: dict):
                     
                     with col3:
                         if st.button("📥 Download", key=f"download_private_{file_info['id']}"):
-                            file_content = download_private_file(username, other_user, file_info["id"])
-                            if file_content:
-                                st.download_button(
-                                    label="📥 Download File",
-                                    data=file_content,
-                                    file_name=file_info.get("name", "file"),
-                                    mime=file_info.get("type", "application/octet-stream"),
-                                    use_container_width=True
-                                )
+                            file_stream = download_private_file(username, other_user, file_info["id"])
+                            if file_stream is not None:
+                                # download_button keeps the bytes, so the mapping can be closed right away
+                                with file_stream:
+                                    st.download_button(
+                                        label="📥 Download File",
+                                        data=file_stream.read(),
+                                        file_name=file_info.get("name", "file"),
+                                        mime=file_info.get("type", "application/octet-stream"),
+                                        use_container_width=True
+                                    )
                             else:
                                 st.error("Failed to download file!")
                     
@@ -6626,42 +10115,35 @@ def show_search_page(username: str, company_info: dict):
     
     # Search interface
     search_query = st.text_input("🔍 Enter your search query", placeholder="Search for messages, tasks, files...")
-    search_type = st.selectbox("Search in", ["all", "messages", "tasks", "files"])
+    search_type = st.selectbox("Search in", ["all", "messages", "tasks", "files", "knowledge base"])
     
     if st.button("🔍 Search", use_container_width=True):
+        st.session_state["search_submitted"] = search_query.strip()
+        st.session_state["search_pages"] = 1
+    
+    # Results stay up (and can be paged) until the query changes
+    if st.session_state.get("search_submitted") is not None and st.session_state["search_submitted"] == search_query.strip():
         if search_query.strip():
             st.markdown("### 📋 Search Results")
             
-            results = []
-            
-            # Search messages
-            if search_type in ["all", "messages"] and company_info:
-                company_code = company_info.get("code")
-                if company_code:
-                    message_results = search_messages(company_code, search_query.strip())
-                    results.extend(message_results)
-            
-            # Search tasks
-            if search_type in ["all", "tasks"]:
-                task_results = search_tasks(username, search_query.strip())
-                results.extend(task_results)
-            
-            # Search files (if implemented)
-            if search_type in ["all", "files"] and company_info:
-                company_code = company_info.get("code")
-                if company_code:
-                    files = get_company_files(company_code)
-                    for file_info in files:
-                        if search_query.lower() in file_info.get("name", "").lower():
-                            results.append({
-                                "type": "file",
-                                "file": file_info,
-                                "context": "Shared Files"
-                            })
+            search_kinds = {
+                "messages": ["company_chat", "private_chat"],
+                "tasks": ["personal_task", "assigned_task"],
+                "knowledge base": ["knowledge_article"]
+            }.get(search_type)
+            page_limit = SEARCH_PAGE_SIZE * st.session_state.get("search_pages", 1)
+            if search_type == "files":
+                # File names are matched as substrings, tolerating typos
+                search_key = _search_key(get_user_info(username).get("company_code"), username)
+                results = search_names(search_key, username, search_query.strip(), ["file", "private_file"])
+                total_results = len(results)
+                results = results[:page_limit]
+            else:
+                results, total_results = search_index(username, search_query.strip(), search_kinds, limit=page_limit)
             
             # Display results
             if results:
-                st.markdown(f"Found **{len(results)}** results:")
+                st.markdown(f"Found **{total_results}** results:")
                 
                 for result in results:
                     result_type = result.get("type", "unknown")
@@ -6712,7 +10194,46 @@ def show_search_page(username: str, company_info: dict):
                         </div>
                         """, unsafe_allow_html=True)
                     
+                    elif result_type == "private_file":
+                        file_info = result.get("file", {})
+                        st.markdown(f"""
+                        <div class="floating-card">
+                            <h4>🔒 Private File</h4>
+                            <p><strong>Name:</strong> {file_info.get('name', 'Unknown')}</p>
+                            <p><strong>Shared by:</strong> {get_user_info(file_info.get('uploaded_by', '')).get('full_name', file_info.get('uploaded_by', 'Unknown'))}</p>
+                            <p><strong>Shared with:</strong> {get_user_info(file_info.get('uploaded_to', '')).get('full_name', file_info.get('uploaded_to', 'Unknown'))}</p>
+                            <p><strong>Uploaded:</strong> {file_info.get('uploaded_at', 'Unknown')}</p>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    
+                    elif result_type == "member":
+                        member = result.get("member", {})
+                        st.markdown(f"""
+                        <div class="floating-card">
+                            <h4>👤 Team Member</h4>
+                            <p><strong>Name:</strong> {member.get('full_name', 'Unknown')}</p>
+                            <p><strong>Role:</strong> {member.get('role', 'employee').title()}</p>
+                            <p><strong>Email:</strong> {member.get('email', 'Not provided')}</p>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    
+                    elif result_type == "knowledge_article":
+                        article = result.get("article", {})
+                        st.markdown(f"""
+                        <div class="floating-card">
+                            <h4>📚 Knowledge Base</h4>
+                            <p><strong>Title:</strong> {article.get('title', 'Untitled')}</p>
+                            <p><strong>Category:</strong> {article.get('category', 'General')}</p>
+                            <p><strong>Author:</strong> {get_user_info(article.get('author', '')).get('full_name', article.get('author', 'Unknown'))}</p>
+                            <p><strong>Created:</strong> {article.get('created_at', 'Unknown')}</p>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    
                     st.markdown("---")
+                
+                if len(results) < total_results and st.button("⬇️ Load more", key="load_more_search_results"):
+                    st.session_state["search_pages"] = st.session_state.get("search_pages", 1) + 1
+                    st.rerun()
             else:
                 st.info("No results found. Try a different search term.")
         else: